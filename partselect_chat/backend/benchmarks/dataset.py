@@ -0,0 +1,107 @@
+from typing import Dict, Iterator, List
+from dataclasses import dataclass, field
+import random
+
+
+PART_PREFIX = 'BM'
+
+COMPONENTS = {
+    'REFRIGERATOR': [
+        ('Water Filter', 'removes chlorine and sediment from ice and water'),
+        ('Ice Maker Assembly', 'complete ice maker with motor, ejector blade and harness'),
+        ('Evaporator Fan Motor', 'circulates cold air through the fresh food compartment'),
+        ('Door Shelf Bin', 'clear bin for gallons and tall containers'),
+        ('Defrost Thermostat', 'switches the defrost heater off once the coil is clear'),
+        ('Temperature Control Board', 'regulates compressor and fan cycles'),
+    ],
+    'DISHWASHER': [
+        ('Upper Spray Arm', 'rotating arm that washes the top rack'),
+        ('Drain Pump', 'pumps wash water out at the end of each cycle'),
+        ('Door Latch Assembly', 'latch with the door safety switch'),
+        ('Dishrack Wheel', 'replacement roller for the lower rack'),
+        ('Inlet Valve', 'lets water in when the control calls for a fill'),
+        ('Door Gasket', 'rubber seal that stops leaks around the door'),
+    ],
+}
+BRANDS = {
+    'Whirlpool': ['WRF', 'WDT', 'WDF', 'WRX'],
+    'Maytag': ['MFI', 'MDB', 'MSS'],
+    'KitchenAid': ['KRF', 'KDT', 'KDF'],
+    'Frigidaire': ['FFS', 'FDB', 'FGH'],
+}
+QUESTIONS = [
+    "How can I install part number {part}?",
+    "Is part {part} compatible with my {model} model?",
+    "My {appliance} {name} is broken, which part do I need?",
+    "The {name} on my {brand} {appliance} stopped working. How do I fix it?",
+    "What parts fit model {model}?",
+    "How much does the {name} cost and is it in stock?",
+]
+
+
+@dataclass
+class Catalog:
+  """Feed rows of the seeded catalog plus the identifiers scenarios draw from"""
+  rows: List[Dict]
+  part_numbers: List[str] = field(default_factory=list)
+  model_numbers: List[str] = field(default_factory=list)
+
+
+def _guide(name: str, appliance: str) -> str:
+  # Headings in the "Safety Precautions:" form load_data writes, which split_guide expects
+  return (
+      f"Installation Guide for {name}\n\n"
+      f"Safety Precautions:\nUnplug the {appliance} and shut off the water supply before you start.\n\n"
+      f"Tools Required:\nPhillips screwdriver, 1/4 inch nut driver, towel.\n\n"
+      f"Installation Steps:\n1. Open the {appliance} and locate the old {name.lower()}.\n"
+      f"2. Remove the mounting screws and disconnect the wire harness.\n"
+      f"3. Fit the new {name.lower()} and reconnect the harness.\n"
+      f"4. Refit the screws and close the {appliance}.\n\n"
+      f"Testing:\nRestore power and run a cycle to confirm the {name.lower()} works."
+  )
+
+
+def build_catalog(products: int = 2000, models_per_product: int = 5, seed: int = 1234) -> Catalog:
+  """Deterministic supplier-feed rows: the same arguments give the same catalog"""
+  rng = random.Random(seed)
+  brands = list(BRANDS)
+  model_pool = sorted({
+      f"{rng.choice(BRANDS[brand])}{rng.randint(100, 999)}{rng.choice('ABCDEFGHJKLMNPRS')}"
+      f"{rng.choice('ABCDEFGHJKLMNPRS')}{rng.choice(['HZ', 'KZ', 'MZ', 'SS', '00'])}"
+      for brand in brands for _ in range(max(products // 4, 10))
+  })
+  catalog = Catalog(rows=[])
+  for index in range(products):
+    appliance = rng.choice(list(COMPONENTS))
+    name, summary = rng.choice(COMPONENTS[appliance])
+    brand = rng.choice(brands)
+    part_number = f'{PART_PREFIX}{index:07d}'
+    models = rng.sample(model_pool, models_per_product)
+    catalog.rows.append({
+        'part_number': part_number,
+        'name': f'{brand} {name}',
+        'description': f'Genuine {brand} {name.lower()}: {summary}.',
+        'appliance_type': appliance,
+        'price': f'{rng.uniform(8, 350):.2f}',
+        'stock_quantity': rng.randint(0, 200),
+        'installation_guide': _guide(name, appliance.lower()),
+        'brand': brand,
+        'compatible_models': models,
+    })
+    catalog.part_numbers.append(part_number)
+  catalog.model_numbers = sorted({m for row in catalog.rows for m in row['compatible_models']})
+  return catalog
+
+
+def questions(catalog: Catalog, seed: int = 1234) -> Iterator[str]:
+  """Endless, reproducible stream of customer questions about the catalog"""
+  rng = random.Random(seed)
+  while True:
+    row = rng.choice(catalog.rows)
+    yield rng.choice(QUESTIONS).format(
+        part=row['part_number'],
+        model=rng.choice(row['compatible_models']),
+        appliance=row['appliance_type'].lower(),
+        name=row['name'].split(' ', 1)[1].lower(),
+        brand=row['brand'],
+    )
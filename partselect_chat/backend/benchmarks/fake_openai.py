@@ -0,0 +1,210 @@
+from typing import Dict, List, Optional, Union
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import base64
+import hashlib
+import json
+import math
+import re
+import struct
+import threading
+import time
+import uuid
+
+
+EMBEDDING_DIMENSIONS = 1536
+
+CANNED_ANSWERS = [
+    "Based on the parts I found, the best match is listed above. Check the model number on the "
+    "label inside the door before ordering, and follow the installation guide for the steps.",
+    "That part is compatible with the models listed. It usually takes about 30 minutes to install "
+    "with a screwdriver and a pair of pliers. Unplug the appliance before you start.",
+    "I could not confirm compatibility from the information given. Could you share the model "
+    "number of your appliance? It is printed on a label near the door frame.",
+]
+
+WORD = re.compile(r'\w+')
+# A word with the punctuation and space after it, so the pieces join back up
+TOKEN = re.compile(r'\W*\w+\W*|\W+')
+
+
+def fake_embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> List[float]:
+  """Deterministic unit vector from hashed words: texts sharing words land close together"""
+  vector = [0.0] * dimensions
+  for word in WORD.findall(text.lower()):
+    digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+    bucket = int.from_bytes(digest[:4], 'little') % dimensions
+    vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+  norm = math.sqrt(sum(v * v for v in vector))
+  if not norm:
+    vector[0] = norm = 1.0
+  return [v / norm for v in vector]
+
+
+def canned_answer(prompt: str) -> str:
+  """Same prompt, same answer"""
+  digest = hashlib.blake2b(prompt.encode(), digest_size=4).digest()
+  return CANNED_ANSWERS[int.from_bytes(digest, 'little') % len(CANNED_ANSWERS)]
+
+
+class HashEmbeddings:
+  """In-process embeddings matching the fake server, for seeding without HTTP"""
+
+  def __init__(self, model: str):
+    self.model = model
+
+  async def aembed_query(self, text: str) -> List[float]:
+    return fake_embedding(text)
+
+  async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+    return [fake_embedding(text) for text in texts]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+  """The two OpenAI endpoints the app calls: embeddings and chat completions"""
+
+  protocol_version = 'HTTP/1.1'
+
+  def log_message(self, format, *args):
+    if self.server.verbose:
+      super().log_message(format, *args)
+
+  def do_POST(self):
+    length = int(self.headers.get('Content-Length') or 0)
+    try:
+      body = json.loads(self.rfile.read(length) or b'{}')
+    except json.JSONDecodeError:
+      return self._json(400, {'error': {'message': 'Invalid JSON body'}})
+
+    if self.path.endswith('/embeddings'):
+      return self._embeddings(body)
+    if self.path.endswith('/chat/completions'):
+      return self._chat(body)
+    self._json(404, {'error': {'message': f'Unknown endpoint {self.path}'}})
+
+  def _json(self, status: int, payload: Dict):
+    data = json.dumps(payload).encode()
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def _texts(self, body: Dict) -> List[str]:
+    inputs: Union[str, List[str]] = body.get('input') or []
+    return [inputs] if isinstance(inputs, str) else inputs
+
+  def _embeddings(self, body: Dict):
+    texts = self._texts(body)
+    time.sleep(self.server.embedding_latency)
+    data = []
+    for index, text in enumerate(texts):
+      vector = fake_embedding(text)
+      if body.get('encoding_format') == 'base64':
+        vector = base64.b64encode(struct.pack(f'<{len(vector)}f', *vector)).decode()
+      data.append({'object': 'embedding', 'index': index, 'embedding': vector})
+    tokens = sum(len(WORD.findall(text)) for text in texts)
+    self._json(200, {
+        'object': 'list',
+        'data': data,
+        'model': body.get('model'),
+        'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+    })
+
+  def _chat(self, body: Dict):
+    messages = body.get('messages') or []
+    prompt = '\n'.join(str(m.get('content') or '') for m in messages)
+    answer = canned_answer(messages[-1].get('content') or '' if messages else '')
+    # One streamed token per word; counts are word counts, close enough to
+    # real tokens for timing and without loading a tokenizer
+    tokens = TOKEN.findall(answer)
+    prompt_tokens = len(WORD.findall(prompt))
+    usage = {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': len(tokens),
+        'total_tokens': prompt_tokens + len(tokens),
+    }
+    completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+    time.sleep(self.server.latency)
+
+    if not body.get('stream'):
+      time.sleep(self.server.token_latency * len(tokens))
+      return self._json(200, {
+          'id': completion_id,
+          'object': 'chat.completion',
+          'created': int(time.time()),
+          'model': body.get('model'),
+          'choices': [{
+              'index': 0,
+              'message': {'role': 'assistant', 'content': answer},
+              'finish_reason': 'stop',
+          }],
+          'usage': usage,
+      })
+
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/event-stream')
+    self.send_header('Transfer-Encoding', 'chunked')
+    self.end_headers()
+
+    def chunk(delta: Dict, finish_reason: Optional[str] = None, usage: Optional[Dict] = None) -> Dict:
+      return {
+          'id': completion_id,
+          'object': 'chat.completion.chunk',
+          'created': int(time.time()),
+          'model': body.get('model'),
+          'choices': [] if usage else [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+          'usage': usage,
+      }
+
+    self._event(chunk({'role': 'assistant', 'content': ''}))
+    for token in tokens:
+      time.sleep(self.server.token_latency)
+      self._event(chunk({'content': token}))
+    self._event(chunk({}, finish_reason='stop'))
+    if (body.get('stream_options') or {}).get('include_usage'):
+      self._event(chunk({}, usage=usage))
+    self._write_chunk(b'data: [DONE]\n\n')
+    self._write_chunk(b'')
+
+  def _event(self, payload: Dict):
+    self._write_chunk(f'data: {json.dumps(payload)}\n\n'.encode())
+
+  def _write_chunk(self, data: bytes):
+    self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+    self.wfile.flush()
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+  """Local OpenAI-compatible server with deterministic output and configurable latency.
+
+  ``latency`` is the wait before a completion's first token, ``token_latency``
+  the wait per completion token and ``embedding_latency`` the time per
+  embeddings request. Point the app at it with OPENAI_BASE_URL.
+  """
+
+  daemon_threads = True
+
+  def __init__(
+      self,
+      address=('127.0.0.1', 8100),
+      latency: float = 0.3,
+      token_latency: float = 0.01,
+      embedding_latency: float = 0.05,
+      verbose: bool = False
+  ):
+    super().__init__(address, FakeOpenAIHandler)
+    self.latency = latency
+    self.token_latency = token_latency
+    self.embedding_latency = embedding_latency
+    self.verbose = verbose
+
+  @property
+  def base_url(self) -> str:
+    host, port = self.server_address[:2]
+    return f'http://{host}:{port}/v1'
+
+  def start(self) -> threading.Thread:
+    """Serve from a daemon thread, for tests and in-process runs"""
+    thread = threading.Thread(target=self.serve_forever, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,83 @@
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from benchmarks.dataset import build_catalog
+from benchmarks.runner import SCENARIOS, compare, load_baseline, run_scenario, save_baseline
+import asyncio
+
+DEFAULT_BASELINE = Path(__file__).resolve().parents[2] / 'baseline.json'
+
+
+class Command(BaseCommand):
+  help = (
+      'Load-test a running server with scripted chat, search and compatibility '
+      'requests against the seed_benchmark catalog. Reports throughput and '
+      'p50/p95/p99 latency and fails on regressions against the stored baseline.'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server under test')
+    parser.add_argument(
+        '--scenario',
+        action='append',
+        choices=list(SCENARIOS),
+        help='Scenario to run; repeat for several (default: all)',
+    )
+    parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=10, help='Requests in flight')
+    parser.add_argument('--warmup', type=int, default=10, help='Untimed requests before measuring')
+    parser.add_argument('--products', type=int, default=2000, help='Catalog size given to seed_benchmark')
+    parser.add_argument('--models-per-product', type=int, default=5, help='As given to seed_benchmark')
+    parser.add_argument('--seed', type=int, default=1234, help='As given to seed_benchmark')
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE, help='Baseline results file')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed slowdown, 0.1 = 10%%')
+    parser.add_argument(
+        '--save-baseline',
+        action='store_true',
+        help='Store these results as the new baseline instead of comparing',
+    )
+
+  def handle(self, *args, **options):
+    catalog = build_catalog(options['products'], options['models_per_product'], options['seed'])
+    run_settings = {
+        key: options[key]
+        for key in ('requests', 'concurrency', 'products', 'models_per_product', 'seed')
+    }
+
+    results = {}
+    for name in options['scenario'] or list(SCENARIOS):
+      self.stdout.write(f"Running {name}...")
+      results[name] = asyncio.run(run_scenario(
+          SCENARIOS[name],
+          catalog,
+          options['url'],
+          requests=options['requests'],
+          concurrency=options['concurrency'],
+          warmup=options['warmup'],
+          seed=options['seed'],
+      ))
+
+    self.stdout.write(f"\n{'scenario':<16}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in results.items():
+      self.stdout.write(
+          f"{name:<16}{r['requests']:>10}{r['errors']:>8}{r['throughput']:>10.1f}"
+          f"{r['p50']:>10.1f}{r['p95']:>10.1f}{r['p99']:>10.1f}"
+      )
+
+    if options['save_baseline']:
+      save_baseline(options['baseline'], results, run_settings)
+      self.stdout.write(self.style.SUCCESS(f"\nBaseline saved to {options['baseline']}"))
+      return
+
+    baseline = load_baseline(options['baseline'])
+    if not baseline:
+      self.stdout.write(self.style.WARNING("\nNo baseline yet; rerun with --save-baseline to store one"))
+      return
+    if baseline.get('settings') != run_settings:
+      self.stdout.write(self.style.WARNING(
+          f"\nBaseline was recorded with {baseline.get('settings')}; results may not be comparable"
+      ))
+
+    regressions = compare(results, baseline, options['tolerance'])
+    if regressions:
+      raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+    self.stdout.write(self.style.SUCCESS("\nNo regressions against the baseline"))
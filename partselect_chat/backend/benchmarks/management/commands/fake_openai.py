@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from benchmarks.fake_openai import FakeOpenAIServer
+
+
+class Command(BaseCommand):
+  help = (
+      'Serve a local OpenAI-compatible API with deterministic embeddings and canned '
+      'completions. Start the app with OPENAI_BASE_URL pointing at it.'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency', type=float, default=0.3, help='Seconds before the first completion token')
+    parser.add_argument('--token-latency', type=float, default=0.01, help='Seconds per completion token')
+    parser.add_argument('--embedding-latency', type=float, default=0.05, help='Seconds per embeddings request')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+  def handle(self, *args, **options):
+    server = FakeOpenAIServer(
+        (options['host'], options['port']),
+        latency=options['latency'],
+        token_latency=options['token_latency'],
+        embedding_latency=options['embedding_latency'],
+        verbose=options['verbose'],
+    )
+    self.stdout.write(self.style.SUCCESS(f"Fake OpenAI API at {server.base_url}"))
+    self.stdout.write(f"Run the app with OPENAI_BASE_URL={server.base_url}")
+    try:
+      server.serve_forever()
+    except KeyboardInterrupt:
+      pass
+    finally:
+      server.server_close()
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from benchmarks.dataset import PART_PREFIX, build_catalog
+from benchmarks.fake_openai import HashEmbeddings
+from products.models import Product
+from products.services.catalog_import import CatalogImporter
+from products.services.embedding_pipeline import EmbeddingPipeline, SOURCES
+import asyncio
+
+
+class Command(BaseCommand):
+  help = (
+      'Load the deterministic benchmark catalog and embed it with the fake OpenAI '
+      'embeddings, replacing any earlier benchmark products.'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--products', type=int, default=2000, help='Number of products')
+    parser.add_argument('--models-per-product', type=int, default=5, help='Compatible models per product')
+    parser.add_argument('--seed', type=int, default=1234, help='Random seed of the catalog')
+
+  def handle(self, *args, **options):
+    catalog = build_catalog(options['products'], options['models_per_product'], options['seed'])
+
+    deleted, _ = Product.objects.filter(part_number__startswith=PART_PREFIX).delete()
+    if deleted:
+      self.stdout.write(f"Removed {deleted} rows of an earlier benchmark catalog")
+
+    stats = CatalogImporter(log=self.stdout.write).run(catalog.rows)
+    self.stdout.write(f"Imported {stats['rows']} products in {stats['seconds']:.1f}s")
+
+    # Same vectors the fake server returns for queries, without the HTTP round trips
+    pipeline = EmbeddingPipeline(HashEmbeddings(settings.OPENAI_EMBEDDING_MODEL), log=self.stdout.write)
+
+    async def embed_all():
+      for source in SOURCES:
+        await pipeline.run(source, resume=False)
+
+    asyncio.run(embed_all())
+    self.stdout.write(self.style.SUCCESS(
+        f"Benchmark catalog ready: {len(catalog.part_numbers)} parts, "
+        f"{len(catalog.model_numbers)} models (seed {options['seed']})"
+    ))
@@ -0,0 +1,147 @@
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass
+from pathlib import Path
+import asyncio
+import json
+import random
+import time
+import httpx
+from .dataset import Catalog, questions
+
+
+@dataclass
+class Scenario:
+  """One endpoint under load; ``requests`` yields (method, path, JSON body)"""
+  name: str
+  requests: Callable[[Catalog, int], Iterator[Tuple[str, str, Optional[Dict]]]]
+
+
+def _chat(catalog: Catalog, seed: int):
+  for question in questions(catalog, seed):
+    yield 'POST', '/api/chat/', {'message': question}
+
+
+def _search(catalog: Catalog, seed: int):
+  for question in questions(catalog, seed):
+    yield 'POST', '/api/products/search/', {'query': question, 'limit': 5}
+
+
+def _compatibility(catalog: Catalog, seed: int):
+  rng = random.Random(seed)
+  while True:
+    row = rng.choice(catalog.rows)
+    # Half the checks are for models the part does not fit
+    model = rng.choice(row['compatible_models'] if rng.random() < 0.5 else catalog.model_numbers)
+    yield 'POST', '/api/products/compatibility/', {
+        'part_number': row['part_number'], 'model_number': model
+    }
+
+
+SCENARIOS = {
+    'chat': Scenario('chat', _chat),
+    'search': Scenario('search', _search),
+    'compatibility': Scenario('compatibility', _compatibility),
+}
+
+
+def percentile(values: List[float], q: float) -> float:
+  """Linear-interpolated percentile (q in 0..100) of unsorted values"""
+  if not values:
+    return 0.0
+  ordered = sorted(values)
+  rank = (len(ordered) - 1) * q / 100.0
+  low = int(rank)
+  high = min(low + 1, len(ordered) - 1)
+  return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict:
+  """Throughput and latency percentiles (ms) of one scenario run"""
+  return {
+      'requests': len(latencies) + errors,
+      'errors': errors,
+      'throughput': len(latencies) / elapsed if elapsed else 0.0,
+      'p50': percentile(latencies, 50) * 1000.0,
+      'p95': percentile(latencies, 95) * 1000.0,
+      'p99': percentile(latencies, 99) * 1000.0,
+  }
+
+
+async def run_scenario(
+    scenario: Scenario,
+    catalog: Catalog,
+    base_url: str,
+    requests: int = 200,
+    concurrency: int = 10,
+    warmup: int = 10,
+    seed: int = 1234,
+    timeout: float = 60.0
+) -> Dict:
+  """Send ``requests`` requests, ``concurrency`` at a time, after ``warmup`` untimed ones"""
+  plan = scenario.requests(catalog, seed)
+  latencies: List[float] = []
+  errors = 0
+  limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+  async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+    async def send(timed: bool):
+      nonlocal errors
+      method, path, body = next(plan)
+      started = time.perf_counter()
+      try:
+        response = await client.request(method, path, json=body)
+        ok = response.status_code < 400
+      except httpx.HTTPError:
+        ok = False
+      if not timed:
+        return
+      if ok:
+        latencies.append(time.perf_counter() - started)
+      else:
+        errors += 1
+
+    for _ in range(warmup):
+      await send(timed=False)
+
+    remaining = requests
+
+    async def worker():
+      nonlocal remaining
+      while remaining > 0:
+        remaining -= 1
+        await send(timed=True)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+  return summarize(latencies, errors, elapsed)
+
+
+def load_baseline(path: Path) -> Dict:
+  if not path.exists():
+    return {}
+  return json.loads(path.read_text())
+
+
+def save_baseline(path: Path, results: Dict, settings: Dict):
+  path.write_text(json.dumps({'settings': settings, 'scenarios': results}, indent=2, sort_keys=True) + '\n')
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float = 0.1) -> List[str]:
+  """Regressions against a stored baseline: slower p95/p99, lower throughput or new errors"""
+  regressions = []
+  for name, result in results.items():
+    before = baseline.get('scenarios', {}).get(name)
+    if not before:
+      continue
+    for metric in ('p95', 'p99'):
+      if result[metric] > before[metric] * (1 + tolerance):
+        regressions.append(f"{name}: {metric} {result[metric]:.1f}ms vs {before[metric]:.1f}ms baseline")
+    if result['throughput'] < before['throughput'] * (1 - tolerance):
+      regressions.append(
+          f"{name}: throughput {result['throughput']:.1f}/s vs {before['throughput']:.1f}/s baseline"
+      )
+    if result['errors'] > before['errors']:
+      regressions.append(f"{name}: {result['errors']} errors vs {before['errors']} baseline")
+  return regressions
@@ -0,0 +1,72 @@
+from django.test import SimpleTestCase
+from openai import OpenAI
+from products.chunking import split_guide
+from .dataset import build_catalog
+from .fake_openai import FakeOpenAIServer, fake_embedding
+from .runner import compare, percentile, summarize
+
+
+class FakeOpenAITests(SimpleTestCase):
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    cls.server = FakeOpenAIServer(('127.0.0.1', 0), latency=0.0, token_latency=0.0, embedding_latency=0.0)
+    cls.server.start()
+    cls.openai = OpenAI(base_url=cls.server.base_url, api_key='unused')
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.shutdown()
+    cls.server.server_close()
+    super().tearDownClass()
+
+  def test_embeddings_are_deterministic(self):
+    response = self.openai.embeddings.create(model='text-embedding-ada-002', input=['drain pump', 'drain pump'])
+    first, second = (item.embedding for item in response.data)
+    self.assertEqual(len(first), 1536)
+    self.assertEqual(first, second)
+    self.assertAlmostEqual(first[0], fake_embedding('drain pump')[0], places=6)
+
+  def test_shared_words_are_closer(self):
+    query = fake_embedding('dishwasher drain pump')
+    near = fake_embedding('drain pump assembly')
+    far = fake_embedding('refrigerator water filter')
+    dot = lambda a, b: sum(x * y for x, y in zip(a, b))
+    self.assertGreater(dot(query, near), dot(query, far))
+
+  def test_streamed_completion_matches_plain_one(self):
+    messages = [{'role': 'user', 'content': 'Is part BM0000001 in stock?'}]
+    plain = self.openai.chat.completions.create(model='gpt-4o-mini', messages=messages)
+    chunks = list(self.openai.chat.completions.create(
+        model='gpt-4o-mini', messages=messages, stream=True, stream_options={'include_usage': True}
+    ))
+    streamed = ''.join(c.choices[0].delta.content or '' for c in chunks if c.choices)
+    self.assertEqual(streamed, plain.choices[0].message.content)
+    self.assertEqual(chunks[-1].usage.completion_tokens, plain.usage.completion_tokens)
+
+
+class RunnerTests(SimpleTestCase):
+  def test_guides_split_into_sections(self):
+    guide = build_catalog(1).rows[0]['installation_guide']
+    self.assertEqual(
+        [section for section, _ in split_guide(guide)],
+        ['overview', 'safety', 'tools', 'steps', 'testing']
+    )
+
+  def test_catalog_is_reproducible(self):
+    self.assertEqual(build_catalog(50, seed=7).rows, build_catalog(50, seed=7).rows)
+    self.assertNotEqual(build_catalog(50, seed=7).rows, build_catalog(50, seed=8).rows)
+
+  def test_percentiles(self):
+    values = [float(v) for v in range(1, 101)]
+    self.assertAlmostEqual(percentile(values, 50), 50.5)
+    self.assertAlmostEqual(percentile(values, 99), 99.01)
+    self.assertEqual(percentile([], 95), 0.0)
+
+  def test_compare_flags_regressions_beyond_tolerance(self):
+    baseline = {'scenarios': {'search': summarize([0.1] * 10, 0, 1.0)}}
+    same = {'search': summarize([0.105] * 10, 0, 1.0)}
+    slower = {'search': summarize([0.2] * 10, 1, 2.0)}
+    self.assertEqual(compare(same, baseline, tolerance=0.1), [])
+    regressions = compare(slower, baseline, tolerance=0.1)
+    self.assertEqual(len(regressions), 4)
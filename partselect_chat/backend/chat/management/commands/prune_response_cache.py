@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from chat.services.response_cache import prune_expired
+
+
+class Command(BaseCommand):
+  help = 'Delete expired cached chat answers; run it periodically, e.g. from cron'
+
+  def handle(self, *args, **options):
+    deleted = prune_expired()
+    self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired cached answers"))
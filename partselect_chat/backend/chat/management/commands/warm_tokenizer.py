@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from chat.services.context_builder import load_encoding
+
+
+class Command(BaseCommand):
+  help = (
+      'Download the chat model tokenizer into TIKTOKEN_CACHE_DIR, so workers load it '
+      'from disk instead of the network'
+  )
+
+  def handle(self, *args, **options):
+    encoding = load_encoding()
+    if encoding is None:
+      raise CommandError('Could not load the tokenizer; see the warning above')
+    self.stdout.write(self.style.SUCCESS(
+        f"Tokenizer {encoding.name} cached in {settings.TIKTOKEN_CACHE_DIR}"
+    ))
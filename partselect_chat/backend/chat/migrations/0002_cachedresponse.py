@@ -0,0 +1,36 @@
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import pgvector.django
+import utils.http
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedResponse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.TextField()),
+                ('embedding', pgvector.django.VectorField(dimensions=1536)),
+                ('page_key', models.CharField(blank=True, default='', max_length=150)),
+                ('response', models.TextField()),
+                ('context', models.JSONField(encoder=utils.http.APIJSONEncoder)),
+                ('referenced_products', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=50), blank=True, default=list, size=None)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['page_key', 'expires_at'], name='chat_cachedresp_page_idx'),
+                    models.Index(fields=['expires_at'], name='chat_cachedresp_expires_idx'),
+                    django.contrib.postgres.indexes.GinIndex(fields=['referenced_products'], name='chat_cachedresp_products_gin'),
+                ],
+            },
+        ),
+    ]
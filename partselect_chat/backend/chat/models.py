@@ -1,9 +1,15 @@
 from django.db import models
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from pgvector.django import VectorField
+from utils.http import APIJSONEncoder
 
 
 class ChatSession(models.Model):
   session_id = models.CharField(max_length=100, unique=True)
+  # Rolling summary of messages up to and including summary_through (a ChatMessage id)
+  summary = models.TextField(blank=True, default='')
+  summary_through = models.BigIntegerField(default=0)
   created_at = models.DateTimeField(auto_now_add=True)
   updated_at = models.DateTimeField(auto_now=True)
 
@@ -32,6 +38,37 @@ class ChatMessage(models.Model):
 
   class Meta:
     ordering = ['created_at']
+    indexes = [
+        # Serves the newest-first history window of a session
+        models.Index(fields=['session', 'id'], name='chat_message_session_idx'),
+    ]
 
   def __str__(self):
     return f"{self.role} message in {self.session}"
+
+
+class CachedResponse(models.Model):
+  """Answer to a past question, reused for near-duplicate questions"""
+  query = models.TextField()
+  embedding = VectorField(dimensions=1536)
+  # Page the question was asked from, e.g. "product:W10295370A"; '' for none
+  page_key = models.CharField(max_length=150, blank=True, default='')
+  response = models.TextField()
+  context = models.JSONField(encoder=APIJSONEncoder)
+  referenced_products = ArrayField(
+      models.CharField(max_length=50),
+      blank=True,
+      default=list
+  )
+  created_at = models.DateTimeField(auto_now_add=True)
+  expires_at = models.DateTimeField()
+
+  class Meta:
+    indexes = [
+        models.Index(fields=['page_key', 'expires_at'], name='chat_cachedresp_page_idx'),
+        models.Index(fields=['expires_at'], name='chat_cachedresp_expires_idx'),
+        GinIndex(fields=['referenced_products'], name='chat_cachedresp_products_gin'),
+    ]
+
+  def __str__(self):
+    return f"Cached response for '{self.query[:50]}'"
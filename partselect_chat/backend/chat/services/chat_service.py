@@ -1,21 +1,87 @@
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from functools import lru_cache, partial
+import asyncio
+import logging
+import time
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from django.conf import settings
-from products.services.product_service import ProductService
-import uuid
+from products.services.embedding_cache import normalize_query
+from products.services.identifier_resolver import extract_identifiers
+from products.services.product_service import ProductService, get_product_service
+from utils.clients import get_chat_model
+from utils.singleflight import SingleFlight, get_single_flight
+from utils.timing import record, span
+from .context_builder import ContextBuilder
+from .response_cache import ResponseCache, get_response_cache, page_key
+from .session_memory import SessionMemory, SessionState, get_session_memory, is_follow_up, new_terms
 from asgiref.sync import async_to_sync
 from urllib.parse import urlparse
 
 
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = """You are a helpful customer service agent for PartSelect, 
+                specializing in refrigerator and dishwasher parts. You can help with:
+                1. Finding the right parts
+                2. Installation procedures
+                3. Compatibility checks
+                4. Troubleshooting guidance
+                5. Navigation through product pages and guides
+                        
+                When asked about policies or general questions, direct users to our FAQ page at 
+                http://localhost:5173/faq for detailed information.
+                
+                When referring to products or guides, always use http://localhost:5173 as the base URL.
+                Format links as: 
+                [Product Name](http://localhost:5173/products/PART_NUMBER) or 
+                [Installation Guide](http://localhost:5173/products/PART_NUMBER/installation-guide)
+                Please ensure the routing is correct for the links, and follows this format. It should always
+                start with http://localhost:5173/ followed by the path to the /products, not /parts. 
+                
+                If any user requests deviates from PartSelect capabilities, please answer that you cannot
+                provide assistance for that request.
+                """
+
+
+def with_provider_usage(usage: Dict, message) -> Dict:
+  """Add the provider's token counts (including prompt-cache hits) when it reports them"""
+  metadata = getattr(message, 'usage_metadata', None)
+  if not metadata:
+    return usage
+  details = metadata.get('input_token_details') or {}
+  return {
+      **usage,
+      'provider_prompt_tokens': metadata.get('input_tokens'),
+      'provider_cached_tokens': details.get('cache_read', 0),
+      'completion_tokens': metadata.get('output_tokens'),
+  }
+
+
 class ChatService:
-  def __init__(self):
-    self.chat_model = ChatOpenAI(
-        model_name="gpt-4o-mini",
-        temperature=0.7,
-        openai_api_key=settings.OPENAI_API_KEY
+  def __init__(
+      self,
+      chat_model: Optional[ChatOpenAI] = None,
+      product_service: Optional[ProductService] = None,
+      response_cache: Optional[ResponseCache] = None,
+      context_builder: Optional[ContextBuilder] = None,
+      session_memory: Optional[SessionMemory] = None,
+      single_flight: Optional[SingleFlight] = None
+  ):
+    self._chat_model = chat_model
+    self.product_service = product_service or get_product_service()
+    self.response_cache = response_cache
+    self.session_memory = session_memory
+    # Shares one answer between concurrent identical first questions when set
+    self.single_flight = single_flight
+    self.context_builder = context_builder or ContextBuilder(
+        SYSTEM_PROMPT, settings.CHAT_CONTEXT_TOKEN_BUDGET
     )
-    self.product_service = ProductService()
+
+  @property
+  def chat_model(self) -> ChatOpenAI:
+    """Injected model, or the pooled per-worker one"""
+    return self._chat_model or get_chat_model()
 
   def _parse_current_page(self, url: str) -> Dict:
     """Parse the current page URL to understand context"""
@@ -42,79 +108,319 @@ class ChatService:
 
     return page_context
 
-  async def get_chat_response(self, message: str, current_url: Optional[str] = None) -> Dict:
-    try:
-      # Get page context if URL is provided
-      page_context = self._parse_current_page(current_url) if current_url else None
+  async def _lookup_page_product(self, page_context: Optional[Dict]) -> Optional[Dict]:
+    if not page_context or page_context['type'] != 'product' or not page_context['identifier']:
+      return None
+    product_info = await self.product_service.search_products(
+        f"PART_NUMBER: {page_context['identifier']}",
+        limit=1
+    )
+    return product_info[0] if product_info else None
 
-      # Get product context
-      context = await self.product_service.get_relevant_context(message)
+  async def _lookup_model_parts(self, message: str) -> List[Dict]:
+    """Compatible parts for model numbers mentioned in the message.
 
-      # Build system message with enhanced context
-      messages = [
-          SystemMessage(content="""You are a helpful customer service agent for PartSelect, 
-                specializing in refrigerator and dishwasher parts. You can help with:
-                1. Finding the right parts
-                2. Installation procedures
-                3. Compatibility checks
-                4. Troubleshooting guidance
-                5. Navigation through product pages and guides
-                        
-                When asked about policies or general questions, direct users to our FAQ page at 
-                http://localhost:5173/faq for detailed information.
-                
-                When referring to products or guides, always use http://localhost:5173 as the base URL.
-                Format links as: 
-                [Product Name](http://localhost:5173/products/PART_NUMBER) or 
-                [Installation Guide](http://localhost:5173/products/PART_NUMBER/installation-guide)
-                Please ensure the routing is correct for the links, and follows this format. It should always
-                start with http://localhost:5173/ followed by the path to the /products, not /parts. 
-                
-                If any user requests deviates from PartSelect capabilities, please answer that you cannot
-                provide assistance for that request.
-                """)
-      ]
-
-      # Add page-specific context
-      if page_context and page_context['type'] == 'product':
-        product_info = await self.product_service.search_products(
-            f"PART_NUMBER: {page_context['identifier']}",
-            limit=1
+    Answers "what fits my WRF535SMHZ" straight from the model index instead
+    of leaving it to semantic search and the LLM.
+    """
+    model_numbers = await self.product_service.find_model_numbers(message)
+    return [
+        await self.product_service.get_parts_for_model(
+            model_number, limit=settings.CHAT_MODEL_PARTS_LIMIT
         )
-        if product_info:
-          messages.append(SystemMessage(
-              content=f"User is currently viewing product page for: {product_info[0]['name']} "
-              f"(Part #{product_info[0]['part_number']})"
-          ))
-
-      # Add product context
-      if context['products']:
-        context_msg = "Based on the query, I found these relevant products:\n"
-        for product in context['products']:
-          context_msg += f"\nProduct Information:\n"
-          context_msg += f"- [{product['name']}](/parts/{product['part_number']})\n"
-          context_msg += f"  Price: ${product['price']}\n"
-          context_msg += f"  Stock: {product['stock_quantity']} units\n"
-          if product['installation_guide']:
-            context_msg += f"  [View Installation Guide](/installation-guides/{product['part_number']})\n"
-          context_msg += f"\n  Compatible Models:\n"
-          for model in product['compatibility_info']:
-            context_msg += f"    - {model['model_number']} ({model['brand']})\n"
-
-        messages.append(SystemMessage(content=context_msg))
-
-      # Add user message
-      messages.append(HumanMessage(content=message))
-
-      # Get response
+        for model_number in model_numbers[:2]
+    ]
+
+  async def _session_products(self, message: str, state: Optional[SessionState]) -> List[str]:
+    """Products from earlier in the session that a follow-up question refers to.
+
+    A message that names a part number (anything other than a known model
+    number) is about a new part, so it gets a fresh search instead.
+    """
+    if state is None or not state.referenced_products or not is_follow_up(message):
+      return []
+    identifiers = extract_identifiers(message)
+    if identifiers and not set(identifiers) <= set(await self.product_service.find_model_numbers(message)):
+      return []
+    return state.referenced_products
+
+  async def _merged_context(self, message: str, part_numbers: List[str]) -> Dict:
+    """Context for the session's products followed by a fresh search's results"""
+    earlier, fresh = await asyncio.gather(
+        self.product_service.get_context_for_products(message, part_numbers),
+        self.product_service.get_relevant_context(message)
+    )
+    known = set(part_numbers)
+    products = earlier['products'] + [p for p in fresh['products'] if p['part_number'] not in known]
+    seen = {(c['part_number'], c['section']) for c in earlier['guide_chunks']}
+    guide_chunks = earlier['guide_chunks'] + [
+        c for c in fresh['guide_chunks'] if (c['part_number'], c['section']) not in seen
+    ]
+    return {
+        'products': products,
+        'guide_chunks': guide_chunks,
+        'compatibility_info': [p['compatibility_info'] for p in products]
+    }
+
+  async def _retrieve(
+      self,
+      message: str,
+      page_context: Optional[Dict],
+      reuse_products: Optional[List[str]] = None
+  ) -> Tuple[Dict, Optional[Dict]]:
+    """Retrieve product context and the product the user is viewing.
+
+    The lookups run concurrently, each under its own timeout. The page and
+    model lookups are optional: if one fails or times out the chat continues
+    without it. With reuse_products, those products are loaded directly;
+    a follow-up that also asks about something new gets a fresh search
+    merged in after them.
+    """
+    if reuse_products and new_terms(message):
+      relevant = self._merged_context(message, reuse_products)
+    elif reuse_products:
+      relevant = self.product_service.get_context_for_products(message, reuse_products)
+    else:
+      relevant = self.product_service.get_relevant_context(message)
+
+    with span('retrieval'):
+      context, page_product, model_parts = await asyncio.gather(
+          asyncio.wait_for(relevant, timeout=settings.CHAT_RETRIEVAL_TIMEOUT),
+          asyncio.wait_for(
+              self._lookup_page_product(page_context),
+              timeout=settings.CHAT_PAGE_CONTEXT_TIMEOUT
+          ),
+          asyncio.wait_for(
+              self._lookup_model_parts(message),
+              timeout=settings.CHAT_MODEL_LOOKUP_TIMEOUT
+          ),
+          return_exceptions=True
+      )
+
+    if isinstance(context, BaseException):
+      if isinstance(context, asyncio.TimeoutError):
+        raise Exception("Product retrieval timed out")
+      raise context
+
+    if isinstance(page_product, BaseException):
+      logger.warning("Skipping page context: %s %s", type(page_product).__name__, page_product)
+      page_product = None
+
+    if isinstance(model_parts, BaseException):
+      logger.warning("Skipping model lookup: %s %s", type(model_parts).__name__, model_parts)
+      model_parts = []
+    context['model_parts'] = model_parts
+
+    return context, page_product
+
+  async def _cached_answer(self, message: str, page_context: Optional[Dict]) -> Tuple[Optional[Dict], Optional[List[float]]]:
+    """Look the question up in the response cache.
+
+    Returns the cached answer (or None) and the question embedding, which is
+    needed to store the answer on a miss.
+    """
+    if self.response_cache is None:
+      return None, None
+    embedding = await self.product_service.embed_query(message)
+    cached = await self.response_cache.lookup(embedding, page_key(page_context))
+    return cached, embedding
+
+  async def _cache_answer(
+      self,
+      message: str,
+      embedding: List[float],
+      page_context: Optional[Dict],
+      page_product: Optional[Dict],
+      response: str,
+      context: Dict
+  ):
+    referenced = [p['part_number'] for p in context['products']]
+    for page in context.get('model_parts', []):
+      referenced.extend(part['part_number'] for part in page['results'])
+    if page_product:
+      referenced.append(page_product['part_number'])
+    await self.response_cache.store(
+        message, embedding, page_key(page_context), response, context, referenced
+    )
+
+  async def _load_session(self, session_id: Optional[str]) -> Optional[SessionState]:
+    """History for a client-supplied session; anonymous requests have none"""
+    if self.session_memory is None or not session_id:
+      return None
+    return await self.session_memory.load(session_id)
+
+  async def _record_turn(
+      self,
+      state: Optional[SessionState],
+      message: str,
+      response: str,
+      context: Dict,
+      page_product: Optional[Dict]
+  ):
+    if state is None:
+      return
+    # The products the answer is about; the next follow-up reuses them
+    referenced = [p['part_number'] for p in context['products']]
+    if page_product:
+      referenced.append(page_product['part_number'])
+    await self.session_memory.record(state, message, response, referenced)
+
+  def _build_messages(
+      self,
+      message: str,
+      context: Dict,
+      page_product: Optional[Dict],
+      state: Optional[SessionState] = None
+  ) -> Tuple[List, Dict]:
+    with span('prompt'):
+      history = self.session_memory.prompt_messages(state) if state is not None else None
+      messages, usage = self.context_builder.build(message, context, page_product, history)
+    logger.info(
+        "Prompt: %d tokens (%d/%d context, trim level %d)",
+        usage['prompt_tokens'], usage['context_tokens'], usage['context_budget'], usage['trim_level']
+    )
+    return messages, usage
+
+  async def _answer(
+      self,
+      message: str,
+      page_context: Optional[Dict],
+      state: Optional[SessionState] = None
+  ) -> Dict:
+    """Answer a question: from the response cache, or by retrieval and the LLM.
+
+    Without session history (state None or empty) the answer depends only
+    on the message and page, so it can be cached and shared.
+    """
+    # Cached answers are context-free, so only a session's first question uses them
+    if state is None or not state.messages:
+      cached, embedding = await self._cached_answer(message, page_context)
+    else:
+      cached, embedding = None, None
+    if cached:
+      return {**cached, 'page_product': None, 'cached': True}
+
+    reuse_products = await self._session_products(message, state)
+    context, page_product = await self._retrieve(message, page_context, reuse_products)
+    messages, usage = self._build_messages(message, context, page_product, state)
+
+    # Get response
+    with span('llm'):
       response = await self.chat_model.ainvoke(messages)
+    usage = with_provider_usage(usage, response)
+
+    if embedding is not None:
+      await self._cache_answer(
+          message, embedding, page_context, page_product, response.content, context
+      )
+    return {'response': response.content, 'context': context, 'page_product': page_product, 'usage': usage}
+
+  async def _first_answer(self, message: str, page_context: Optional[Dict]) -> Dict:
+    """Answer to a session's first question, shared by identical concurrent ones"""
+    if self.single_flight is None:
+      return await self._answer(message, page_context)
+    key = (normalize_query(message), page_key(page_context))
+    return await self.single_flight.do(key, partial(self._answer, message, page_context))
+
+  async def get_chat_response(
+      self,
+      message: str,
+      current_url: Optional[str] = None,
+      session_id: Optional[str] = None
+  ) -> Dict:
+    try:
+      # Get page context if URL is provided
+      page_context = self._parse_current_page(current_url) if current_url else None
+      state = await self._load_session(session_id)
+
+      if state is None or not state.messages:
+        answer = await self._first_answer(message, page_context)
+      else:
+        answer = await self._answer(message, page_context, state)
+      await self._record_turn(state, message, answer['response'], answer['context'], answer['page_product'])
 
-      return {
-          'response': response.content,
-          'context': context,
-          'current_page': page_context
+      result = {
+          'response': answer['response'],
+          'context': answer['context'],
+          'current_page': page_context,
+          'session_id': session_id,
       }
+      if answer.get('cached'):
+        result['cached'] = True
+      else:
+        result['usage'] = answer['usage']
+      return result
 
     except Exception as e:
-      print(f"Error in get_chat_response: {str(e)}")
+      logger.exception("Error in get_chat_response")
       raise Exception(f"Error getting chat response: {str(e)}")
+
+  async def stream_chat_response(
+      self,
+      message: str,
+      current_url: Optional[str] = None,
+      session_id: Optional[str] = None
+  ) -> AsyncIterator[Dict]:
+    """Yield the retrieved context first, then completion tokens as they arrive.
+
+    Events are dicts with an 'event' name ('context', 'token', 'done' or
+    'error') and a 'data' payload.
+    """
+    try:
+      page_context = self._parse_current_page(current_url) if current_url else None
+      state = await self._load_session(session_id)
+
+      if state is None or not state.messages:
+        cached, embedding = await self._cached_answer(message, page_context)
+      else:
+        cached, embedding = None, None
+      if cached:
+        yield {
+            'event': 'context',
+            'data': {'context': cached['context'], 'current_page': page_context, 'session_id': session_id}
+        }
+        yield {'event': 'token', 'data': {'content': cached['response']}}
+        await self._record_turn(state, message, cached['response'], cached['context'], None)
+        yield {'event': 'done', 'data': {'cached': True}}
+        return
+
+      reuse_products = await self._session_products(message, state)
+      context, page_product = await self._retrieve(message, page_context, reuse_products)
+      yield {
+          'event': 'context',
+          'data': {'context': context, 'current_page': page_context, 'session_id': session_id}
+      }
+
+      messages, usage = self._build_messages(message, context, page_product, state)
+      tokens = []
+      started = time.perf_counter()
+      async for chunk in self.chat_model.astream(messages):
+        if chunk.content:
+          if not tokens:
+            record('llm_first_token', time.perf_counter() - started)
+          tokens.append(chunk.content)
+          yield {'event': 'token', 'data': {'content': chunk.content}}
+        usage = with_provider_usage(usage, chunk)
+      record('llm', time.perf_counter() - started)
+
+      if embedding is not None:
+        await self._cache_answer(
+            message, embedding, page_context, page_product, ''.join(tokens), context
+        )
+      await self._record_turn(state, message, ''.join(tokens), context, page_product)
+
+      yield {'event': 'done', 'data': {'usage': usage}}
+
+    except Exception as e:
+      logger.exception("Error in stream_chat_response")
+      yield {'event': 'error', 'data': {'error': f"Error getting chat response: {str(e)}"}}
+
+
+@lru_cache(maxsize=None)
+def get_chat_service() -> ChatService:
+  """Shared ChatService for this worker process"""
+  return ChatService(
+      response_cache=get_response_cache(),
+      session_memory=get_session_memory(),
+      single_flight=get_single_flight('chat') if settings.SINGLE_FLIGHT_ENABLED else None
+  )
@@ -0,0 +1,218 @@
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage
+import logging
+import math
+import os
+import threading
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+
+# Rough per-message overhead of the chat format (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Progressively smaller renderings of the retrieved context. The builder uses
+# the first one that fits the budget: compatibility lists and descriptions
+# shrink first, then guide sections and model part lists.
+TRIM_LEVELS = [
+    {'models': None, 'description_tokens': 80, 'guide_chunks': None, 'model_parts': None},
+    {'models': 10, 'description_tokens': 40, 'guide_chunks': None, 'model_parts': 10},
+    {'models': 5, 'description_tokens': 20, 'guide_chunks': 2, 'model_parts': 5},
+    {'models': 0, 'description_tokens': 0, 'guide_chunks': 1, 'model_parts': 3},
+]
+
+
+# Tokens are estimated as characters / CHARS_PER_TOKEN until the tokenizer is
+# loaded, or for good if it cannot be (e.g. no network and no cached file)
+CHARS_PER_TOKEN = 4
+
+_lock = threading.Lock()
+_encoding: Optional[tiktoken.Encoding] = None
+_loader: Optional[threading.Thread] = None
+
+
+def load_encoding(model: Optional[str] = None) -> Optional[tiktoken.Encoding]:
+  """Tokenizer for the chat model, or None if it cannot be loaded.
+
+  tiktoken downloads its BPE file on first use and keeps it in
+  TIKTOKEN_CACHE_DIR; `manage.py warm_tokenizer` fills that cache ahead of
+  time so workers never need the network for it.
+  """
+  os.environ.setdefault('TIKTOKEN_CACHE_DIR', settings.TIKTOKEN_CACHE_DIR)
+  try:
+    try:
+      return tiktoken.encoding_for_model(model or settings.OPENAI_CHAT_MODEL)
+    except KeyError:
+      return tiktoken.get_encoding('o200k_base')
+  except Exception as e:
+    logger.warning("Tokenizer unavailable, estimating token counts from characters: %s", e)
+    return None
+
+
+def _load():
+  global _encoding
+  _encoding = load_encoding()
+
+
+def get_encoding() -> Optional[tiktoken.Encoding]:
+  """The loaded tokenizer, or None while it loads in a background thread.
+
+  Loading can mean a blocking download, so it never happens on the
+  caller's thread (usually the event loop).
+  """
+  global _loader
+  if _encoding is None and _loader is None:
+    with _lock:
+      if _loader is None:
+        _loader = threading.Thread(target=_load, name='tokenizer-loader', daemon=True)
+        _loader.start()
+  return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+  return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def count_tokens(text: str) -> int:
+  encoding = get_encoding()
+  if encoding is None:
+    return estimate_tokens(text)
+  return len(encoding.encode(text))
+
+
+def count_message_tokens(messages: List[BaseMessage]) -> int:
+  return sum(count_tokens(m.content) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+  if max_tokens <= 0:
+    return ''
+  encoding = get_encoding()
+  if encoding is None:
+    if len(text) <= max_tokens * CHARS_PER_TOKEN:
+      return text
+    return text[:max_tokens * CHARS_PER_TOKEN].rstrip() + '...'
+  tokens = encoding.encode(text)
+  if len(tokens) <= max_tokens:
+    return text
+  return encoding.decode(tokens[:max_tokens]).rstrip() + '...'
+
+
+class ContextBuilder:
+  """Assembles chat prompt messages within a token budget.
+
+  The system prompt always goes first and unchanged, so the prefix is
+  byte-identical across requests and provider-side prompt caching applies.
+  Retrieved context follows it and is trimmed to fit ``max_tokens``
+  (measured with the local tokenizer); the user's message always goes last.
+  """
+
+  def __init__(self, system_prompt: str, max_tokens: int):
+    self.system_message = SystemMessage(content=system_prompt)
+    self.max_tokens = max_tokens
+
+  def _products_message(self, products: List[Dict], level: Dict) -> Optional[str]:
+    if not products:
+      return None
+    context_msg = "Based on the query, I found these relevant products:\n"
+    for product in products:
+      context_msg += f"\nProduct Information:\n"
+      context_msg += f"- [{product['name']}](/parts/{product['part_number']})\n"
+      context_msg += f"  Price: ${product['price']}\n"
+      context_msg += f"  Stock: {product['stock_quantity']} units\n"
+      description = truncate_tokens(product.get('description') or '', level['description_tokens'])
+      if description:
+        context_msg += f"  Description: {description}\n"
+      if product['installation_guide']:
+        context_msg += f"  [View Installation Guide](/installation-guides/{product['part_number']})\n"
+
+      models = product['compatibility_info']
+      shown = models if level['models'] is None else models[:level['models']]
+      if shown:
+        context_msg += f"\n  Compatible Models:\n"
+        for model in shown:
+          context_msg += f"    - {model['model_number']} ({model['brand']})\n"
+      if len(shown) < len(models):
+        context_msg += f"    ({len(models) - len(shown)} more compatible models not listed)\n"
+    return context_msg
+
+  def _guide_message(self, chunks: List[Dict], level: Dict) -> Optional[str]:
+    chunks = chunks if level['guide_chunks'] is None else chunks[:level['guide_chunks']]
+    if not chunks:
+      return None
+    guide_msg = "Relevant installation guide sections:\n"
+    for chunk in chunks:
+      guide_msg += f"\n[{chunk['product_name']} (Part #{chunk['part_number']}) - {chunk['section']}]\n"
+      guide_msg += f"{chunk['content']}\n"
+    return guide_msg
+
+  def _model_parts_messages(self, pages: List[Dict], level: Dict) -> List[str]:
+    messages = []
+    for page in pages:
+      if not page['results']:
+        continue
+      parts = page['results'] if level['model_parts'] is None else page['results'][:level['model_parts']]
+      model_msg = f"Parts confirmed compatible with model {page['model_number']}:\n"
+      for part in parts:
+        model_msg += f"- [{part['name']}](/parts/{part['part_number']}) ${part['price']}\n"
+      if page['next_after'] is not None or len(parts) < len(page['results']):
+        model_msg += "(More compatible parts exist; ask the user what they need.)\n"
+      messages.append(model_msg)
+    return messages
+
+  def _render(self, context: Dict, page_product: Optional[Dict], products: List[Dict], level: Dict) -> List[str]:
+    rendered = []
+    if page_product:
+      rendered.append(
+          f"User is currently viewing product page for: {page_product['name']} "
+          f"(Part #{page_product['part_number']})"
+      )
+    rendered.append(self._products_message(products, level))
+    rendered.append(self._guide_message(context.get('guide_chunks', []), level))
+    rendered.extend(self._model_parts_messages(context.get('model_parts', []), level))
+    return [text for text in rendered if text]
+
+  def build(
+      self,
+      message: str,
+      context: Dict,
+      page_product: Optional[Dict] = None,
+      history: Optional[List[BaseMessage]] = None
+  ) -> Tuple[List[BaseMessage], Dict]:
+    """Prompt messages for a question plus a token report.
+
+    Conversation history goes right after the system prompt: it only grows
+    between turns of a session, so it extends the cacheable prefix. The
+    report holds the prompt token count, the context tokens spent against
+    the budget and the trim level used (0 means nothing was trimmed).
+    """
+    history = history or []
+    products = list(context['products'])
+    for trim_level, level in enumerate(TRIM_LEVELS):
+      rendered = self._render(context, page_product, products, level)
+      context_tokens = sum(count_tokens(text) + MESSAGE_OVERHEAD_TOKENS for text in rendered)
+      if context_tokens <= self.max_tokens:
+        break
+    else:
+      # Still over budget at the smallest rendering: drop the lowest-ranked products
+      while products and context_tokens > self.max_tokens:
+        products.pop()
+        rendered = self._render(context, page_product, products, level)
+        context_tokens = sum(count_tokens(text) + MESSAGE_OVERHEAD_TOKENS for text in rendered)
+
+    messages = [
+        self.system_message,
+        *history,
+        *(SystemMessage(content=text) for text in rendered),
+        HumanMessage(content=message),
+    ]
+    return messages, {
+        'prompt_tokens': count_message_tokens(messages),
+        'context_tokens': context_tokens,
+        'context_budget': self.max_tokens,
+        'history_tokens': count_message_tokens(history),
+        'trim_level': trim_level,
+        'products_dropped': len(context['products']) - len(products),
+    }
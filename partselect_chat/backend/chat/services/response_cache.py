@@ -0,0 +1,115 @@
+from typing import Dict, Iterable, List, Optional
+from datetime import timedelta
+from functools import lru_cache
+import logging
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from pgvector.django import L2Distance
+from utils.metrics import register_stats
+from ..models import CachedResponse
+
+logger = logging.getLogger(__name__)
+
+
+def page_key(page_context: Optional[Dict]) -> str:
+  """Cache partition for the page a question was asked from"""
+  if not page_context or not page_context.get('type'):
+    return ''
+  return f"{page_context['type']}:{page_context.get('identifier') or ''}"
+
+
+class ResponseCache:
+  """Semantic cache of chat answers.
+
+  A question hits when a cached question asked from the same page is within
+  max_distance (L2, in embedding space) and has not expired. Entries are
+  dropped when a product they reference changes price or stock.
+  """
+
+  def __init__(self, max_distance: float, ttl: float):
+    self.max_distance = max_distance
+    self.ttl = ttl
+    self.hits = 0
+    self.misses = 0
+
+  async def lookup(self, embedding: List[float], page: str) -> Optional[Dict]:
+    try:
+      entry = await CachedResponse.objects.filter(
+          page_key=page,
+          expires_at__gt=timezone.now()
+      ).annotate(
+          distance=L2Distance('embedding', embedding)
+      ).filter(
+          distance__lte=self.max_distance
+      ).order_by('distance').only('response', 'context').afirst()
+    except DatabaseError as e:
+      logger.warning("Response cache lookup failed: %s", e)
+      entry = None
+
+    if entry is None:
+      self.misses += 1
+      return None
+
+    self.hits += 1
+    return {'response': entry.response, 'context': entry.context}
+
+  async def store(
+      self,
+      query: str,
+      embedding: List[float],
+      page: str,
+      response: str,
+      context: Dict,
+      referenced_products: Iterable[str]
+  ):
+    # Expired rows are skipped by lookup() and removed by prune_expired(),
+    # off the request path
+    now = timezone.now()
+    try:
+      await CachedResponse.objects.acreate(
+          query=query,
+          embedding=embedding,
+          page_key=page,
+          response=response,
+          context=context,
+          referenced_products=sorted(set(referenced_products)),
+          expires_at=now + timedelta(seconds=self.ttl)
+      )
+    except DatabaseError as e:
+      logger.warning("Response cache write failed: %s", e)
+
+  def stats(self) -> Dict:
+    lookups = self.hits + self.misses
+    return {
+        'hits': self.hits,
+        'misses': self.misses,
+        'hit_rate': self.hits / lookups if lookups else 0.0,
+    }
+
+
+def invalidate_products(part_numbers: Iterable[str]) -> int:
+  """Drop cached answers that reference any of the given part numbers"""
+  deleted, _ = CachedResponse.objects.filter(
+      referenced_products__overlap=list(part_numbers)
+  ).delete()
+  return deleted
+
+
+def prune_expired() -> int:
+  """Delete expired answers (run periodically with `manage.py prune_response_cache`)"""
+  deleted, _ = CachedResponse.objects.filter(expires_at__lte=timezone.now()).delete()
+  return deleted
+
+
+@lru_cache(maxsize=None)
+def get_response_cache() -> Optional[ResponseCache]:
+  """Shared ResponseCache for this worker, or None when the cache is off"""
+  if not settings.CHAT_RESPONSE_CACHE_ENABLED:
+    return None
+  cache = ResponseCache(
+      max_distance=settings.CHAT_RESPONSE_CACHE_MAX_DISTANCE,
+      ttl=settings.CHAT_RESPONSE_CACHE_TTL,
+  )
+  register_stats('response_cache', cache.stats)
+  return cache
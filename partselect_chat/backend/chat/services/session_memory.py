@@ -0,0 +1,219 @@
+from typing import List, Optional
+from dataclasses import dataclass, field
+from functools import lru_cache
+import asyncio
+import logging
+import re
+from django.conf import settings
+from django.db import DatabaseError
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from utils.clients import get_chat_model
+from ..models import ChatSession, ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+SUMMARY_PROMPT = """Summarize this conversation between a customer and a PartSelect parts
+assistant in at most five sentences. Keep part numbers, model numbers, the
+appliance involved and anything the customer still needs. Start from the
+existing summary, if any, and fold the new turns into it."""
+
+# Words that point back at something already discussed ("does it fit",
+# "how do I install that one")
+FOLLOW_UP = re.compile(r"\b(it|its|it's|this|that|these|those|they|them|one|same)\b", re.IGNORECASE)
+
+
+# Words that ask about the product already under discussion without adding
+# anything to search for ("how much is it", "how do I install that one")
+FOLLOW_UP_FILLER = frozenset({
+    'a', 'an', 'the', 'and', 'or', 'of', 'to', 'in', 'on', 'for', 'with', 'at', 'by', 'from', 'about',
+    'i', 'me', 'my', 'we', 'our', 'you', 'your', 'it', 'its', "it's", 'this', 'that', 'these',
+    'those', 'they', 'them', 'one', 'ones', 'same', 'there',
+    'what', 'which', 'how', 'when', 'where', 'why', 'who',
+    'is', 'are', 'was', 'be', 'do', 'does', 'did', 'can', 'could', 'will', 'would', 'should',
+    'have', 'has', 'need', 'much', 'many', 'long', 'still', 'also', 'again', 'please', 'thanks',
+    'tell', 'more', 'any', 'get', 'take', 'takes', 'if', 'so', 'up', 'out', 'not',
+    'install', 'installing', 'installation', 'instructions', 'guide', 'steps', 'tools',
+    'replace', 'replacing', 'remove', 'fit', 'fits', 'work', 'works', 'compatible',
+    'cost', 'costs', 'price', 'stock', 'available', 'order', 'buy', 'ship', 'shipping',
+    'warranty', 'part',
+})
+WORD = re.compile(r"[a-z0-9][a-z0-9'-]*")
+
+
+def is_follow_up(message: str) -> bool:
+  """True when a message refers back to something already discussed"""
+  return bool(FOLLOW_UP.search(message))
+
+
+def new_terms(message: str) -> List[str]:
+  """Words in a follow-up that ask about something not yet discussed"""
+  return [word for word in WORD.findall(message.lower()) if word not in FOLLOW_UP_FILLER]
+
+
+@dataclass
+class SessionState:
+  """A session as loaded for one turn"""
+  session: ChatSession
+  # Unsummarized messages, oldest first
+  messages: List[ChatMessage] = field(default_factory=list)
+
+  @property
+  def summary(self) -> str:
+    return self.session.summary
+
+  def history(self, window: int) -> List[ChatMessage]:
+    return self.messages[-window:] if window > 0 else []
+
+  @property
+  def referenced_products(self) -> List[str]:
+    """Products the latest answer was about"""
+    for message in reversed(self.messages):
+      if message.role == 'assistant' and message.referenced_products:
+        return list(message.referenced_products)
+    return []
+
+
+class SessionMemory:
+  """Conversation history for chat sessions.
+
+  New messages are buffered and written with one bulk insert shortly after
+  the response, off the request path. The prompt carries the last ``window``
+  messages; once more than ``window + summary_batch`` are unsummarized, the
+  oldest are folded into ChatSession.summary by the chat model, also in the
+  background.
+  """
+
+  def __init__(
+      self,
+      window: int,
+      summary_batch: int,
+      flush_interval: float = 0.5,
+      write_behind: bool = True,
+      chat_model=None
+  ):
+    self.window = window
+    self.summary_batch = summary_batch
+    self.flush_interval = flush_interval
+    self.write_behind = write_behind
+    self._chat_model = chat_model
+    self._pending: List[ChatMessage] = []
+    # Taken out of _pending by a flush whose insert has not finished yet
+    self._writing: List[ChatMessage] = []
+    self._summarize: set = set()
+    self._flush_task: Optional[asyncio.Task] = None
+
+  @property
+  def chat_model(self):
+    return self._chat_model or get_chat_model(temperature=0.0)
+
+  async def load(self, session_id: str) -> SessionState:
+    """Session and its unsummarized messages, including ones not yet flushed"""
+    session, _ = await ChatSession.objects.aget_or_create(session_id=session_id)
+    # Taken before the read so a flush finishing meanwhile cannot hide a
+    # message from both; ids drop the ones the read already returned
+    unwritten = [m for m in self._writing + self._pending if m.session_id == session.id]
+    # Bounded read: summarization keeps the backlog near window + summary_batch
+    recent = [
+        message async for message in ChatMessage.objects.filter(
+            session=session, id__gt=session.summary_through
+        ).order_by('-id')[:(self.window + self.summary_batch) * 2]
+    ]
+    recent.reverse()
+    written = {message.id for message in recent}
+    pending = [m for m in unwritten if m.id is None or m.id not in written]
+    return SessionState(session=session, messages=recent + pending)
+
+  def prompt_messages(self, state: SessionState) -> List:
+    """Summary and history window as chat messages, oldest first"""
+    messages = []
+    if state.summary:
+      messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{state.summary}"))
+    for message in state.history(self.window):
+      cls = HumanMessage if message.role == 'user' else AIMessage
+      messages.append(cls(content=message.content))
+    return messages
+
+  async def record(self, state: SessionState, question: str, answer: str, referenced_products: List[str]):
+    """Store a finished turn; returns before anything is written when write-behind is on"""
+    turn = [
+        ChatMessage(session=state.session, role='user', content=question),
+        ChatMessage(
+            session=state.session,
+            role='assistant',
+            content=answer,
+            referenced_products=sorted(set(referenced_products))
+        ),
+    ]
+    state.messages.extend(turn)
+    self._pending.extend(turn)
+    if len(state.messages) > self.window + self.summary_batch:
+      self._summarize.add(state.session.id)
+
+    if not self.write_behind:
+      await self.flush()
+    elif self._flush_task is None or self._flush_task.done():
+      self._flush_task = asyncio.create_task(self._flush_later())
+
+  async def _flush_later(self):
+    try:
+      await asyncio.sleep(self.flush_interval)
+    finally:
+      # Also runs when the loop is torn down and cancels us, so buffered
+      # messages are still written
+      await self.flush()
+
+  async def flush(self):
+    """Write buffered messages in one statement, then run due summarizations"""
+    pending, self._pending = self._pending, []
+    sessions, self._summarize = self._summarize, set()
+    if pending:
+      self._writing.extend(pending)
+      try:
+        await ChatMessage.objects.abulk_create(pending)
+      except DatabaseError as e:
+        # Keep them for the next flush rather than losing the turn
+        logger.error("Chat history write failed, will retry: %s", e)
+        self._pending[:0] = pending
+      finally:
+        done = {id(message) for message in pending}
+        self._writing = [m for m in self._writing if id(m) not in done]
+    for session_id in sessions:
+      try:
+        await self.summarize(session_id)
+      except Exception as e:
+        logger.warning("Chat summary failed for session %s: %s", session_id, e)
+
+  async def summarize(self, session_id: int):
+    """Fold the oldest messages beyond the window into the session summary"""
+    session = await ChatSession.objects.aget(id=session_id)
+    messages = [
+        message async for message in ChatMessage.objects.filter(
+            session=session, id__gt=session.summary_through
+        ).order_by('id')
+    ]
+    if len(messages) <= self.window + self.summary_batch:
+      return
+    older = messages[:-self.window]
+
+    transcript = '\n'.join(f"{m.role}: {m.content}" for m in older)
+    if session.summary:
+      transcript = f"Existing summary: {session.summary}\n\nNew turns:\n{transcript}"
+    response = await self.chat_model.ainvoke([
+        SystemMessage(content=SUMMARY_PROMPT),
+        HumanMessage(content=transcript),
+    ])
+
+    session.summary = response.content
+    session.summary_through = older[-1].id
+    await session.asave(update_fields=['summary', 'summary_through', 'updated_at'])
+
+
+@lru_cache(maxsize=None)
+def get_session_memory() -> SessionMemory:
+  """Shared SessionMemory for this worker process"""
+  return SessionMemory(
+      window=settings.CHAT_HISTORY_WINDOW,
+      summary_batch=settings.CHAT_SUMMARY_BATCH,
+      flush_interval=settings.CHAT_HISTORY_FLUSH_INTERVAL,
+  )
@@ -0,0 +1,27 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from products.models import Product
+from products.signals import products_bulk_updated
+from .services.response_cache import invalidate_products
+
+# Cached answers quote these fields, so changing them makes the answer stale
+CACHED_PRODUCT_FIELDS = {'price', 'stock_quantity'}
+
+
+@receiver(post_save, sender=Product)
+def invalidate_cached_responses_on_save(sender, instance, created, update_fields=None, **kwargs):
+  if created:
+    return
+  if update_fields is not None and not CACHED_PRODUCT_FIELDS.intersection(update_fields):
+    return
+  invalidate_products([instance.part_number])
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_cached_responses_on_delete(sender, instance, **kwargs):
+  invalidate_products([instance.part_number])
+
+
+@receiver(products_bulk_updated)
+def invalidate_cached_responses_on_bulk_update(sender, part_numbers, **kwargs):
+  invalidate_products(part_numbers)
@@ -1,3 +1,568 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import time
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from products.models import ModelCompatibility, Product
+from products.services.product_service import ProductService
+from .models import CachedResponse, ChatMessage, ChatSession
+from .services.chat_service import SYSTEM_PROMPT, ChatService
+from .services.context_builder import ContextBuilder, estimate_tokens
+from .services.response_cache import ResponseCache
+from .services.session_memory import SessionMemory
+from .views import ChatView
+from utils.clients import get_async_http_client, get_chat_model, get_embeddings, get_http_client
+from utils.singleflight import SingleFlight
 
-# Create your tests here.
+
+EMBEDDING_DIMENSIONS = 1536
+
+
+def unit_vector(index):
+  vector = [0.0] * EMBEDDING_DIMENSIONS
+  vector[index] = 1.0
+  return vector
+
+
+class ResponseCacheTests(TestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.product = Product.objects.create(
+        part_number='W10295370A',
+        name='Refrigerator Water Filter',
+        description='EveryDrop Filter 1',
+        appliance_type='REFRIGERATOR',
+        price='49.99',
+        stock_quantity=20
+    )
+
+  def setUp(self):
+    self.cache = ResponseCache(max_distance=0.15, ttl=60)
+
+  async def store(self, page=''):
+    await self.cache.store(
+        'how much is the water filter',
+        unit_vector(0),
+        page,
+        'It costs $49.99.',
+        {'products': []},
+        ['W10295370A']
+    )
+
+  async def test_near_duplicate_question_hits(self):
+    await self.store()
+    nearby = unit_vector(0)
+    nearby[1] = 0.1
+
+    cached = await self.cache.lookup(nearby, '')
+    self.assertEqual(cached['response'], 'It costs $49.99.')
+    self.assertIsNone(await self.cache.lookup(unit_vector(1), ''))
+
+  async def test_page_context_partitions_entries(self):
+    await self.store(page='product:W10190965')
+    self.assertIsNone(await self.cache.lookup(unit_vector(0), ''))
+
+  async def test_price_change_invalidates(self):
+    await self.store()
+    self.product.price = '44.99'
+    await self.product.asave(update_fields=['price'])
+    self.assertIsNone(await self.cache.lookup(unit_vector(0), ''))
+
+  async def test_unrelated_update_keeps_entry(self):
+    await self.store()
+    self.product.name = 'Water Filter'
+    await self.product.asave(update_fields=['name'])
+    self.assertIsNotNone(await self.cache.lookup(unit_vector(0), ''))
+
+
+  def test_expired_entries_are_pruned_off_the_request_path(self):
+    self.cache.ttl = -1
+    async_to_sync(self.store)()
+    async_to_sync(self.store)()
+    # Storing does not sweep; the expired rows are just never served
+    self.assertEqual(CachedResponse.objects.count(), 2)
+    self.assertIsNone(async_to_sync(self.cache.lookup)(unit_vector(0), ''))
+
+    call_command('prune_response_cache', stdout=io.StringIO())
+    self.assertEqual(CachedResponse.objects.count(), 0)
+
+
+def retrieved_context(products=3, models=40):
+  return {
+      'products': [
+          {
+              'part_number': f'W1030002{i}',
+              'name': f'Spray Arm Assembly {i}',
+              'description': 'Upper spray arm with multiple water jets. ' * 30,
+              'price': '65.99',
+              'stock_quantity': 12,
+              'installation_guide': 'Remove the lower rack.',
+              'compatibility_info': [
+                  {'model_number': f'WDT7{i}{m:03d}SAHZ', 'brand': 'Whirlpool', 'notes': ''}
+                  for m in range(models)
+              ],
+          }
+          for i in range(products)
+      ],
+      'guide_chunks': [],
+      'model_parts': [],
+  }
+
+
+class ContextBuilderTests(SimpleTestCase):
+  def test_system_prefix_is_identical_across_requests(self):
+    builder = ContextBuilder(SYSTEM_PROMPT, max_tokens=2000)
+    first, _ = builder.build('does this fit?', retrieved_context(products=1))
+    second, _ = builder.build('how much is it?', retrieved_context(products=3, models=2))
+    self.assertEqual(first[0].content, SYSTEM_PROMPT)
+    self.assertEqual(first[0].content, second[0].content)
+    self.assertEqual(second[-1].content, 'how much is it?')
+
+  def test_large_context_is_trimmed_to_budget(self):
+    builder = ContextBuilder(SYSTEM_PROMPT, max_tokens=600)
+    messages, usage = builder.build('which spray arm fits?', retrieved_context())
+
+    self.assertLessEqual(usage['context_tokens'], 600)
+    self.assertGreater(usage['trim_level'], 0)
+    self.assertGreater(usage['prompt_tokens'], usage['context_tokens'])
+    self.assertIn('more compatible models not listed', messages[1].content)
+
+  def test_small_context_is_untouched(self):
+    builder = ContextBuilder(SYSTEM_PROMPT, max_tokens=5000)
+    messages, usage = builder.build('which spray arm fits?', retrieved_context(products=1, models=3))
+    self.assertEqual(usage['trim_level'], 0)
+    self.assertIn('WDT70002SAHZ', messages[1].content)
+
+  def test_character_estimate_without_tokenizer(self):
+    self.assertEqual(estimate_tokens(''), 0)
+    self.assertEqual(estimate_tokens('abcdefghi'), 3)
+
+
+class FakeChatModel:
+  """Records prompts and answers every call with the same text"""
+
+  def __init__(self, answer='The W10295370A costs $49.99.'):
+    self.answer = answer
+    self.prompts = []
+
+  async def ainvoke(self, messages):
+    self.prompts.append(messages)
+    return AIMessage(content=self.answer)
+
+
+class CountingProductService(ProductService):
+  def __init__(self):
+    super().__init__(search_mode='lexical')
+    self.searches = 0
+
+  async def get_relevant_context(self, query):
+    self.searches += 1
+    return await super().get_relevant_context(query)
+
+
+class SessionMemoryTests(TestCase):
+  @classmethod
+  def setUpTestData(cls):
+    Product.objects.create(
+        part_number='W10295370A',
+        name='Refrigerator Water Filter',
+        description='EveryDrop Filter 1',
+        appliance_type='REFRIGERATOR',
+        price='49.99',
+        stock_quantity=20
+    )
+
+  def setUp(self):
+    self.chat_model = FakeChatModel()
+    self.product_service = CountingProductService()
+    self.memory = SessionMemory(window=2, summary_batch=2, write_behind=False, chat_model=self.chat_model)
+    self.service = ChatService(
+        chat_model=self.chat_model,
+        product_service=self.product_service,
+        session_memory=self.memory
+    )
+
+  async def test_follow_up_reuses_session_products_and_history(self):
+    first = await self.service.get_chat_response('How much is the W10295370A?', session_id='abc')
+    self.assertEqual(first['session_id'], 'abc')
+
+    follow_up = await self.service.get_chat_response('How do I install it?', session_id='abc')
+    self.assertEqual(self.product_service.searches, 1)
+    self.assertEqual([p['part_number'] for p in follow_up['context']['products']], ['W10295370A'])
+
+    prompt = self.chat_model.prompts[-1]
+    self.assertEqual(prompt[0].content, SYSTEM_PROMPT)
+    self.assertIsInstance(prompt[1], HumanMessage)
+    self.assertEqual(prompt[1].content, 'How much is the W10295370A?')
+    self.assertEqual(await ChatMessage.objects.filter(session__session_id='abc').acount(), 4)
+
+  async def test_follow_up_with_new_terms_searches_too(self):
+    await self.service.get_chat_response('How much is the W10295370A?', session_id='abc')
+    follow_up = await self.service.get_chat_response('Is there a filter like that one for the freezer?', session_id='abc')
+
+    self.assertEqual(self.product_service.searches, 2)
+    self.assertEqual(follow_up['context']['products'][0]['part_number'], 'W10295370A')
+
+  async def test_no_session_without_session_id(self):
+    response = await self.service.get_chat_response('How much is the W10295370A?')
+
+    self.assertIsNone(response['session_id'])
+    self.assertEqual(await ChatSession.objects.acount(), 0)
+    self.assertEqual(await ChatMessage.objects.acount(), 0)
+
+  async def test_older_turns_are_summarized(self):
+    for question in ('How much is the W10295370A?', 'Is it in stock?', 'Does it fit a side-by-side?'):
+      await self.service.get_chat_response(question, session_id='abc')
+
+    session = await ChatSession.objects.aget(session_id='abc')
+    self.assertEqual(session.summary, self.chat_model.answer)
+    state = await self.memory.load('abc')
+    self.assertEqual(len(state.messages), 2)
+    self.assertEqual(state.messages[0].content, 'Does it fit a side-by-side?')
+
+
+  def test_failed_history_write_is_kept_and_retried(self):
+    memory = SessionMemory(window=2, summary_batch=2, write_behind=False, chat_model=self.chat_model)
+    state = async_to_sync(memory.load)('abc')
+    # The insert fails on the missing session; leaving the block restores it
+    with transaction.atomic():
+      ChatSession.objects.filter(session_id='abc').delete()
+      with connection.cursor() as cursor:
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+      async_to_sync(memory.record)(state, 'Is it in stock?', 'Yes.', ['W10295370A'])
+    self.assertEqual(ChatMessage.objects.count(), 0)
+
+    state = async_to_sync(memory.load)('abc')
+    self.assertEqual([m.content for m in state.messages], ['Is it in stock?', 'Yes.'])
+    async_to_sync(memory.flush)()
+    self.assertEqual(ChatMessage.objects.count(), 2)
+    self.assertEqual(len(async_to_sync(memory.load)('abc').messages), 2)
+
+  def test_overlong_session_id_is_rejected(self):
+    response = self.client.post(
+        '/api/chat/', {'message': 'Hi', 'sessionId': 'a' * 101}, content_type='application/json'
+    )
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(ChatSession.objects.count(), 0)
+
+
+class SingleFlightTests(SimpleTestCase):
+  async def test_concurrent_calls_share_one_result(self):
+    flight = SingleFlight()
+    runs = []
+
+    async def work():
+      runs.append(1)
+      await asyncio.sleep(0.01)
+      return {'answer': 42}
+
+    results = await asyncio.gather(*(flight.do('q', work) for _ in range(5)))
+    self.assertEqual(len(runs), 1)
+    self.assertTrue(all(r is results[0] for r in results))
+    self.assertEqual(flight.stats()['coalescing_ratio'], 0.8)
+    self.assertEqual(flight.stats()['in_flight'], 0)
+
+  async def test_errors_reach_every_caller_and_are_not_kept(self):
+    flight = SingleFlight()
+
+    async def fail():
+      await asyncio.sleep(0.01)
+      raise ValueError('embedding failed')
+
+    results = await asyncio.gather(flight.do('q', fail), flight.do('q', fail), return_exceptions=True)
+    self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+    async def succeed():
+      return 'ok'
+
+    self.assertEqual(await flight.do('q', succeed), 'ok')
+
+  async def test_cancelled_caller_leaves_others_running(self):
+    flight = SingleFlight()
+    finished = asyncio.Event()
+
+    async def work():
+      await asyncio.sleep(0.02)
+      finished.set()
+      return 'done'
+
+    first = asyncio.ensure_future(flight.do('q', work))
+    second = asyncio.ensure_future(flight.do('q', work))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    self.assertEqual(await second, 'done')
+    self.assertTrue(finished.is_set())
+    with self.assertRaises(asyncio.CancelledError):
+      await first
+
+  async def test_work_is_cancelled_when_nobody_waits(self):
+    flight = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def work():
+      try:
+        await asyncio.sleep(10)
+      except asyncio.CancelledError:
+        cancelled.set()
+        raise
+
+    caller = asyncio.ensure_future(flight.do('q', work))
+    await asyncio.sleep(0.001)
+    caller.cancel()
+    await asyncio.sleep(0.01)
+    self.assertTrue(cancelled.is_set())
+    self.assertEqual(flight.in_flight(), 0)
+
+
+class SlowChatModel(FakeChatModel):
+  async def ainvoke(self, messages):
+    await asyncio.sleep(0.05)
+    return await super().ainvoke(messages)
+
+
+class ChatCoalescingTests(TestCase):
+  @classmethod
+  def setUpTestData(cls):
+    Product.objects.create(
+        part_number='W10295370A',
+        name='Refrigerator Water Filter',
+        description='EveryDrop Filter 1',
+        appliance_type='REFRIGERATOR',
+        price='49.99',
+        stock_quantity=20
+    )
+
+  async def test_identical_first_questions_share_one_answer(self):
+    chat_model = SlowChatModel()
+    memory = SessionMemory(window=2, summary_batch=2, write_behind=False, chat_model=chat_model)
+    service = ChatService(
+        chat_model=chat_model,
+        product_service=CountingProductService(),
+        session_memory=memory,
+        single_flight=SingleFlight()
+    )
+
+    responses = await asyncio.gather(
+        service.get_chat_response('How much is the W10295370A?', session_id='a'),
+        service.get_chat_response('how much is the  W10295370A?', session_id='b'),
+    )
+
+    self.assertEqual(len(chat_model.prompts), 1)
+    self.assertEqual([r['session_id'] for r in responses], ['a', 'b'])
+    self.assertEqual(responses[0]['response'], responses[1]['response'])
+    # Each session still records its own turn
+    self.assertEqual(await ChatMessage.objects.filter(session__session_id='b').acount(), 2)
+
+
+class StagedProductService(ProductService):
+  """Retrieval stages that can be slowed down or made to fail"""
+
+  def __init__(self, delays=None, failing=()):
+    super().__init__(search_mode='lexical')
+    self.delays = delays or {}
+    self.failing = set(failing)
+    self.started = {}
+
+  async def _stage(self, name):
+    self.started[name] = time.perf_counter()
+    await asyncio.sleep(self.delays.get(name, 0))
+    if name in self.failing:
+      raise RuntimeError(f"{name} lookup failed")
+
+  async def get_relevant_context(self, query):
+    await self._stage('products')
+    return await super().get_relevant_context(query)
+
+  async def search_products(self, query, **kwargs):
+    # The page lookup searches for the part number in the URL
+    if query.startswith('PART_NUMBER:'):
+      await self._stage('page')
+    return await super().search_products(query, **kwargs)
+
+  async def find_model_numbers(self, text):
+    await self._stage('model')
+    return await super().find_model_numbers(text)
+
+
+class RetrievalStageTests(TestCase):
+  QUESTION = 'Does the W10295370A fit my WRF535SMHZ?'
+  PAGE = 'https://www.partselect.com/parts/W10195417/'
+
+  @classmethod
+  def setUpTestData(cls):
+    Product.objects.create(
+        part_number='W10295370A',
+        name='Refrigerator Water Filter',
+        description='EveryDrop Filter 1',
+        appliance_type='REFRIGERATOR',
+        price='49.99'
+    )
+    Product.objects.create(
+        part_number='W10195417',
+        name='Circulation Pump Motor',
+        description='Main circulation pump',
+        appliance_type='DISHWASHER',
+        price='145.99'
+    )
+    ice_maker = Product.objects.create(
+        part_number='W10873791',
+        name='Ice Maker Assembly',
+        description='Replacement ice maker',
+        appliance_type='REFRIGERATOR',
+        price='89.99'
+    )
+    ModelCompatibility.objects.create(product=ice_maker, model_number='WRF535SMHZ', brand='Whirlpool')
+
+  def service(self, **stages):
+    self.chat_model = FakeChatModel()
+    self.product_service = StagedProductService(**stages)
+    return ChatService(chat_model=self.chat_model, product_service=self.product_service)
+
+  def prompt_text(self):
+    return '\n'.join(message.content for message in self.chat_model.prompts[-1])
+
+  async def test_stages_run_concurrently(self):
+    service = self.service(delays={'products': 0.1, 'page': 0.1, 'model': 0.1})
+
+    await service.get_chat_response(self.QUESTION, current_url=self.PAGE)
+
+    started = self.product_service.started
+    self.assertEqual(set(started), {'products', 'page', 'model'})
+    # Each stage starts before any other has finished sleeping
+    self.assertLess(max(started.values()) - min(started.values()), 0.1)
+
+  @override_settings(CHAT_MODEL_LOOKUP_TIMEOUT=0.05)
+  async def test_slow_model_lookup_is_skipped(self):
+    service = self.service(delays={'model': 5})
+
+    started = time.perf_counter()
+    response = await service.get_chat_response(self.QUESTION, current_url=self.PAGE)
+
+    self.assertLess(time.perf_counter() - started, 5)
+    self.assertEqual(response['context']['model_parts'], [])
+    self.assertIn('W10295370A', self.prompt_text())
+    self.assertIn('W10195417', self.prompt_text())
+
+  async def test_failed_page_lookup_keeps_the_rest_of_the_context(self):
+    service = self.service(failing=['page'])
+
+    response = await service.get_chat_response(self.QUESTION, current_url=self.PAGE)
+
+    self.assertEqual(response['response'], self.chat_model.answer)
+    self.assertEqual(response['context']['products'][0]['part_number'], 'W10295370A')
+    self.assertEqual(response['context']['model_parts'][0]['results'][0]['part_number'], 'W10873791')
+    prompt = self.prompt_text()
+    self.assertIn('W10873791', prompt)
+    self.assertNotIn('W10195417', prompt)
+
+  @override_settings(CHAT_RETRIEVAL_TIMEOUT=0.05)
+  async def test_product_retrieval_timeout_fails_the_answer(self):
+    service = self.service(delays={'products': 5})
+
+    with self.assertRaisesMessage(Exception, 'Product retrieval timed out'):
+      await service.get_chat_response(self.QUESTION)
+    self.assertEqual(self.chat_model.prompts, [])
+
+
+class StreamingChatModel(FakeChatModel):
+  async def astream(self, messages):
+    self.prompts.append(messages)
+    for word in self.answer.split(' '):
+      yield AIMessageChunk(content=word + ' ')
+
+
+class BrokenChatModel(FakeChatModel):
+  async def astream(self, messages):
+    raise RuntimeError('model unavailable')
+    yield
+
+
+class StreamingViewTests(TestCase):
+  @classmethod
+  def setUpTestData(cls):
+    Product.objects.create(
+        part_number='W10295370A',
+        name='Refrigerator Water Filter',
+        description='EveryDrop Filter 1',
+        appliance_type='REFRIGERATOR',
+        price='49.99'
+    )
+
+  async def stream(self, chat_model, **data):
+    service = ChatService(chat_model=chat_model, product_service=CountingProductService())
+
+    class View(ChatView):
+      chat_service = service
+
+    request = AsyncRequestFactory().post(
+        '/api/chat/', {'message': 'How much is the W10295370A?', **data}, content_type='application/json'
+    )
+    response = await View.as_view()(request)
+    body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+    return response, body
+
+  def events(self, body):
+    self.assertTrue(body.endswith('\n\n'))
+    events = []
+    for frame in body[:-2].split('\n\n'):
+      event, data = frame.split('\n')
+      self.assertTrue(event.startswith('event: ') and data.startswith('data: '))
+      events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+  async def test_context_tokens_and_done_frames(self):
+    chat_model = StreamingChatModel()
+    response, body = await self.stream(chat_model, stream=True, sessionId='abc')
+
+    self.assertEqual(response['Content-Type'], 'text/event-stream')
+    self.assertEqual(response['Cache-Control'], 'no-cache')
+    events = self.events(body)
+    names = [name for name, _ in events]
+    self.assertEqual(names[0], 'context')
+    self.assertEqual(names[-1], 'done')
+    self.assertEqual(set(names[1:-1]), {'token'})
+    self.assertEqual(events[0][1]['session_id'], 'abc')
+    self.assertEqual(events[0][1]['context']['products'][0]['part_number'], 'W10295370A')
+    self.assertEqual(''.join(data['content'] for name, data in events if name == 'token').strip(), chat_model.answer)
+    self.assertIn('usage', events[-1][1])
+
+  async def test_accept_header_selects_streaming(self):
+    service = ChatService(chat_model=StreamingChatModel(), product_service=CountingProductService())
+
+    class View(ChatView):
+      chat_service = service
+
+    request = AsyncRequestFactory().post(
+        '/api/chat/', {'message': 'Hi'}, content_type='application/json', headers={'Accept': 'text/event-stream'}
+    )
+    response = await View.as_view()(request)
+    self.assertTrue(response.streaming)
+    self.assertTrue([chunk async for chunk in response.streaming_content][0].startswith(b'event: context\n'))
+
+  async def test_failure_ends_with_error_frame(self):
+    response, body = await self.stream(BrokenChatModel(), stream=True)
+
+    events = self.events(body)
+    self.assertEqual([name for name, _ in events], ['context', 'error'])
+    self.assertIn('model unavailable', events[-1][1]['error'])
+
+
+@override_settings(OPENAI_API_KEY='sk-test', OPENAI_BASE_URL=None)
+class ClientTests(SimpleTestCase):
+  """The real langchain clients accept the pooled HTTP clients (no request is sent)"""
+
+  async def test_chat_model_uses_pooled_clients(self):
+    model = get_chat_model(temperature=0.1)
+    self.assertIs(model.http_client, get_http_client())
+    self.assertIs(model.http_async_client, get_async_http_client())
+    self.assertIs(get_chat_model(temperature=0.1), model)
+
+  async def test_embeddings_use_pooled_clients(self):
+    embeddings = get_embeddings()
+    self.assertIs(embeddings.http_async_client, get_async_http_client())
+    self.assertIs(get_embeddings(), embeddings)
@@ -1,32 +1,71 @@
-from rest_framework import views, status
-from rest_framework.response import Response
+import json
+from django.http import StreamingHttpResponse
+from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from asgiref.sync import async_to_sync
-from .services.chat_service import ChatService
+from utils.http import APIJSONEncoder, parse_json_body, json_response, error_response
+from .models import ChatSession
+from .services.chat_service import get_chat_service
+
+SESSION_ID_MAX_LENGTH = ChatSession._meta.get_field('session_id').max_length
+
+
+def _wants_stream(request, data) -> bool:
+  return bool(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
+
+async def _sse_events(events):
+  """Render chat events as Server-Sent Events frames"""
+  async for event in events:
+    payload = json.dumps(event['data'], cls=APIJSONEncoder)
+    yield f"event: {event['event']}\ndata: {payload}\n\n"
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class ChatView(views.APIView):
-  def __init__(self, *args, **kwargs):
-    super().__init__(*args, **kwargs)
-    self.chat_service = ChatService()
+class ChatView(View):
+  """Async chat endpoint, served on the event loop under core.asgi.
+
+  Send ``"stream": true`` (or ``Accept: text/event-stream``) to receive the
+  retrieved context followed by completion tokens as Server-Sent Events.
+  Send a ``sessionId`` (any client-chosen string) to keep conversation
+  history; messages without one are answered on their own and nothing is
+  stored for them.
+  """
 
-  def post(self, request):  # Changed from async def to def
-    message = request.data.get('message')
+  @property
+  def chat_service(self):
+    return get_chat_service()
+
+  async def post(self, request):
+    try:
+      data = parse_json_body(request)
+    except ValueError as e:
+      return error_response(str(e), 400)
+
+    message = data.get('message')
     if not message:
-      return Response(
-          {'error': 'Message is required'},
-          status=status.HTTP_400_BAD_REQUEST
+      return error_response('Message is required', 400)
+    session_id = data.get('sessionId')
+    if session_id is not None and (not isinstance(session_id, str) or len(session_id) > SESSION_ID_MAX_LENGTH):
+      return error_response(f'sessionId must be a string of at most {SESSION_ID_MAX_LENGTH} characters', 400)
+
+    if _wants_stream(request, data):
+      events = self.chat_service.stream_chat_response(
+          message,
+          current_url=data.get('currentUrl'),
+          session_id=session_id
       )
+      response = StreamingHttpResponse(_sse_events(events), content_type='text/event-stream')
+      response['Cache-Control'] = 'no-cache'
+      response['X-Accel-Buffering'] = 'no'
+      return response
 
     try:
-      # Convert async to sync
-      get_response = async_to_sync(self.chat_service.get_chat_response)
-      response = get_response(message)
-      return Response(response)
-    except Exception as e:
-      return Response(
-          {'error': str(e)},
-          status=status.HTTP_500_INTERNAL_SERVER_ERROR
+      response = await self.chat_service.get_chat_response(
+          message,
+          current_url=data.get('currentUrl'),
+          session_id=session_id
       )
+      return json_response(response)
+    except Exception as e:
+      return error_response(str(e), 500)
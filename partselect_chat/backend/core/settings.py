@@ -15,9 +15,152 @@ SECRET_KEY = config('SECRET_KEY')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = config('DEBUG', default=False, cast=bool)
 
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-if not OPENAI_API_KEY:
-  raise ValueError("OPENAI_API_KEY not found in environment variables")
+# OPENAI_BASE_URL points the clients at another OpenAI-compatible server, e.g.
+# `manage.py fake_openai` for benchmarks; no API key is needed then. Without
+# either, the first OpenAI call fails rather than startup.
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+OPENAI_BASE_URL = config('OPENAI_BASE_URL', default='') or None
+
+# OpenAI clients are built once per worker and share pooled HTTP connections
+OPENAI_CHAT_MODEL = config('OPENAI_CHAT_MODEL', default='gpt-4o-mini')
+OPENAI_EMBEDDING_MODEL = config('OPENAI_EMBEDDING_MODEL', default='text-embedding-ada-002')
+OPENAI_MAX_CONNECTIONS = config('OPENAI_MAX_CONNECTIONS', default=100, cast=int)
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = config('OPENAI_MAX_KEEPALIVE_CONNECTIONS', default=20, cast=int)
+OPENAI_KEEPALIVE_EXPIRY = config('OPENAI_KEEPALIVE_EXPIRY', default=60.0, cast=float)
+OPENAI_TIMEOUT = config('OPENAI_TIMEOUT', default=60.0, cast=float)
+OPENAI_CONNECT_TIMEOUT = config('OPENAI_CONNECT_TIMEOUT', default=5.0, cast=float)
+OPENAI_MAX_RETRIES = config('OPENAI_MAX_RETRIES', default=2, cast=int)
+
+# Query embedding cache: in-process LRU in front of the QueryEmbedding table
+EMBEDDING_CACHE_ENABLED = config('EMBEDDING_CACHE_ENABLED', default=True, cast=bool)
+EMBEDDING_CACHE_PERSIST = config('EMBEDDING_CACHE_PERSIST', default=True, cast=bool)
+EMBEDDING_CACHE_MAX_ENTRIES = config('EMBEDDING_CACHE_MAX_ENTRIES', default=10000, cast=int)
+EMBEDDING_CACHE_TTL = config('EMBEDDING_CACHE_TTL', default=3600.0, cast=float)
+# Stored query embeddings older than this are deleted by `manage.py prune_embedding_cache`
+EMBEDDING_CACHE_MAX_AGE_DAYS = config('EMBEDDING_CACHE_MAX_AGE_DAYS', default=30, cast=int)
+
+# Vector index on ProductDocument.embedding ('hnsw' or 'ivfflat') and its
+# build / query-time knobs. ef_search also caps how many candidates survive an
+# appliance_type filter, so keep it well above the largest search limit.
+VECTOR_INDEX_TYPE = config('VECTOR_INDEX_TYPE', default='hnsw')
+HNSW_M = config('HNSW_M', default=16, cast=int)
+HNSW_EF_CONSTRUCTION = config('HNSW_EF_CONSTRUCTION', default=64, cast=int)
+HNSW_EF_SEARCH = config('HNSW_EF_SEARCH', default=40, cast=int)
+IVFFLAT_LISTS = config('IVFFLAT_LISTS', default=100, cast=int)
+IVFFLAT_PROBES = config('IVFFLAT_PROBES', default=10, cast=int)
+
+# Quantized vector search: 'none', 'halfvec' or 'binary'. The ANN index is
+# built over the quantized embedding (rebuild_vector_index --quantization) and
+# its top VECTOR_RERANK_CANDIDATES are re-ranked on the full vectors.
+VECTOR_QUANTIZATION = config('VECTOR_QUANTIZATION', default='none')
+VECTOR_RERANK_CANDIDATES = config('VECTOR_RERANK_CANDIDATES', default=100, cast=int)
+
+# Semantic search backend: 'pgvector' (default) or 'numpy', an in-process
+# exact search over a memory-mapped matrix kept fresh by sync_vector_matrix
+PRODUCT_SEARCH_BACKEND = config('PRODUCT_SEARCH_BACKEND', default='pgvector')
+VECTOR_MATRIX_PATH = config('VECTOR_MATRIX_PATH', default=str(BASE_DIR / 'data' / 'product_embeddings.f32'))
+VECTOR_MATRIX_RELOAD_INTERVAL = config('VECTOR_MATRIX_RELOAD_INTERVAL', default=5.0, cast=float)
+
+# Text search mode: 'hybrid' fuses full-text and vector rankings with
+# reciprocal rank fusion, 'vector' is embedding-only and 'lexical' never calls
+# the embedding API. In hybrid mode a full-text top hit ranked at least
+# SEARCH_LEXICAL_CONFIDENCE answers on its own. Ranks are normalized as
+# rank / (rank + 1): a product whose name matches the query scores about
+# 0.33-0.4, a match on the description alone about 0.23.
+PRODUCT_SEARCH_MODE = config('PRODUCT_SEARCH_MODE', default='hybrid')
+SEARCH_LEXICAL_SHORTCUT = config('SEARCH_LEXICAL_SHORTCUT', default=True, cast=bool)
+SEARCH_LEXICAL_CONFIDENCE = config('SEARCH_LEXICAL_CONFIDENCE', default=0.3, cast=float)
+SEARCH_CANDIDATE_MULTIPLIER = config('SEARCH_CANDIDATE_MULTIPLIER', default=4, cast=int)
+SEARCH_RRF_K = config('SEARCH_RRF_K', default=60, cast=int)
+# Largest limit /api/products/search/ honours
+SEARCH_MAX_LIMIT = config('SEARCH_MAX_LIMIT', default=50, cast=int)
+# Queries accepted by one /api/products/search/batch/ request, and the
+# largest per-query limit it honours
+SEARCH_BATCH_MAX_QUERIES = config('SEARCH_BATCH_MAX_QUERIES', default=100, cast=int)
+SEARCH_BATCH_MAX_LIMIT = config('SEARCH_BATCH_MAX_LIMIT', default=20, cast=int)
+
+# Installation guide sections (GuideDocument chunks) added to chat context:
+# at most GUIDE_CHUNK_LIMIT, each within GUIDE_CHUNK_MAX_DISTANCE (L2)
+GUIDE_CHUNK_LIMIT = config('GUIDE_CHUNK_LIMIT', default=3, cast=int)
+GUIDE_CHUNK_MAX_DISTANCE = config('GUIDE_CHUNK_MAX_DISTANCE', default=0.7, cast=float)
+
+# Minimum pg_trgm similarity for a fuzzy part / model number match
+IDENTIFIER_SIMILARITY_CUTOFF = config('IDENTIFIER_SIMILARITY_CUTOFF', default=0.4, cast=float)
+
+# Opt-in semantic cache of chat answers. A question hits when a cached one
+# from the same page is within MAX_DISTANCE (L2 over unit-length embeddings;
+# 0.15 is roughly cosine similarity 0.99).
+CHAT_RESPONSE_CACHE_ENABLED = config('CHAT_RESPONSE_CACHE_ENABLED', default=False, cast=bool)
+CHAT_RESPONSE_CACHE_MAX_DISTANCE = config('CHAT_RESPONSE_CACHE_MAX_DISTANCE', default=0.15, cast=float)
+CHAT_RESPONSE_CACHE_TTL = config('CHAT_RESPONSE_CACHE_TTL', default=3600.0, cast=float)
+
+# Identical concurrent product searches and first chat questions (same
+# normalized text, filters and page) share one computation per ASGI worker
+SINGLE_FLIGHT_ENABLED = config('SINGLE_FLIGHT_ENABLED', default=True, cast=bool)
+
+# Product and installation guide dicts by part number: a per-worker LRU (L1,
+# entries live OBJECT_CACHE_L1_TTL seconds) in front of the shared 'default'
+# cache (L2). Model signals invalidate both tiers on writes.
+OBJECT_CACHE_ENABLED = config('OBJECT_CACHE_ENABLED', default=True, cast=bool)
+OBJECT_CACHE_L1_MAX_ENTRIES = config('OBJECT_CACHE_L1_MAX_ENTRIES', default=2000, cast=int)
+OBJECT_CACHE_L1_TTL = config('OBJECT_CACHE_L1_TTL', default=5.0, cast=float)
+OBJECT_CACHE_TTL = config('OBJECT_CACHE_TTL', default=300.0, cast=float)
+
+# Product detail and installation guide responses carry an ETag and
+# Last-Modified; browsers and proxies revalidate them with a cheap 304.
+# Cache-Control sent with them (empty to omit), e.g. 'public, max-age=60'
+# to skip even the revalidation for a minute.
+DETAIL_CACHE_CONTROL = config('DETAIL_CACHE_CONTROL', default='public, no-cache')
+
+# Rows fetched per server-side cursor round trip by the NDJSON product export
+PRODUCT_EXPORT_CHUNK_SIZE = config('PRODUCT_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Chat retrieval stages run concurrently, each bounded by its own timeout (seconds)
+CHAT_RETRIEVAL_TIMEOUT = config('CHAT_RETRIEVAL_TIMEOUT', default=10.0, cast=float)
+CHAT_PAGE_CONTEXT_TIMEOUT = config('CHAT_PAGE_CONTEXT_TIMEOUT', default=2.0, cast=float)
+CHAT_MODEL_LOOKUP_TIMEOUT = config('CHAT_MODEL_LOOKUP_TIMEOUT', default=2.0, cast=float)
+# Compatible parts listed per model number detected in a chat message
+CHAT_MODEL_PARTS_LIMIT = config('CHAT_MODEL_PARTS_LIMIT', default=20, cast=int)
+# Tokens of retrieved context (products, guide sections, model parts) per
+# prompt; compatibility lists and descriptions are trimmed to fit
+CHAT_CONTEXT_TOKEN_BUDGET = config('CHAT_CONTEXT_TOKEN_BUDGET', default=1500, cast=int)
+# Where tiktoken keeps its BPE files; fill it with `manage.py warm_tokenizer`
+# at build time. Without it, token counts are estimated from characters.
+TIKTOKEN_CACHE_DIR = config('TIKTOKEN_CACHE_DIR', default=str(BASE_DIR / 'data' / 'tiktoken'))
+# Conversation memory: the last CHAT_HISTORY_WINDOW messages go into the
+# prompt; once CHAT_SUMMARY_BATCH more have built up, the older ones are
+# folded into a rolling summary. New messages are written in bulk
+# CHAT_HISTORY_FLUSH_INTERVAL seconds after the response.
+CHAT_HISTORY_WINDOW = config('CHAT_HISTORY_WINDOW', default=6, cast=int)
+CHAT_SUMMARY_BATCH = config('CHAT_SUMMARY_BATCH', default=6, cast=int)
+CHAT_HISTORY_FLUSH_INTERVAL = config('CHAT_HISTORY_FLUSH_INTERVAL', default=0.5, cast=float)
+
+# Observability: per-stage timings (db, embedding, llm, ...) go to a
+# Server-Timing response header, Prometheus histograms at /metrics and DEBUG
+# logs. LOG_LEVEL=WARNING silences the per-request lines. The header shows
+# internals to every client, so it is off unless DEBUG. /metrics answers
+# METRICS_ALLOWED_IPS, or any client sending "Authorization: Bearer
+# <METRICS_TOKEN>" when a token is set.
+SERVER_TIMING_ENABLED = config('SERVER_TIMING_ENABLED', default=DEBUG, cast=bool)
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=Csv())
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        app: {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False}
+        for app in ('chat', 'products', 'utils')
+    },
+}
 
 ALLOWED_HOSTS = config('ALLOWED_HOSTS', cast=Csv())
 
@@ -29,15 +172,20 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    # Trigram lookups (trigram_similar) for fuzzy part / model numbers
+    'django.contrib.postgres',
     # Third party apps
     'rest_framework',
     'corsheaders',
     # Local apps
     'chat',
     'products',
+    'benchmarks',
 ]
 
 MIDDLEWARE = [
+    # First, so its spans and total cover the whole request
+    'utils.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -67,6 +215,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
 
 # Database
 DATABASES = {
@@ -80,6 +229,16 @@ DATABASES = {
     }
 }
 
+# Cache shared by all workers. The in-memory default is per process; use
+# django.core.cache.backends.redis.RedisCache (CACHE_LOCATION=redis://...)
+# when running more than one worker.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='partselect'),
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -1,8 +1,10 @@
 from django.contrib import admin
 from django.urls import path, include
+from utils.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/chat/', include('chat.urls')),
     path('api/products/', include('products.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -0,0 +1,65 @@
+from typing import List, Optional, Tuple
+import re
+
+
+# Checked in order: 'Safety Instructions' is safety, not steps, and
+# '4. Testing' inside the steps list starts the testing section
+SECTION_KEYWORDS = [
+    ('safety', ('safety', 'warning', 'caution', 'precaution')),
+    ('tools', ('tool', 'material', 'supplies', 'you will need', 'parts needed')),
+    ('testing', ('test', 'verif', 'troubleshoot', 'check')),
+    ('steps', ('step', 'install', 'remov', 'prepar', 'replac', 'procedure', 'instruction')),
+]
+
+HEADING = re.compile(r'^\s*(?:\d+[.)]\s*)?([A-Za-z][A-Za-z /&\-]{1,50}):\s*$')
+
+
+def heading_section(line: str) -> Optional[str]:
+  """Section a heading line such as 'Tools Required:' opens, if any"""
+  match = HEADING.match(line)
+  if not match:
+    return None
+  title = match.group(1).lower()
+  for section, keywords in SECTION_KEYWORDS:
+    if any(keyword in title for keyword in keywords):
+      return section
+  return None
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+  """Split text at paragraph boundaries into pieces of at most ~max_chars"""
+  pieces, current = [], ''
+  for paragraph in re.split(r'\n\s*\n', text):
+    if current and len(current) + len(paragraph) + 2 > max_chars:
+      pieces.append(current)
+      current = paragraph
+    else:
+      current = f"{current}\n\n{paragraph}" if current else paragraph
+  if current:
+    pieces.append(current)
+  return pieces
+
+
+def split_guide(content: str, max_chars: int = 1200) -> List[Tuple[str, str]]:
+  """Split an installation guide into (section, text) chunks.
+
+  Sections are overview (text before the first heading), safety, tools,
+  steps and testing. Consecutive headings of the same section stay in one
+  chunk; headings that match no section continue the current one.
+  """
+  chunks = []
+  section, lines = 'overview', []
+
+  def flush():
+    text = '\n'.join(lines).strip()
+    if text:
+      chunks.extend((section, piece) for piece in _split_long(text, max_chars))
+
+  for line in content.splitlines():
+    opened = heading_section(line)
+    if opened and opened != section:
+      flush()
+      section, lines = opened, []
+    lines.append(line)
+  flush()
+  return chunks
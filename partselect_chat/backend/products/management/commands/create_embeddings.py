@@ -1,50 +1,59 @@
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from asgiref.sync import sync_to_async
-from products.models import Product, InstallationGuide
-from products.services.product_service import ProductService
+from products.services.embedding_pipeline import EmbeddingPipeline, SOURCES
+from utils.clients import get_embeddings
 import asyncio
+import time
 
 
 class Command(BaseCommand):
-  help = 'Create vector embeddings for products and guides'
-
-  def handle(self, *args, **kwargs):
-    service = ProductService()
-
-    async def create_all_embeddings():
-      # Get all products using sync_to_async
-      products = await sync_to_async(list)(Product.objects.all())
-      self.stdout.write(f'Found {len(products)} products')
-
-      for product in products:
-        try:
-          await service.create_product_embedding(product)
-          self.stdout.write(f'Created embedding for product {product.part_number}')
-        except Exception as e:
-          self.stdout.write(
-              self.style.ERROR(
-                  f'Error creating embedding for {product.part_number}: {str(e)}'
-              )
-          )
-
-      # Get all guides using sync_to_async
-      guides = await sync_to_async(list)(InstallationGuide.objects.all())
-      self.stdout.write(f'Found {len(guides)} installation guides')
-
-      for guide in guides:
-        try:
-          await service.create_guide_embedding(guide)
-          self.stdout.write(
-              f'Created embedding for guide of {guide.product.part_number}'
-          )
-        except Exception as e:
-          self.stdout.write(
-              self.style.ERROR(
-                  f'Error creating embedding for guide: {str(e)}'
-              )
-          )
-
-    # Run the async function
-    asyncio.run(create_all_embeddings())
-    self.stdout.write(self.style.SUCCESS('Successfully created all embeddings'))
+  help = (
+      'Create or refresh vector embeddings for products and guides. Unchanged rows '
+      'are skipped and an interrupted run resumes from its checkpoint.'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+        '--source',
+        choices=[*SOURCES, 'all'],
+        default='all',
+        help='Which documents to embed',
+    )
+    parser.add_argument('--batch-size', type=int, default=256, help='Texts per embeddings request')
+    parser.add_argument('--concurrency', type=int, default=4, help='Embeddings requests in flight')
+    parser.add_argument('--chunk-size', type=int, help='Rows read per query (default batch size x concurrency)')
+    parser.add_argument(
+        '--restart',
+        action='store_true',
+        help='Ignore any checkpoint and start from the first row',
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Re-embed rows even when their content hash is unchanged',
+    )
+
+  def handle(self, *args, **options):
+    pipeline = EmbeddingPipeline(
+        get_embeddings(),
+        batch_size=options['batch_size'],
+        concurrency=options['concurrency'],
+        log=self.stdout.write,
+    )
+    sources = list(SOURCES) if options['source'] == 'all' else [options['source']]
+
+    async def run_all():
+      for source in sources:
+        started = time.perf_counter()
+        stats = await pipeline.run(
+            source,
+            resume=not options['restart'],
+            force=options['force'],
+            chunk_size=options['chunk_size'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{source}: embedded {stats['embedded']} of {stats['seen']} rows "
+            f"({stats['skipped']} unchanged) in {elapsed:.1f}s"
+        ))
+
+    asyncio.run(run_all())
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from products.models import ProductDocument, QueryEmbedding
+from products.services.search_backends import PgVectorBackend, recall_at_k
+from products.services.vector_index import QUANTIZATIONS, search_params_sql
+
+INDEX_SIZES_SQL = """
+SELECT indexrelname, pg_relation_size(indexrelid)
+FROM pg_stat_user_indexes
+WHERE relname = 'products_productdocument' AND indexrelname LIKE 'products_productdocument_embedding%'
+ORDER BY indexrelname
+"""
+
+
+class Command(BaseCommand):
+  help = (
+      'Report recall@k of vector search against an exact scan, per quantization, '
+      'together with the size of the ProductDocument vector indexes'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--k', type=int, default=10, help='Results compared per query')
+    parser.add_argument('--queries', type=int, default=100, help='Query vectors to sample')
+    parser.add_argument(
+        '--quantization',
+        action='append',
+        choices=list(QUANTIZATIONS),
+        help='Search mode to measure; repeat for several (default: VECTOR_QUANTIZATION)',
+    )
+    parser.add_argument(
+        '--candidates',
+        type=int,
+        default=settings.VECTOR_RERANK_CANDIDATES,
+        help='Quantized candidates re-ranked on full vectors',
+    )
+
+  def handle(self, *args, **options):
+    # Real search queries when the embedding cache has them, else product vectors
+    queries = list(
+        QueryEmbedding.objects.order_by('-created_at').values_list('embedding', flat=True)[:options['queries']]
+    )
+    if len(queries) < options['queries']:
+      queries += list(
+          ProductDocument.objects.order_by('?').values_list('embedding', flat=True)[
+              :options['queries'] - len(queries)
+          ]
+      )
+    if not queries:
+      raise CommandError('No query embeddings or product documents to measure with')
+
+    with connection.cursor() as cursor:
+      cursor.execute(INDEX_SIZES_SQL)
+      indexes = cursor.fetchall()
+    rows = ProductDocument.objects.count()
+    for name, size in indexes:
+      per_row = size / rows if rows else 0
+      self.stdout.write(f"{name}: {size / 2 ** 20:.1f} MiB, {per_row:.0f} bytes per product")
+    if not indexes:
+      self.stdout.write(self.style.WARNING('No vector index found; searches are sequential scans'))
+
+    for quantization in options['quantization'] or [settings.VECTOR_QUANTIZATION]:
+      backend = PgVectorBackend(quantization=quantization, rerank_candidates=options['candidates'])
+      ef_search = max(settings.HNSW_EF_SEARCH, options['candidates'] if quantization != 'none' else 0)
+      with connection.cursor() as cursor:
+        cursor.execute(search_params_sql(ef_search=ef_search))
+      try:
+        result = recall_at_k(backend, queries, options['k'])
+      finally:
+        with connection.cursor() as cursor:
+          cursor.execute(search_params_sql())
+      self.stdout.write(self.style.SUCCESS(
+          f"{quantization}: recall@{result['k']} {result['recall']:.3f} over {result['queries']} queries, "
+          f"{result['mean_ms']:.1f}ms per search"
+      ))
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products.services.embedding_cache import prune_persisted
+
+
+class Command(BaseCommand):
+  help = 'Delete stored query embeddings older than EMBEDDING_CACHE_MAX_AGE_DAYS; run it periodically'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--max-age-days', type=int, default=settings.EMBEDDING_CACHE_MAX_AGE_DAYS)
+
+  def handle(self, *args, **options):
+    deleted = prune_persisted(options['max_age_days'])
+    self.stdout.write(self.style.SUCCESS(
+        f"Deleted {deleted} query embeddings older than {options['max_age_days']} days"
+    ))
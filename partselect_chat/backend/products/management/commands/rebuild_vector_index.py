@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from products.services.vector_index import (
+    create_index_sql, drop_index_sql, all_index_names, index_name, INDEX_NAMES, QUANTIZATIONS
+)
+import time
+
+
+class Command(BaseCommand):
+  help = (
+      'Rebuild the ProductDocument embedding index as HNSW or IVFFlat, over the full '
+      'vectors or a halfvec / binary quantization of them (set VECTOR_QUANTIZATION to match)'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--method', choices=sorted(INDEX_NAMES), default='hnsw')
+    parser.add_argument(
+        '--quantization',
+        choices=list(QUANTIZATIONS),
+        default=settings.VECTOR_QUANTIZATION,
+        help='Index the full vectors or a quantized copy (default: VECTOR_QUANTIZATION)'
+    )
+    parser.add_argument('--lists', type=int, help='IVFFlat lists (about rows / 1000)')
+    parser.add_argument('--m', type=int, help='HNSW max connections per layer')
+    parser.add_argument('--ef-construction', type=int, help='HNSW build candidate list size')
+    parser.add_argument(
+        '--maintenance-work-mem',
+        default='1GB',
+        help='Memory for the build; HNSW builds are much faster when the graph fits'
+    )
+
+  def handle(self, *args, **options):
+    method = options['method']
+    quantization = options['quantization']
+    name = index_name(method, quantization)
+    if method == 'ivfflat' and not options['lists']:
+      from products.models import ProductDocument
+      # pgvector recommends rows / 1000 lists up to 1M rows
+      options['lists'] = max(ProductDocument.objects.count() // 1000, 10)
+
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+      cursor.execute(f"SET maintenance_work_mem = '{options['maintenance_work_mem']}'")
+      # Build the new index before dropping the old one so searches stay indexed
+      new_name = f'{name}_new'
+      cursor.execute(drop_index_sql(method, name=new_name))
+      cursor.execute(create_index_sql(
+          method,
+          name=new_name,
+          lists=options['lists'],
+          m=options['m'],
+          ef_construction=options['ef_construction'],
+          quantization=quantization,
+      ))
+      for existing in all_index_names():
+        cursor.execute(drop_index_sql(method, name=existing))
+      cursor.execute(f"ALTER INDEX {new_name} RENAME TO {name}")
+      cursor.execute("ANALYZE products_productdocument")
+
+    self.stdout.write(self.style.SUCCESS(
+        f'Built {method} index {name} in {time.perf_counter() - started:.1f}s'
+    ))
+    if quantization != settings.VECTOR_QUANTIZATION:
+      self.stdout.write(self.style.WARNING(
+          f'Set VECTOR_QUANTIZATION={quantization} so searches use the new index'
+      ))
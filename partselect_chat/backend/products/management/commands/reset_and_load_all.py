@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from products.models import Product, ProductDocument, InstallationGuide, ModelCompatibility
+from products.services.embedding_pipeline import content_hash
 from products.services.product_service import ProductService
 import random
 import asyncio
@@ -184,7 +186,8 @@ For technical support: 1-800-PARTSELECT"""
             embedding = await service.embeddings.aembed_query(text)
             await sync_to_async(ProductDocument.objects.create)(
                 product=product,
-                embedding=embedding
+                embedding=embedding,
+                content_hash=content_hash(text, settings.OPENAI_EMBEDDING_MODEL)
             )
 
           # Create installation guide
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from products.services.search_backends import get_vector_matrix
+import time
+
+
+class Command(BaseCommand):
+  help = 'Sync the memory-mapped embedding matrix used by the numpy search backend'
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help='Rebuild from scratch instead of applying changes since the last sync',
+    )
+    parser.add_argument('--chunk-size', type=int, default=5000)
+
+  def handle(self, *args, **options):
+    matrix = get_vector_matrix()
+    matrix.path.parent.mkdir(parents=True, exist_ok=True)
+
+    started = time.perf_counter()
+    result = matrix.sync(full=options['full'], chunk_size=options['chunk_size'])
+    self.stdout.write(self.style.SUCCESS(
+        f"Synced {matrix.path}: {result['appended']} added, {result['updated']} updated, "
+        f"{result['removed']} removed, {result['rows']} rows "
+        f"in {time.perf_counter() - started:.1f}s"
+    ))
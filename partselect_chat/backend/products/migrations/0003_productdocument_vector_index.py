@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('products', '0002_queryembedding'),
+    ]
+
+    # Literal SQL so the migration does not change with later code or
+    # settings: HNSW with pgvector's default build parameters. To apply other
+    # HNSW_* settings, or IVFFlat (which needs rows to train its lists), run
+    # `manage.py rebuild_vector_index` after loading data.
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS products_productdocument_embedding_hnsw "
+            "ON products_productdocument USING hnsw (embedding vector_l2_ops) "
+            "WITH (m = 16, ef_construction = 64)",
+            [
+                "DROP INDEX CONCURRENTLY IF EXISTS products_productdocument_embedding_hnsw",
+                "DROP INDEX CONCURRENTLY IF EXISTS products_productdocument_embedding_ivfflat",
+            ],
+        ),
+    ]
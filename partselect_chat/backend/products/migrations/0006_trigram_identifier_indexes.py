@@ -0,0 +1,24 @@
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('products', '0005_product_search_gin'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['part_number'], name='products_part_number_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='modelcompatibility',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['model_number'], name='products_model_number_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
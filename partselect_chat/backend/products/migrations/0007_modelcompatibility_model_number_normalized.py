@@ -0,0 +1,29 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('products', '0006_trigram_identifier_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelcompatibility',
+            name='model_number_normalized',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        # Same normalization as products.normalization.normalize_identifier
+        migrations.RunSQL(
+            "UPDATE products_modelcompatibility "
+            "SET model_number_normalized = regexp_replace(upper(model_number), '[^A-Z0-9]', '', 'g')",
+            migrations.RunSQL.noop,
+        ),
+        AddIndexConcurrently(
+            model_name='modelcompatibility',
+            index=models.Index(fields=['model_number_normalized', 'product'], name='products_model_norm_prod_idx'),
+        ),
+    ]
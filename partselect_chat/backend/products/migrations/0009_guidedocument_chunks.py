@@ -0,0 +1,48 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('products', '0008_embedding_pipeline'),
+    ]
+
+    operations = [
+        # Whole-guide embeddings are replaced by per-section chunks; rerun
+        # create_embeddings --source guides after migrating
+        migrations.RunSQL("DELETE FROM products_guidedocument", migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name='guidedocument',
+            name='guide',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='products.installationguide'),
+        ),
+        migrations.AddField(
+            model_name='guidedocument',
+            name='section',
+            field=models.CharField(choices=[('overview', 'Overview'), ('safety', 'Safety'), ('tools', 'Tools'), ('steps', 'Steps'), ('testing', 'Testing')], default='overview', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='guidedocument',
+            name='position',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='guidedocument',
+            name='content',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AlterUniqueTogether(
+            name='guidedocument',
+            unique_together={('guide', 'position')},
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS products_guidedocument_embedding_hnsw "
+            "ON products_guidedocument USING hnsw (embedding vector_l2_ops) "
+            "WITH (m = 16, ef_construction = 64)",
+            "DROP INDEX CONCURRENTLY IF EXISTS products_guidedocument_embedding_hnsw",
+        ),
+    ]
@@ -1,5 +1,9 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
 from pgvector.django import VectorField
+from .chunking import split_guide
+from .normalization import normalize_identifier
 
 
 class Product(models.Model):
@@ -10,7 +14,11 @@ class Product(models.Model):
 
   class Meta:
     indexes = [
-        models.Index(fields=['part_number']),  # B-tree index for fast lookups
+        models.Index(fields=['part_number']),
+        # Keyset order of the product listing
+        models.Index(fields=['appliance_type', 'id'], name='products_appliance_id_idx'),
+        GinIndex(fields=['search_vector'], name='products_product_search_gin'),
+        GinIndex(fields=['part_number'], name='products_part_number_trgm', opclasses=['gin_trgm_ops']),
     ]
 
   part_number = models.CharField(max_length=50, unique=True, db_index=True)
@@ -21,10 +29,24 @@ class Product(models.Model):
   stock_quantity = models.IntegerField(default=0)
   created_at = models.DateTimeField(auto_now_add=True)
   updated_at = models.DateTimeField(auto_now=True)
+  # Full-text document over name and description, maintained by Postgres
+  search_vector = models.GeneratedField(
+      expression=(
+          SearchVector('name', weight='A', config='english')
+          + SearchVector('description', weight='B', config='english')
+      ),
+      output_field=SearchVectorField(),
+      db_persist=True,
+  )
 
   def __str__(self):
     return f"{self.part_number} - {self.name}"
 
+  def save(self, *args, **kwargs):
+    # Exact part-number lookups match on the normalized form
+    self.part_number = normalize_identifier(self.part_number)
+    super().save(*args, **kwargs)
+
   def get_document_text(self):
     """Get text representation for embedding"""
     return f"""PART_NUMBER: {self.part_number} 
@@ -36,9 +58,14 @@ class ProductDocument(models.Model):
   """Store document embeddings for vector search"""
   product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='document')
   embedding = VectorField(dimensions=1536)
+  # Hash of the embedding model and embedded text; unchanged rows are skipped
+  content_hash = models.CharField(max_length=64, blank=True, default='')
   created_at = models.DateTimeField(auto_now_add=True)
   updated_at = models.DateTimeField(auto_now=True)
 
+  def get_document_text(self):
+    return self.product.get_document_text()
+
 
 class InstallationGuide(models.Model):
   product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='installation_guides')
@@ -49,79 +76,53 @@ class InstallationGuide(models.Model):
   def __str__(self):
     return f"Installation Guide for {self.product.part_number}"
 
-  from django.db import models
-
-
-class Product(models.Model):
-  APPLIANCE_TYPES = [
-      ('REFRIGERATOR', 'Refrigerator'),
-      ('DISHWASHER', 'Dishwasher'),
-  ]
-
-  class Meta:
-    indexes = [
-        models.Index(fields=['part_number']),
+  def get_chunks(self):
+    """GuideDocument rows (unsaved, without embeddings) for each section"""
+    return [
+        GuideDocument(guide=self, section=section, position=position, content=text)
+        for position, (section, text) in enumerate(split_guide(self.content))
     ]
 
-  part_number = models.CharField(max_length=50, unique=True, db_index=True)
-  name = models.CharField(max_length=200)
-  description = models.TextField()
-  appliance_type = models.CharField(max_length=20, choices=APPLIANCE_TYPES)
-  price = models.DecimalField(max_digits=10, decimal_places=2)
-  stock_quantity = models.IntegerField(default=0)
-  created_at = models.DateTimeField(auto_now_add=True)
-  updated_at = models.DateTimeField(auto_now=True)
-
-  def __str__(self):
-    return f"{self.part_number} - {self.name}"
-
-  def get_document_text(self):
-    """Get text representation for embedding"""
-    return f"""PART_NUMBER: {self.part_number} 
-NAME: {self.name}
-TYPE: {self.appliance_type}"""
 
+class GuideDocument(models.Model):
+  """Embedded section of an installation guide, the unit of guide retrieval"""
+  SECTIONS = [
+      ('overview', 'Overview'),
+      ('safety', 'Safety'),
+      ('tools', 'Tools'),
+      ('steps', 'Steps'),
+      ('testing', 'Testing'),
+  ]
 
-class ProductDocument(models.Model):
-  """Store document embeddings for vector search"""
-  product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='document')
+  guide = models.ForeignKey(InstallationGuide, on_delete=models.CASCADE, related_name='chunks')
+  section = models.CharField(max_length=20, choices=SECTIONS, default='overview')
+  position = models.PositiveSmallIntegerField(default=0)
+  content = models.TextField(blank=True, default='')
   embedding = VectorField(dimensions=1536)
+  content_hash = models.CharField(max_length=64, blank=True, default='')
   created_at = models.DateTimeField(auto_now_add=True)
   updated_at = models.DateTimeField(auto_now=True)
 
-
-class InstallationGuide(models.Model):
-  product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='installation_guides')
-  content = models.TextField()
-  created_at = models.DateTimeField(auto_now_add=True)
-  updated_at = models.DateTimeField(auto_now=True)
+  class Meta:
+    unique_together = ['guide', 'position']
 
   def __str__(self):
-    return f"Installation Guide for {self.product.part_number}"
+    return f"{self.guide} [{self.section} {self.position}]"
 
   def get_document_text(self):
     """Get text representation for embedding"""
-    return f"""INSTALLATION GUIDE FOR PART {self.product.part_number}
-PRODUCT: {self.product.name}
-TYPE: {self.product.appliance_type}
-INSTALLATION INSTRUCTIONS
-HOW TO INSTALL {self.product.part_number}
-HOW TO REPLACE {self.product.part_number}
-STEPS TO INSTALL {self.product.name}
-{self.content[:50]}"""
-
-
-class GuideDocument(models.Model):
-  """Store document embeddings for vector search"""
-  guide = models.OneToOneField(InstallationGuide, on_delete=models.CASCADE, related_name='document')
-  embedding = VectorField(dimensions=1536)
-  created_at = models.DateTimeField(auto_now_add=True)
-  updated_at = models.DateTimeField(auto_now=True)
+    product = self.guide.product
+    return f"""INSTALLATION GUIDE FOR PART {product.part_number}
+PRODUCT: {product.name}
+SECTION: {self.get_section_display().upper()}
+{self.content}"""
 
 
 class ModelCompatibility(models.Model):
   product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='compatible_models')
   model_number = models.CharField(max_length=100)
+  # model_number in normalize_identifier form, for "parts for my model" lookups
+  model_number_normalized = models.CharField(max_length=100, editable=False, default='')
   brand = models.CharField(max_length=100)
   notes = models.TextField(blank=True)
   created_at = models.DateTimeField(auto_now_add=True)
@@ -130,30 +131,40 @@ class ModelCompatibility(models.Model):
   class Meta:
     verbose_name_plural = "Model compatibilities"
     unique_together = ['product', 'model_number']
+    indexes = [
+        GinIndex(fields=['model_number'], name='products_model_number_trgm', opclasses=['gin_trgm_ops']),
+        # Serves lookups by model and keyset pagination over its parts
+        models.Index(fields=['model_number_normalized', 'product'], name='products_model_norm_prod_idx'),
+    ]
 
   def __str__(self):
     return f"{self.product.part_number} - {self.model_number}"
 
+  def save(self, *args, **kwargs):
+    self.model_number_normalized = normalize_identifier(self.model_number)
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'model_number' in update_fields:
+      kwargs['update_fields'] = {*update_fields, 'model_number_normalized'}
+    super().save(*args, **kwargs)
 
-class GuideDocument(models.Model):
-  """Store document embeddings for vector search"""
-  guide = models.OneToOneField(InstallationGuide, on_delete=models.CASCADE, related_name='document')
+
+class QueryEmbedding(models.Model):
+  """Durable cache of search query embeddings, keyed by model and normalized text"""
+  key = models.CharField(max_length=64, unique=True)
+  model = models.CharField(max_length=100)
+  query = models.TextField()
   embedding = VectorField(dimensions=1536)
   created_at = models.DateTimeField(auto_now_add=True)
-  updated_at = models.DateTimeField(auto_now=True)
 
+  def __str__(self):
+    return f"{self.model}: {self.query[:50]}"
 
-class ModelCompatibility(models.Model):
-  product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='compatible_models')
-  model_number = models.CharField(max_length=100)
-  brand = models.CharField(max_length=100)
-  notes = models.TextField(blank=True)
-  created_at = models.DateTimeField(auto_now_add=True)
-  updated_at = models.DateTimeField(auto_now=True)
 
-  class Meta:
-    verbose_name_plural = "Model compatibilities"
-    unique_together = ['product', 'model_number']
+class EmbeddingCheckpoint(models.Model):
+  """Progress of an interrupted create_embeddings run, by last processed id"""
+  name = models.CharField(max_length=50, unique=True)
+  last_id = models.BigIntegerField(default=0)
+  updated_at = models.DateTimeField(auto_now=True)
 
   def __str__(self):
-    return f"{self.product.part_number} - {self.model_number}"
+    return f"{self.name} @ {self.last_id}"
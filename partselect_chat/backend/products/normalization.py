@@ -0,0 +1,6 @@
+import re
+
+
+def normalize_identifier(value: str) -> str:
+  """Canonical form of a part or model number: upper case, letters and digits only"""
+  return re.sub(r'[^A-Z0-9]', '', value.upper())
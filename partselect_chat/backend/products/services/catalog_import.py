@@ -0,0 +1,269 @@
+from typing import Dict, Iterable, Iterator, List, Optional
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from django.db import connection, transaction
+import csv
+import io
+import json
+import time
+from ..models import Product, InstallationGuide, ModelCompatibility
+from ..normalization import normalize_identifier
+from ..signals import products_bulk_updated
+
+
+APPLIANCE_TYPES = {value for value, _ in Product.APPLIANCE_TYPES}
+
+PRODUCT_COLUMNS = [
+    'seq', 'part_number', 'name', 'description', 'appliance_type', 'price', 'stock_quantity', 'guide'
+]
+COMPAT_COLUMNS = ['seq', 'part_number', 'model_number', 'model_number_normalized', 'brand']
+
+STAGING_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS import_products (
+    seq bigint, part_number text, name text, description text, appliance_type text,
+    price numeric(10, 2), stock_quantity integer, guide text
+);
+CREATE TEMP TABLE IF NOT EXISTS import_compat (
+    seq bigint, part_number text, model_number text, model_number_normalized text, brand text
+)
+"""
+
+# Staged rows are deduplicated (last occurrence wins) before every upsert, since
+# ON CONFLICT cannot touch the same row twice in one statement
+CHANGED_STOCK_SQL = """
+SELECT s.part_number
+FROM (SELECT DISTINCT ON (part_number) * FROM import_products ORDER BY part_number, seq DESC) s
+JOIN {product} p ON p.part_number = s.part_number
+WHERE (p.price, p.stock_quantity) IS DISTINCT FROM (s.price, s.stock_quantity)
+"""
+
+UPSERT_PRODUCTS_SQL = """
+INSERT INTO {product} AS p
+    (part_number, name, description, appliance_type, price, stock_quantity, created_at, updated_at)
+SELECT DISTINCT ON (part_number)
+    part_number, name, description, appliance_type, price, stock_quantity, now(), now()
+FROM import_products
+ORDER BY part_number, seq DESC
+ON CONFLICT (part_number) DO UPDATE SET
+    name = EXCLUDED.name,
+    description = EXCLUDED.description,
+    appliance_type = EXCLUDED.appliance_type,
+    price = EXCLUDED.price,
+    stock_quantity = EXCLUDED.stock_quantity,
+    updated_at = EXCLUDED.updated_at
+WHERE (p.name, p.description, p.appliance_type, p.price, p.stock_quantity)
+    IS DISTINCT FROM
+    (EXCLUDED.name, EXCLUDED.description, EXCLUDED.appliance_type, EXCLUDED.price, EXCLUDED.stock_quantity)
+RETURNING (xmax = 0), part_number
+"""
+
+UPDATE_GUIDES_SQL = """
+UPDATE {guide} g
+SET content = s.guide, updated_at = now()
+FROM (SELECT DISTINCT ON (part_number) * FROM import_products ORDER BY part_number, seq DESC) s
+JOIN {product} p ON p.part_number = s.part_number
+WHERE g.product_id = p.id AND s.guide <> '' AND g.content IS DISTINCT FROM s.guide
+RETURNING s.part_number
+"""
+
+INSERT_GUIDES_SQL = """
+INSERT INTO {guide} (product_id, content, created_at, updated_at)
+SELECT p.id, s.guide, now(), now()
+FROM (SELECT DISTINCT ON (part_number) * FROM import_products ORDER BY part_number, seq DESC) s
+JOIN {product} p ON p.part_number = s.part_number
+WHERE s.guide <> '' AND NOT EXISTS (SELECT 1 FROM {guide} g WHERE g.product_id = p.id)
+RETURNING (SELECT part_number FROM {product} WHERE id = product_id)
+"""
+
+UPSERT_COMPAT_SQL = """
+INSERT INTO {compat} AS m
+    (product_id, model_number, model_number_normalized, brand, notes, created_at, updated_at)
+SELECT DISTINCT ON (p.id, c.model_number)
+    p.id, c.model_number, c.model_number_normalized, c.brand, '', now(), now()
+FROM import_compat c
+JOIN {product} p ON p.part_number = c.part_number
+ORDER BY p.id, c.model_number, c.seq DESC
+ON CONFLICT (product_id, model_number) DO UPDATE SET
+    brand = EXCLUDED.brand,
+    updated_at = EXCLUDED.updated_at
+WHERE m.brand IS DISTINCT FROM EXCLUDED.brand
+RETURNING (SELECT part_number FROM {product} WHERE id = product_id)
+"""
+
+
+class CatalogRowError(ValueError):
+  pass
+
+
+def read_rows(path: Path, file_format: Optional[str] = None) -> Iterator[Dict]:
+  """Stream feed rows as dicts from a CSV or JSONL file, one line at a time"""
+  file_format = file_format or ('jsonl' if path.suffix in ('.jsonl', '.ndjson') else 'csv')
+  with path.open(newline='', encoding='utf-8') as f:
+    if file_format == 'csv':
+      yield from csv.DictReader(f)
+    else:
+      for line in f:
+        if line.strip():
+          yield json.loads(line)
+
+
+def _compatible_models(row: Dict) -> List[Dict]:
+  """Feed compatibility as [{'model_number', 'brand'}].
+
+  JSONL rows may list strings or objects; CSV rows carry a pipe-separated
+  ``compatible_models`` column that shares the row's ``brand``.
+  """
+  models = row.get('compatible_models') or []
+  if isinstance(models, str):
+    models = [m.strip() for m in models.split('|') if m.strip()]
+  brand = row.get('brand') or ''
+  return [
+      m if isinstance(m, dict) else {'model_number': m, 'brand': brand}
+      for m in models
+  ]
+
+
+def clean_row(row: Dict) -> Dict:
+  """Validate a feed row; raises CatalogRowError naming the bad field"""
+  # Stored normalized, the form every exact part-number lookup uses
+  part_number = normalize_identifier(row.get('part_number') or '')
+  if not part_number:
+    raise CatalogRowError('missing part_number')
+  appliance_type = (row.get('appliance_type') or '').strip().upper()
+  if appliance_type not in APPLIANCE_TYPES:
+    raise CatalogRowError(f'unknown appliance_type {appliance_type!r}')
+  try:
+    price = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+    stock_quantity = int(row.get('stock_quantity') or 0)
+  except (InvalidOperation, ValueError):
+    raise CatalogRowError('invalid price or stock_quantity')
+
+  return {
+      'part_number': part_number,
+      'name': (row.get('name') or '').strip(),
+      'description': row.get('description') or '',
+      'appliance_type': appliance_type,
+      'price': price,
+      'stock_quantity': stock_quantity,
+      'guide': row.get('installation_guide') or '',
+      'compatible_models': [
+          {
+              'model_number': m['model_number'].strip(),
+              'brand': (m.get('brand') or '').strip(),
+          }
+          for m in _compatible_models(row) if m.get('model_number', '').strip()
+      ],
+  }
+
+
+class CatalogImporter:
+  """Bulk upsert of a supplier feed through COPY-loaded staging tables.
+
+  Rows are validated and buffered one chunk at a time, COPYed into temp
+  tables and merged with a handful of set-based statements per chunk, so
+  memory is bounded by chunk_size however large the feed is. Statements
+  skip rows that did not change, leaving their updated_at untouched.
+  """
+
+  def __init__(self, chunk_size: int = 20000, log=None):
+    self.chunk_size = chunk_size
+    self.log = log or print
+    self.tables = {
+        'product': Product._meta.db_table,
+        'guide': InstallationGuide._meta.db_table,
+        'compat': ModelCompatibility._meta.db_table,
+    }
+
+  def _sql(self, template: str) -> str:
+    return template.format(**self.tables)
+
+  def _copy(self, cursor, table: str, columns: List[str], rows: Iterable[List]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        # Only \N is NULL, so empty names and guides stay empty strings
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+        buffer
+    )
+
+  def _merge_chunk(self, chunk: List[Dict]) -> Dict:
+    with transaction.atomic(), connection.cursor() as cursor:
+      cursor.execute("TRUNCATE import_products, import_compat")
+      self._copy(cursor, 'import_products', PRODUCT_COLUMNS, (
+          [row['seq'], row['part_number'], row['name'], row['description'], row['appliance_type'],
+           row['price'], row['stock_quantity'], row['guide']]
+          for row in chunk
+      ))
+      self._copy(cursor, 'import_compat', COMPAT_COLUMNS, (
+          [row['seq'], row['part_number'], m['model_number'],
+           normalize_identifier(m['model_number']), m['brand']]
+          for row in chunk for m in row['compatible_models']
+      ))
+
+      cursor.execute(self._sql(CHANGED_STOCK_SQL))
+      changed_stock = [part_number for (part_number,) in cursor.fetchall()]
+
+      cursor.execute(self._sql(UPSERT_PRODUCTS_SQL))
+      upserted = cursor.fetchall()
+      cursor.execute(self._sql(UPDATE_GUIDES_SQL))
+      guides = [part_number for (part_number,) in cursor.fetchall()]
+      cursor.execute(self._sql(INSERT_GUIDES_SQL))
+      guides += [part_number for (part_number,) in cursor.fetchall()]
+      cursor.execute(self._sql(UPSERT_COMPAT_SQL))
+      compatibility = [part_number for (part_number,) in cursor.fetchall()]
+
+      changed = {part_number for _, part_number in upserted}.union(guides, compatibility)
+      if changed:
+        # The statements above bypass save(), so post_save never fires
+        transaction.on_commit(lambda: products_bulk_updated.send(
+            sender=Product, part_numbers=changed_stock, changed=sorted(changed)
+        ))
+
+    created = sum(inserted for inserted, _ in upserted)
+    return {
+        'created': created,
+        'updated': len(upserted) - created,
+        'guides': len(guides),
+        'compatibility': len(compatibility),
+    }
+
+  def run(self, rows: Iterable[Dict]) -> Dict:
+    stats = {'rows': 0, 'invalid': 0, 'created': 0, 'updated': 0, 'guides': 0, 'compatibility': 0}
+    started = time.perf_counter()
+
+    with connection.cursor() as cursor:
+      cursor.execute(STAGING_SQL)
+
+    try:
+      chunk = []
+      for seq, row in enumerate(rows, start=1):
+        try:
+          cleaned = clean_row(row)
+        except CatalogRowError as e:
+          stats['invalid'] += 1
+          self.log(f"Skipping row {seq}: {str(e)}")
+          continue
+        cleaned['seq'] = seq
+        chunk.append(cleaned)
+
+        if len(chunk) == self.chunk_size:
+          self._flush(chunk, stats, started)
+          chunk = []
+      if chunk:
+        self._flush(chunk, stats, started)
+    finally:
+      with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS import_products, import_compat")
+
+    stats['seconds'] = time.perf_counter() - started
+    stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+  def _flush(self, chunk: List[Dict], stats: Dict, started: float):
+    for key, value in self._merge_chunk(chunk).items():
+      stats[key] += value
+    stats['rows'] += len(chunk)
+    elapsed = time.perf_counter() - started
+    self.log(f"{stats['rows']} rows merged ({stats['rows'] / elapsed:.0f} rows/s)")
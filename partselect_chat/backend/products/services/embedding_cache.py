@@ -0,0 +1,189 @@
+from typing import Dict, List, Optional
+from collections import OrderedDict
+from datetime import timedelta
+from functools import lru_cache
+import hashlib
+import logging
+import re
+import threading
+import time
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from utils.metrics import register_stats
+from ..models import QueryEmbedding
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+  """Case- and whitespace-insensitive form of a search query"""
+  return re.sub(r'\s+', ' ', query).strip().lower()
+
+
+def cache_key(query: str, model: str) -> str:
+  return hashlib.sha256(f"{model}\x00{normalize_query(query)}".encode()).hexdigest()
+
+
+class EmbeddingCache:
+  """Two-tier cache of query embeddings.
+
+  Lookups check an in-process LRU (bounded by size and TTL) first, then the
+  QueryEmbedding table, which survives restarts and is shared by workers.
+  """
+
+  def __init__(self, max_entries: int, ttl: float, persist: bool = True):
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self.persist = persist
+    self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+    self._lock = threading.Lock()
+    self.memory_hits = 0
+    self.db_hits = 0
+    self.misses = 0
+
+  def _get_memory(self, key: str) -> Optional[List[float]]:
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      expires_at, embedding = entry
+      if expires_at <= time.monotonic():
+        del self._entries[key]
+        return None
+      self._entries.move_to_end(key)
+      return embedding
+
+  def _set_memory(self, key: str, embedding: List[float]):
+    with self._lock:
+      self._entries[key] = (time.monotonic() + self.ttl, embedding)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  async def get(self, query: str, model: str) -> Optional[List[float]]:
+    key = cache_key(query, model)
+    embedding = self._get_memory(key)
+    if embedding is not None:
+      self.memory_hits += 1
+      return embedding
+
+    if self.persist:
+      try:
+        stored = await QueryEmbedding.objects.filter(key=key).values_list(
+            'embedding', flat=True
+        ).afirst()
+      except DatabaseError as e:
+        logger.warning("Embedding cache lookup failed: %s", e)
+        stored = None
+      if stored is not None:
+        embedding = [float(x) for x in stored]
+        self._set_memory(key, embedding)
+        self.db_hits += 1
+        return embedding
+
+    self.misses += 1
+    return None
+
+  async def set(self, query: str, model: str, embedding: List[float]):
+    key = cache_key(query, model)
+    self._set_memory(key, embedding)
+    if self.persist:
+      try:
+        await QueryEmbedding.objects.abulk_create(
+            [QueryEmbedding(key=key, model=model, query=normalize_query(query), embedding=embedding)],
+            ignore_conflicts=True
+        )
+      except DatabaseError as e:
+        logger.warning("Embedding cache write failed: %s", e)
+
+  async def embed_query(self, embeddings, query: str) -> List[float]:
+    """Return the embedding for query, calling the API only on a miss"""
+    model = getattr(embeddings, 'model', settings.OPENAI_EMBEDDING_MODEL)
+    embedding = await self.get(query, model)
+    if embedding is None:
+      embedding = await embeddings.aembed_query(normalize_query(query))
+      await self.set(query, model, embedding)
+    return embedding
+
+  async def embed_documents(self, embeddings, queries: List[str]) -> List[List[float]]:
+    """Embeddings for many queries: one table lookup and one API call for all misses"""
+    model = getattr(embeddings, 'model', settings.OPENAI_EMBEDDING_MODEL)
+    keys = [cache_key(query, model) for query in queries]
+    found = {}
+    for key in dict.fromkeys(keys):
+      embedding = self._get_memory(key)
+      if embedding is not None:
+        self.memory_hits += 1
+        found[key] = embedding
+
+    missing = [key for key in dict.fromkeys(keys) if key not in found]
+    if self.persist and missing:
+      try:
+        stored = [
+            row async for row in QueryEmbedding.objects.filter(key__in=missing).values_list('key', 'embedding')
+        ]
+      except DatabaseError as e:
+        logger.warning("Embedding cache lookup failed: %s", e)
+        stored = []
+      for key, embedding in stored:
+        found[key] = [float(x) for x in embedding]
+        self._set_memory(key, found[key])
+        self.db_hits += 1
+
+    texts = {}
+    for key, query in zip(keys, queries):
+      if key not in found:
+        texts.setdefault(key, normalize_query(query))
+    if texts:
+      self.misses += len(texts)
+      vectors = await embeddings.aembed_documents(list(texts.values()))
+      for key, embedding in zip(texts, vectors):
+        found[key] = embedding
+        self._set_memory(key, embedding)
+      if self.persist:
+        try:
+          await QueryEmbedding.objects.abulk_create(
+              [
+                  QueryEmbedding(key=key, model=model, query=text, embedding=found[key])
+                  for key, text in texts.items()
+              ],
+              ignore_conflicts=True
+          )
+        except DatabaseError as e:
+          logger.warning("Embedding cache write failed: %s", e)
+
+    return [found[key] for key in keys]
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+  def stats(self) -> Dict:
+    lookups = self.memory_hits + self.db_hits + self.misses
+    return {
+        'memory_hits': self.memory_hits,
+        'db_hits': self.db_hits,
+        'misses': self.misses,
+        'hit_rate': (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+        'memory_entries': len(self._entries),
+    }
+
+
+def prune_persisted(max_age_days: int) -> int:
+  """Delete stored query embeddings older than max_age_days; the table is otherwise unbounded"""
+  cutoff = timezone.now() - timedelta(days=max_age_days)
+  deleted, _ = QueryEmbedding.objects.filter(created_at__lt=cutoff).delete()
+  return deleted
+
+
+@lru_cache(maxsize=None)
+def get_embedding_cache() -> EmbeddingCache:
+  """Shared EmbeddingCache for this worker process"""
+  cache = EmbeddingCache(
+      max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+      ttl=settings.EMBEDDING_CACHE_TTL,
+      persist=settings.EMBEDDING_CACHE_PERSIST,
+  )
+  register_stats('embedding_cache', cache.stats)
+  return cache
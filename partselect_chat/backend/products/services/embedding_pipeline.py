@@ -0,0 +1,168 @@
+from typing import Callable, Dict, List, Optional
+from django.conf import settings
+from django.db.models import F, Prefetch, QuerySet
+from openai import APIConnectionError, APITimeoutError, RateLimitError
+import asyncio
+import hashlib
+import random
+from ..models import Product, ProductDocument, InstallationGuide, GuideDocument, EmbeddingCheckpoint
+
+
+def content_hash(text: str, model: str) -> str:
+  """Digest of what an embedding was computed from; a model change re-embeds"""
+  return hashlib.sha256(f"{model}\x00{text}".encode()).hexdigest()
+
+
+class ProductSource:
+  """One document per product, upserted in place"""
+
+  def rows(self, after: int) -> QuerySet:
+    return Product.objects.filter(id__gt=after).only(
+        'id', 'part_number', 'name', 'appliance_type'
+    ).annotate(stored_hash=F('document__content_hash')).order_by('id')
+
+  def documents(self, row: Product) -> List[ProductDocument]:
+    return [ProductDocument(product=row)]
+
+  def stored_hashes(self, row: Product) -> List[str]:
+    return [row.stored_hash or '']
+
+  async def write(self, rows: List[Product], documents: List[ProductDocument]):
+    await ProductDocument.objects.abulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=['embedding', 'content_hash', 'updated_at'],
+    )
+
+
+class GuideSource:
+  """One document per guide section; a changed guide has all its chunks replaced"""
+
+  def rows(self, after: int) -> QuerySet:
+    return InstallationGuide.objects.filter(id__gt=after).select_related('product').only(
+        'id', 'content', 'product__part_number', 'product__name', 'product__appliance_type'
+    ).prefetch_related(
+        Prefetch('chunks', queryset=GuideDocument.objects.only('guide_id', 'content_hash').order_by('position'))
+    ).order_by('id')
+
+  def documents(self, row: InstallationGuide) -> List[GuideDocument]:
+    return row.get_chunks()
+
+  def stored_hashes(self, row: InstallationGuide) -> List[str]:
+    return [chunk.content_hash for chunk in row.chunks.all()]
+
+  async def write(self, rows: List[InstallationGuide], documents: List[GuideDocument]):
+    await GuideDocument.objects.filter(guide__in=rows).adelete()
+    await GuideDocument.objects.abulk_create(documents)
+
+
+SOURCES = {
+    'products': ProductSource(),
+    'guides': GuideSource(),
+}
+
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError)
+
+
+class EmbeddingPipeline:
+  """Batched, resumable (re-)embedding of products and installation guides.
+
+  Rows are read in id order, one chunk at a time. Rows whose content hash
+  matches their stored document are skipped; the rest are embedded with
+  aembed_documents in batches, at most ``concurrency`` requests in flight,
+  and written back in bulk. The last finished id is saved
+  to EmbeddingCheckpoint after every chunk, so an interrupted run resumes
+  where it stopped.
+  """
+
+  def __init__(
+      self,
+      embeddings,
+      batch_size: int = 256,
+      concurrency: int = 4,
+      max_retries: int = 6,
+      base_backoff: float = 1.0,
+      max_backoff: float = 60.0,
+      log: Optional[Callable[[str], None]] = None
+  ):
+    self.embeddings = embeddings
+    self.model = getattr(embeddings, 'model', settings.OPENAI_EMBEDDING_MODEL)
+    self.batch_size = batch_size
+    self.concurrency = concurrency
+    self.max_retries = max_retries
+    self.base_backoff = base_backoff
+    self.max_backoff = max_backoff
+    self.log = log or print
+
+  async def _embed_batch(self, texts: List[str], semaphore: asyncio.Semaphore) -> List[List[float]]:
+    async with semaphore:
+      for attempt in range(self.max_retries + 1):
+        try:
+          return await self.embeddings.aembed_documents(texts)
+        except RETRYABLE_ERRORS as e:
+          if attempt == self.max_retries:
+            raise
+          # Full jitter keeps concurrent batches from retrying in lockstep
+          delay = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+          self.log(f"Embedding batch failed ({type(e).__name__}), retrying in {delay:.1f}s")
+          await asyncio.sleep(delay)
+
+  async def run(
+      self,
+      source: str,
+      resume: bool = True,
+      force: bool = False,
+      chunk_size: Optional[int] = None
+  ) -> Dict:
+    """Embed every changed row of a source; returns counts of what was done"""
+    source_rows = SOURCES[source]
+    chunk_size = chunk_size or self.batch_size * self.concurrency
+    semaphore = asyncio.Semaphore(self.concurrency)
+
+    checkpoint, _ = await EmbeddingCheckpoint.objects.aget_or_create(name=source)
+    after = checkpoint.last_id if resume else 0
+    if after:
+      self.log(f"Resuming {source} after id {after}")
+
+    stats = {'seen': 0, 'embedded': 0, 'skipped': 0}
+    while True:
+      rows = [row async for row in source_rows.rows(after)[:chunk_size]]
+      if not rows:
+        break
+
+      changed, pending = [], []
+      for row in rows:
+        documents = source_rows.documents(row)
+        texts = [document.get_document_text() for document in documents]
+        for document, text in zip(documents, texts):
+          document.content_hash = content_hash(text, self.model)
+        if force or [d.content_hash for d in documents] != source_rows.stored_hashes(row):
+          changed.append(row)
+          pending.extend(zip(documents, texts))
+
+      if pending:
+        batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+        results = await asyncio.gather(*(
+            self._embed_batch([text for _, text in batch], semaphore) for batch in batches
+        ))
+        vectors = [vector for result in results for vector in result]
+        for (document, _), vector in zip(pending, vectors):
+          document.embedding = vector
+        await source_rows.write(changed, [document for document, _ in pending])
+
+      stats['seen'] += len(rows)
+      stats['embedded'] += len(changed)
+      stats['skipped'] += len(rows) - len(changed)
+
+      after = rows[-1].id
+      checkpoint.last_id = after
+      await checkpoint.asave(update_fields=['last_id', 'updated_at'])
+      self.log(
+          f"{source}: {stats['seen']} rows, {stats['embedded']} embedded, "
+          f"{stats['skipped']} unchanged (through id {after})"
+      )
+
+    # A finished run leaves no checkpoint; the next one starts from the top
+    await checkpoint.adelete()
+    return stats
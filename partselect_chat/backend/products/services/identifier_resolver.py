@@ -0,0 +1,77 @@
+from typing import List, Optional, Tuple
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import Q, QuerySet
+from django.db.models.functions import Greatest
+import re
+from ..models import Product, ModelCompatibility
+from ..normalization import normalize_identifier
+
+
+def extract_identifiers(text: str, min_length: int = 5) -> List[str]:
+  """Normalized tokens in text that look like part or model numbers.
+
+  Catches 'w10295370a', 'WP-2198597', '2198597' and typos like 'W1029537OA';
+  a token qualifies when it is long enough and contains a digit.
+  """
+  identifiers = []
+  for token in re.findall(r'[A-Za-z0-9][A-Za-z0-9\-]*', text):
+    normalized = normalize_identifier(token)
+    if len(normalized) >= min_length and any(c.isdigit() for c in normalized):
+      if normalized not in identifiers:
+        identifiers.append(normalized)
+  return identifiers
+
+
+def _similarity(field: str, identifiers: List[str]):
+  similarities = [TrigramSimilarity(field, identifier) for identifier in identifiers]
+  return similarities[0] if len(similarities) == 1 else Greatest(*similarities)
+
+
+def _similar_filter(field: str, identifiers: List[str]) -> Q:
+  # The % operator (trigram_similar) is what the gin_trgm_ops index serves
+  condition = Q()
+  for identifier in identifiers:
+    condition |= Q(**{f'{field}__trigram_similar': identifier})
+  return condition
+
+
+class IdentifierResolver:
+  """Fuzzy part- and model-number lookup over pg_trgm GIN indexes"""
+
+  def __init__(self, cutoff: Optional[float] = None):
+    self.cutoff = settings.IDENTIFIER_SIMILARITY_CUTOFF if cutoff is None else cutoff
+
+  def part_queryset(self, identifiers: List[str]) -> QuerySet:
+    """Products whose part number is within the cutoff, most similar first.
+
+    Each row is annotated with ``similarity``; an exact match scores 1.0.
+    """
+    return Product.objects.filter(
+        _similar_filter('part_number', identifiers)
+    ).annotate(
+        similarity=_similarity('part_number', identifiers)
+    ).filter(
+        similarity__gte=self.cutoff
+    ).order_by('-similarity', 'part_number')
+
+  def resolve_models(self, identifiers: List[str], limit: int = 5) -> List[Tuple[str, float]]:
+    """Distinct known model numbers within the cutoff, most similar first"""
+    rows = ModelCompatibility.objects.filter(
+        _similar_filter('model_number', identifiers)
+    ).annotate(
+        similarity=_similarity('model_number', identifiers)
+    ).filter(
+        similarity__gte=self.cutoff
+    ).order_by('-similarity', 'model_number').values_list('model_number', 'similarity')
+
+    resolved = []
+    seen = set()
+    # Many rows share a model number; read a bounded window and dedupe
+    for model_number, similarity in rows[:limit * 20]:
+      if model_number not in seen:
+        seen.add(model_number)
+        resolved.append((model_number, similarity))
+        if len(resolved) == limit:
+          break
+    return resolved
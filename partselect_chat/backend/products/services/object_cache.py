@@ -0,0 +1,208 @@
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+from collections import OrderedDict
+from functools import lru_cache, partial
+import asyncio
+import copy
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from utils.metrics import register_stats
+from utils.singleflight import SingleFlight
+from ..normalization import normalize_identifier
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('product', 'guide')
+
+# Stored for part numbers that do not exist, so misses are cached too
+NOT_FOUND = '__not_found__'
+
+
+class ObjectCache:
+  """Two-tier cache of serialized products and guides, keyed by part number.
+
+  Part numbers are normalized in key(), so 'w10295370a', 'W-10295370A' and
+  'W10295370A' share an entry; loaders must treat them alike too.
+
+  L1 is a small in-process LRU with a short TTL; L2 is a Django cache shared
+  by all workers. Model signals delete changed entries from this process's
+  L1 and from L2; other workers' L1 copies expire within ``l1_ttl``.
+
+  Misses are loaded once: concurrent misses in a process share one load,
+  and across processes a ``cache.add`` lock lets the first loader query
+  while the others wait up to ``lock_timeout`` for its value.
+
+  Every entry has a generation counter in L2 that invalidate() bumps. A
+  load notes the generation before reading the database and only stores
+  its result if it is unchanged, so a read that raced a commit cannot
+  re-cache the old row after the commit's invalidation. Values are copied
+  in and out of L1, so callers may modify what they get.
+  """
+
+  def __init__(
+      self,
+      cache_alias: str = 'default',
+      l1_max_entries: int = 2000,
+      l1_ttl: float = 5.0,
+      ttl: float = 300.0,
+      lock_timeout: float = 5.0,
+      lock_poll: float = 0.05,
+      key_prefix: str = 'objects'
+  ):
+    self.cache_alias = cache_alias
+    self.l1_max_entries = l1_max_entries
+    self.l1_ttl = l1_ttl
+    self.ttl = ttl
+    self.lock_timeout = lock_timeout
+    self.lock_poll = lock_poll
+    self.key_prefix = key_prefix
+    self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+    self._lock = threading.Lock()
+    self._loads = SingleFlight()
+    self.l1_hits = 0
+    self.l2_hits = 0
+    self.misses = 0
+    self.lock_waits = 0
+
+  @property
+  def cache(self):
+    return caches[self.cache_alias]
+
+  def key(self, kind: str, part_number: str) -> str:
+    return f"{self.key_prefix}:{kind}:{normalize_identifier(part_number)}"
+
+  def _generation_key(self, key: str) -> str:
+    return f"{key}:gen"
+
+  def _get_memory(self, key: str):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      expires_at, value = entry
+      if expires_at <= time.monotonic():
+        del self._entries[key]
+        return None
+      self._entries.move_to_end(key)
+    return copy.deepcopy(value)
+
+  def _set_memory(self, key: str, value):
+    value = copy.deepcopy(value)
+    with self._lock:
+      self._entries[key] = (time.monotonic() + self.l1_ttl, value)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.l1_max_entries:
+        self._entries.popitem(last=False)
+
+  async def get_many(self, kind: str, part_numbers: Iterable[str]) -> Dict[str, Optional[Dict]]:
+    """Cached values by part number; None for known-missing parts, absent when not cached"""
+    keys = {self.key(kind, part_number): part_number for part_number in part_numbers}
+    found = {}
+    for key, part_number in keys.items():
+      value = self._get_memory(key)
+      if value is not None:
+        self.l1_hits += 1
+        found[part_number] = value
+
+    remaining = [key for key, part_number in keys.items() if part_number not in found]
+    if remaining:
+      for key, value in (await self.cache.aget_many(remaining)).items():
+        self.l2_hits += 1
+        self._set_memory(key, value)
+        found[keys[key]] = value
+    self.misses += len(keys) - len(found)
+    return {part_number: None if value == NOT_FOUND else value for part_number, value in found.items()}
+
+  async def generations(self, kind: str, part_numbers: Iterable[str]) -> Dict[str, int]:
+    """Current generation by part number; pass one to set() after reading the database"""
+    keys = {self._generation_key(self.key(kind, part_number)): part_number for part_number in part_numbers}
+    found = await self.cache.aget_many(list(keys))
+    return {part_number: found.get(key, 0) for key, part_number in keys.items()}
+
+  async def set(self, kind: str, part_number: str, value: Optional[Dict], generation: Optional[int] = None):
+    """Store a value; with generation, only if no invalidation happened since it was read"""
+    key = self.key(kind, part_number)
+    if generation is not None:
+      current = await self.generations(kind, [part_number])
+      if current[part_number] != generation:
+        logger.debug("Not caching %s: invalidated while loading", key)
+        return
+    value = NOT_FOUND if value is None else value
+    self._set_memory(key, value)
+    await self.cache.aset(key, value, timeout=self.ttl)
+
+  async def get_or_load(self, kind: str, part_number: str, loader: Callable[[], Awaitable[Optional[Dict]]]) -> Optional[Dict]:
+    """Cached value, or loader()'s result (None for a missing part), cached for next time"""
+    found = await self.get_many(kind, [part_number])
+    if part_number in found:
+      return found[part_number]
+    return await self._loads.do(self.key(kind, part_number), partial(self._load, kind, part_number, loader))
+
+  async def _load(self, kind: str, part_number: str, loader: Callable[[], Awaitable[Optional[Dict]]]) -> Optional[Dict]:
+    key = self.key(kind, part_number)
+    lock = f"{key}:lock"
+    locked = await self.cache.aadd(lock, 1, timeout=self.lock_timeout)
+    if not locked:
+      # Another worker is loading this entry; use its result when it lands
+      self.lock_waits += 1
+      deadline = time.monotonic() + self.lock_timeout
+      while time.monotonic() < deadline:
+        await asyncio.sleep(self.lock_poll)
+        value = await self.cache.aget(key)
+        if value is not None:
+          self._set_memory(key, value)
+          return None if value == NOT_FOUND else value
+      logger.warning("Gave up waiting for %s, loading it here", key)
+
+    try:
+      generation = (await self.generations(kind, [part_number]))[part_number]
+      value = await loader()
+      await self.set(kind, part_number, value, generation)
+      return value
+    finally:
+      if locked:
+        await self.cache.adelete(lock)
+
+  def invalidate(self, part_numbers: Iterable[str], kinds: Iterable[str] = KINDS):
+    """Drop entries from L1 and L2 (synchronous, for signal handlers)"""
+    keys = [self.key(kind, part_number) for part_number in part_numbers for kind in kinds]
+    if not keys:
+      return
+    with self._lock:
+      for key in keys:
+        self._entries.pop(key, None)
+    for key in keys:
+      try:
+        self.cache.incr(self._generation_key(key))
+      except ValueError:
+        self.cache.set(self._generation_key(key), 1, timeout=self.ttl)
+    self.cache.delete_many(keys)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+  def stats(self) -> Dict:
+    lookups = self.l1_hits + self.l2_hits + self.misses
+    return {
+        'l1_hits': self.l1_hits,
+        'l2_hits': self.l2_hits,
+        'misses': self.misses,
+        'hit_rate': (self.l1_hits + self.l2_hits) / lookups if lookups else 0.0,
+        'lock_waits': self.lock_waits,
+        'l1_entries': len(self._entries),
+    }
+
+
+@lru_cache(maxsize=None)
+def get_object_cache() -> ObjectCache:
+  """Shared ObjectCache for this worker process"""
+  cache = ObjectCache(
+      l1_max_entries=settings.OBJECT_CACHE_L1_MAX_ENTRIES,
+      l1_ttl=settings.OBJECT_CACHE_L1_TTL,
+      ttl=settings.OBJECT_CACHE_TTL,
+  )
+  register_stats('object_cache', cache.stats)
+  return cache
@@ -1,132 +1,511 @@
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional, Sequence, Tuple
+from functools import lru_cache, partial
 from langchain_openai import OpenAIEmbeddings
-from django.conf import settings
 from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, Func, Prefetch, TextField, Value
+from django.db.models.lookups import GreaterThan
 from pgvector.django import L2Distance
+import asyncio
+import logging
 import re
-from ..models import Product, ProductDocument, InstallationGuide, ModelCompatibility
+from utils.clients import get_embeddings
+from utils.singleflight import SingleFlight, get_single_flight
+from utils.timing import span
+from .embedding_cache import EmbeddingCache, get_embedding_cache, normalize_query
+from .object_cache import ObjectCache, get_object_cache
+from .search_backends import PgVectorBackend, get_search_backend
+from .identifier_resolver import IdentifierResolver, extract_identifiers
+from ..normalization import normalize_identifier
+from ..models import Product, InstallationGuide, GuideDocument, ModelCompatibility
+
+logger = logging.getLogger(__name__)
+
+# Fields the product listing can return, in output order
+LIST_FIELDS = (
+    'id', 'part_number', 'name', 'description', 'appliance_type',
+    'price', 'stock_quantity', 'created_at', 'updated_at'
+)
 
 
 class ProductService:
-  def __init__(self):
-    self.embeddings = OpenAIEmbeddings(
-        openai_api_key=settings.OPENAI_API_KEY
+  def __init__(
+      self,
+      embeddings: Optional[OpenAIEmbeddings] = None,
+      embedding_cache: Optional[EmbeddingCache] = None,
+      search_backend=None,
+      search_mode: Optional[str] = None,
+      identifier_resolver: Optional[IdentifierResolver] = None,
+      single_flight: Optional[SingleFlight] = None,
+      object_cache: Optional[ObjectCache] = None
+  ):
+    self._embeddings = embeddings
+    self.embedding_cache = embedding_cache
+    self.search_backend = search_backend or PgVectorBackend()
+    # 'vector', 'lexical' (never calls the embedding API) or 'hybrid'
+    self.search_mode = search_mode or settings.PRODUCT_SEARCH_MODE
+    self.identifier_resolver = identifier_resolver or IdentifierResolver()
+    # Shares one search between concurrent identical queries when set
+    self.single_flight = single_flight
+    # Serialized products and guides by part number, when set
+    self.object_cache = object_cache
+
+  @property
+  def embeddings(self) -> OpenAIEmbeddings:
+    """Injected client, or the pooled per-worker one"""
+    return self._embeddings or get_embeddings()
+
+  async def embed_query(self, query: str) -> List[float]:
+    """Embed a search query, going through the embedding cache when configured"""
+    with span('embedding'):
+      if self.embedding_cache is None:
+        return await self.embeddings.aembed_query(query)
+      return await self.embedding_cache.embed_query(self.embeddings, query)
+
+  async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+    """Embed many search queries with at most one API call"""
+    if not texts:
+      return []
+    with span('embedding'):
+      if self.embedding_cache is None:
+        return await self.embeddings.aembed_documents(texts)
+      return await self.embedding_cache.embed_documents(self.embeddings, texts)
+
+  def _related_prefetches(self, with_compatibility: bool = False, prefix: str = '') -> List[Prefetch]:
+    """Prefetches for guides (and optionally compatibility rows) of products.
+
+    Evaluating a queryset with these costs a fixed number of queries however
+    many products it returns.
+    """
+    prefetches = [
+        Prefetch(f'{prefix}installation_guides', queryset=InstallationGuide.objects.order_by('id'))
+    ]
+    if with_compatibility:
+      prefetches.append(Prefetch(
+          f'{prefix}compatible_models',
+          queryset=ModelCompatibility.objects.only('product_id', 'model_number', 'brand', 'notes')
+      ))
+    return prefetches
+
+  def _product_queryset(self, with_compatibility: bool = False):
+    return Product.objects.defer('search_vector').prefetch_related(
+        *self._related_prefetches(with_compatibility)
     )
 
+  def _load_products(self, ids: List[int], with_compatibility: bool) -> List[Product]:
+    """Products for ids, in the given order, with related rows prefetched"""
+    products = self._product_queryset(with_compatibility).in_bulk(ids)
+    return [products[i] for i in ids if i in products]
+
+  def _lexical_ids(self, query: str, limit: int, appliance_type: Optional[str]) -> List[Tuple[int, float]]:
+    """Full-text matches over name and description, best first.
+
+    Terms are OR-ed so partial matches still rank; the rank is normalized to
+    [0, 1) so it can be compared against SEARCH_LEXICAL_CONFIDENCE.
+    """
+    terms = re.findall(r'[a-z0-9]+', query.lower())
+    if not terms:
+      return []
+
+    search_query = SearchQuery(' | '.join(terms), search_type='raw', config='english')
+    queryset = Product.objects.filter(search_vector=search_query)
+    if appliance_type:
+      queryset = queryset.filter(appliance_type=appliance_type)
+
+    return list(
+        queryset.annotate(rank=SearchRank(F('search_vector'), search_query, normalization=32))
+        .order_by('-rank', 'id')
+        .values_list('id', 'rank')[:limit]
+    )
+
+  def _lexical_ids_many(self, queries: List[str], limit: int, appliance_type: Optional[str]) -> List[List[Tuple[int, float]]]:
+    """_lexical_ids for each query; full-text ranking has no batched form"""
+    return [self._lexical_ids(query, limit, appliance_type) for query in queries]
+
+  def _serialize_product(self, product: Product, similarity_score: float, with_compatibility: bool) -> Dict:
+    """Product dict; similarity_score is in [0, 1] in every search mode, higher is better"""
+    guides = product.installation_guides.all()
+    data = {
+        'id': product.id,
+        'part_number': product.part_number,
+        'name': product.name,
+        'description': product.description,
+        'price': product.price,
+        'appliance_type': product.appliance_type,
+        'similarity_score': similarity_score,
+        'installation_guide': guides[0].content if guides else None,
+        'stock_quantity': product.stock_quantity,
+    }
+    if with_compatibility:
+      data['compatibility_info'] = [
+          {'model_number': c.model_number, 'brand': c.brand, 'notes': c.notes}
+          for c in product.compatible_models.all()
+      ]
+    return data
+
+  def _from_cache(self, data: Dict, with_compatibility: bool) -> Dict:
+    """Copy of a cached product dict (which always has compatibility rows)"""
+    data = dict(data)
+    if not with_compatibility:
+      data.pop('compatibility_info', None)
+    return data
+
+  async def _exact_product(self, part_number: str) -> Optional[Dict]:
+    """Product dict with compatibility rows for an exact part number, or None"""
+    async def load():
+      products = await sync_to_async(list)(
+          self._product_queryset(with_compatibility=True).filter(
+              part_number=normalize_identifier(part_number)
+          )[:1]
+      )
+      return self._serialize_product(products[0], 1.0, True) if products else None
+
+    if self.object_cache is None:
+      return await load()
+    return await self.object_cache.get_or_load('product', part_number, load)
+
   async def search_products(
       self,
       query: str,
       limit: int = 5,
       appliance_type: Optional[str] = None,
-      similarity_threshold: float = 0.7
+      similarity_threshold: float = 0.7,
+      with_compatibility: bool = False,
+      ef_search: Optional[int] = None
+  ) -> List[Dict]:
+    """Products matching a query, closest first.
+
+    Concurrent calls with the same normalized query and options share one
+    search when single_flight is set; the product dicts are then shared
+    too and must not be modified.
+    """
+    search = partial(
+        self._search_products,
+        query, limit, appliance_type, similarity_threshold, with_compatibility, ef_search
+    )
+    if self.single_flight is None:
+      return await search()
+    key = (normalize_query(query), limit, appliance_type, similarity_threshold, with_compatibility, ef_search)
+    return list(await self.single_flight.do(key, search))
+
+  async def _search_products(
+      self,
+      query: str,
+      limit: int,
+      appliance_type: Optional[str],
+      similarity_threshold: float,
+      with_compatibility: bool,
+      ef_search: Optional[int]
   ) -> List[Dict]:
     try:
-        # Check for part number first
-      part_number_match = re.search(r'[A-Z]+\d{4,}[A-Z]*', query.upper())
+      # Check for part numbers first, tolerating case, dashes and typos
+      with span('regex'):
+        identifiers = extract_identifiers(query)
 
-      if part_number_match:
-        # Direct database lookup path
-        part_number = part_number_match.group()
-        product = await sync_to_async(Product.objects.filter(part_number=part_number).first)()
+      generations = None
+      if identifiers and self.object_cache is not None:
+        # Exact part numbers already cached skip the database entirely
+        cached = await self.object_cache.get_many('product', identifiers)
+        for identifier in identifiers:
+          product = cached.get(identifier)
+          if product and (not appliance_type or product['appliance_type'] == appliance_type):
+            return [self._from_cache(product, with_compatibility)]
+        generations = await self.object_cache.generations('product', identifiers)
 
-        if product:
-          installation_guide = await sync_to_async(
-              InstallationGuide.objects.filter(product_id=product.id).first
-          )()
+      if identifiers:
+        # Direct database lookup path, one trigram-indexed query
+        queryset = self.identifier_resolver.part_queryset(identifiers).defer('search_vector')
+        if appliance_type:
+          queryset = queryset.filter(appliance_type=appliance_type)
+        products = await sync_to_async(list)(
+            queryset.prefetch_related(*self._related_prefetches(with_compatibility))[:limit]
+        )
 
-          return [{
-              'id': product.id,
-              'part_number': product.part_number,
-              'name': product.name,
-              'description': product.description,
-              'price': product.price,
-              'appliance_type': product.appliance_type,
-              'similarity_score': 1.0,  # Exact match
-              'installation_guide': installation_guide.content if installation_guide else None,
-              'stock_quantity': product.stock_quantity,
-          }]
+        if products:
+          if products[0].similarity >= 1.0:
+            # Exact match
+            products = products[:1]
+          with span('serialize'):
+            results = [
+                self._serialize_product(p, float(p.similarity), with_compatibility)
+                for p in products
+            ]
+          part_number = results[0]['part_number']
+          if generations is not None and with_compatibility and part_number in generations:
+            await self.object_cache.set('product', part_number, results[0], generations[part_number])
+          return results
 
-      # If no part number match or no product found, fall back to semantic search
-      query_embedding = await self.embeddings.aembed_query(query)
+      # If no part number match or no product found, fall back to text search
+      if self.search_mode == 'lexical':
+        return await self._ranked_search(
+            await sync_to_async(self._lexical_ids)(query, limit, appliance_type),
+            with_compatibility
+        )
 
-      queryset = Product.objects.annotate(
-          distance=L2Distance('document__embedding', query_embedding)
-      ).select_related('document')
+      if self.search_mode == 'hybrid':
+        return await self._hybrid_search(
+            query, limit, appliance_type, similarity_threshold, with_compatibility, ef_search
+        )
 
-      if appliance_type:
-        queryset = queryset.filter(appliance_type=appliance_type)
+      query_embedding = await self.embed_query(query)
 
-      products = await sync_to_async(list)(
-          queryset.filter(distance__lte=similarity_threshold)
-          .order_by('distance')[:limit]
+      matches = await sync_to_async(self.search_backend.search)(
+          query_embedding,
+          limit,
+          appliance_type,
+          similarity_threshold,
+          prefetches=partial(self._related_prefetches, with_compatibility),
+          ef_search=ef_search
       )
 
-      # Fetch installation guide content in a separate query
-      product_ids = [p.id for p in products]
-      installation_guides = await sync_to_async(list)(
-          InstallationGuide.objects.filter(product_id__in=product_ids)
-      )
-      installation_guide_map = {ig.product_id: ig.content for ig in installation_guides}
+      with span('serialize'):
+        return [
+            self._serialize_product(product, distance_to_similarity(distance), with_compatibility)
+            for product, distance in matches
+        ]
+    except Exception as e:
+      logger.exception("Error in search_products")
+      raise Exception(f"Error searching products: {str(e)}")
+
+  async def search_products_batch(
+      self,
+      queries: List[str],
+      limit: int = 5,
+      appliance_type: Optional[str] = None,
+      similarity_threshold: float = 0.7
+  ) -> List[List[Dict]]:
+    """search_products for many queries at once, results in query order.
+
+    Queries naming an existing part number resolve through one IN query.
+    The rest follow search_mode: lexical and hybrid rank each one with a
+    full-text query, and those that still need vectors are embedded with one
+    API call and searched with one vector statement. All matched products
+    are loaded together.
+    """
+    try:
+      with span('regex'):
+        identifiers = [extract_identifiers(query) for query in queries]
+      candidates = {identifier for found in identifiers for identifier in found}
+      part_ids = {}
+      if candidates:
+        part_ids = dict(await sync_to_async(list)(
+            Product.objects.filter(part_number__in=candidates).values_list('part_number', 'id')
+        ))
+
+      hits: List[List[Tuple[int, float]]] = [[] for _ in queries]
+      semantic = []
+      for i, found in enumerate(identifiers):
+        exact = next((part_ids[identifier] for identifier in found if identifier in part_ids), None)
+        if exact is not None:
+          hits[i] = [(exact, 1.0)]
+        else:
+          semantic.append(i)
+
+      lexical = {}
+      candidates = limit * settings.SEARCH_CANDIDATE_MULTIPLIER
+      if semantic and self.search_mode != 'vector':
+        lexical = dict(zip(semantic, await sync_to_async(self._lexical_ids_many)(
+            [queries[i] for i in semantic],
+            limit if self.search_mode == 'lexical' else candidates,
+            appliance_type
+        )))
+        if self.search_mode == 'lexical':
+          answered = semantic
+        elif settings.SEARCH_LEXICAL_SHORTCUT:
+          answered = [
+              i for i in semantic
+              if lexical[i] and lexical[i][0][1] >= settings.SEARCH_LEXICAL_CONFIDENCE
+          ]
+        else:
+          answered = []
+        for i in answered:
+          hits[i] = lexical[i][:limit]
+        semantic = [i for i in semantic if i not in answered]
+
+      if semantic:
+        query_embeddings = await self.embed_documents([queries[i] for i in semantic])
+        if self.search_mode == 'hybrid':
+          nearest = await sync_to_async(self.search_backend.nearest_ids_many)(
+              query_embeddings, candidates, appliance_type, similarity_threshold
+          )
+          for i, matches in zip(semantic, nearest):
+            hits[i] = reciprocal_rank_fusion([lexical[i], matches], k=settings.SEARCH_RRF_K)[:limit]
+        else:
+          nearest = await sync_to_async(self.search_backend.nearest_ids_many)(
+              query_embeddings, limit, appliance_type, similarity_threshold
+          )
+          for i, matches in zip(semantic, nearest):
+            hits[i] = [(product_id, distance_to_similarity(distance)) for product_id, distance in matches]
+
+      ids = list(dict.fromkeys(product_id for matches in hits for product_id, _ in matches))
+      products = {p.id: p for p in await sync_to_async(self._load_products)(ids, False)}
+      with span('serialize'):
+        return [
+            [
+                self._serialize_product(products[product_id], float(score), False)
+                for product_id, score in matches if product_id in products
+            ]
+            for matches in hits
+        ]
+    except Exception as e:
+      logger.exception("Error in search_products_batch")
+      raise Exception(f"Error searching products: {str(e)}")
 
+  async def _ranked_search(self, ranked: List[Tuple[int, float]], with_compatibility: bool) -> List[Dict]:
+    products = await sync_to_async(self._load_products)([i for i, _ in ranked], with_compatibility)
+    scores = dict(ranked)
+    with span('serialize'):
       return [
-          {
-              'id': p.id,
-              'part_number': p.part_number,
-              'name': p.name,
-              'description': p.description,
-              'price': p.price,
-              'appliance_type': p.appliance_type,
-              'similarity_score': float(p.distance),
-              'installation_guide': installation_guide_map.get(p.id, None),
-              'stock_quantity': p.stock_quantity,
-          }
+          self._serialize_product(p, float(scores[p.id]), with_compatibility)
           for p in products
       ]
-    except Exception as e:
-      print(f"Error in search_products: {str(e)}")
-      raise Exception(f"Error searching products: {str(e)}")
+
+  async def _hybrid_search(
+      self,
+      query: str,
+      limit: int,
+      appliance_type: Optional[str],
+      similarity_threshold: float,
+      with_compatibility: bool,
+      ef_search: Optional[int] = None
+  ) -> List[Dict]:
+    """Lexical and vector candidates merged with reciprocal rank fusion.
+
+    When the best lexical match is confident the embedding call is skipped
+    entirely. Scores are normalized RRF scores (or lexical ranks for the
+    shortcut).
+    """
+    candidates = limit * settings.SEARCH_CANDIDATE_MULTIPLIER
+    lexical_ids = sync_to_async(self._lexical_ids)
+
+    if settings.SEARCH_LEXICAL_SHORTCUT:
+      lexical = await lexical_ids(query, candidates, appliance_type)
+      if lexical and lexical[0][1] >= settings.SEARCH_LEXICAL_CONFIDENCE:
+        return await self._ranked_search(lexical[:limit], with_compatibility)
+      query_embedding = await self.embed_query(query)
+    else:
+      lexical, query_embedding = await asyncio.gather(
+          lexical_ids(query, candidates, appliance_type),
+          self.embed_query(query)
+      )
+
+    vector = await sync_to_async(self.search_backend.nearest_ids)(
+        query_embedding, candidates, appliance_type, similarity_threshold, ef_search=ef_search
+    )
+    return await self._ranked_search(
+        reciprocal_rank_fusion([lexical, vector], k=settings.SEARCH_RRF_K)[:limit],
+        with_compatibility
+    )
+
+  def _guide_chunk_matches(
+      self,
+      query_embedding: List[float],
+      limit: int,
+      max_distance: float,
+      part_numbers: Optional[Sequence[str]]
+  ) -> List[GuideDocument]:
+    queryset = GuideDocument.objects.select_related('guide__product').only(
+        'section', 'content', 'guide__product__part_number', 'guide__product__name'
+    )
+    if part_numbers is not None:
+      queryset = queryset.filter(guide__product__part_number__in=part_numbers)
+    return list(
+        queryset.annotate(distance=L2Distance('embedding', query_embedding))
+        .filter(distance__lte=max_distance)
+        .order_by('distance')[:limit]
+    )
+
+  async def search_guides(
+      self,
+      query: str,
+      part_numbers: Optional[Sequence[str]] = None,
+      limit: Optional[int] = None,
+      max_distance: Optional[float] = None
+  ) -> List[Dict]:
+    """Installation guide sections closest to the query, one query.
+
+    Returns only the matching chunks (e.g. the steps section for "how do I
+    install ..."), optionally limited to the guides of the given parts.
+    """
+    query_embedding = await self.embed_query(query)
+    chunks = await sync_to_async(self._guide_chunk_matches)(
+        query_embedding,
+        settings.GUIDE_CHUNK_LIMIT if limit is None else limit,
+        settings.GUIDE_CHUNK_MAX_DISTANCE if max_distance is None else max_distance,
+        part_numbers
+    )
+    return [
+        {
+            'part_number': chunk.guide.product.part_number,
+            'product_name': chunk.guide.product.name,
+            'section': chunk.section,
+            'content': chunk.content,
+            'distance': float(chunk.distance),
+        }
+        for chunk in chunks
+    ]
 
   async def get_relevant_context(self, query: str) -> Dict:
     """Get all relevant context for a query"""
     try:
-      print("\n=== Search Debug ===")
-      print(f"Query: '{query}'")
-
-      # Search for products with their guides included
-      products = await self.search_products(query, limit=3)
-
-      # Get compatibility information for each product
-      for product in products:
-        compatibility_info = await self.check_compatibility(product['part_number'], None)
-        product['compatibility_info'] = compatibility_info['compatible_models']
-
-      print("\nFound Products:")
-      for p in products:
-        print(f"- {p['part_number']}: {p['name']} (score: {p['similarity_score']:.4f})")
-        print("  Compatible Models:")
-        for model in p['compatibility_info']:
-          print(f"  - {model['model_number']} ({model['brand']})")
-        if p['installation_guide']:
-          print("  Installation Guide: Available")
-        else:
-          print("  Installation Guide: Not Available")
+      # Search for products with their guides and compatibility rows included
+      products = await self.search_products(query, limit=3, with_compatibility=True)
+      context = await self._context_for(query, products)
+
+      if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Context for %r: products %s; guide sections %s",
+            query,
+            ', '.join(f"{p['part_number']} ({p['similarity_score']:.4f}, "
+                      f"{len(p['compatibility_info'])} models)" for p in products),
+            ', '.join(f"{c['part_number']}/{c['section']} ({c['distance']:.4f})"
+                      for c in context['guide_chunks'])
+        )
+      return context
+    except Exception as e:
+      logger.exception("Error in get_relevant_context")
+      raise Exception(f"Error getting relevant context: {str(e)}")
 
-      print("==================\n")
+  async def _context_for(self, query: str, products: List[Dict]) -> Dict:
+    # Only the guide sections that match the question, not whole guides
+    with_guides = [p['part_number'] for p in products if p['installation_guide']]
+    guide_chunks = await self.search_guides(query, part_numbers=with_guides) if with_guides else []
+    return {
+        'products': products,
+        'guide_chunks': guide_chunks,
+        'compatibility_info': [p['compatibility_info'] for p in products]
+    }
 
-      return {
-          'products': products,
-          'installation_guides': [p['installation_guide'] for p in products if p['installation_guide']],
-          'compatibility_info': [p['compatibility_info'] for p in products]
-      }
+  async def get_context_for_products(self, query: str, part_numbers: Sequence[str]) -> Dict:
+    """Context for products already in the conversation, without a new search.
+
+    Same shape as get_relevant_context; products keep the given order.
+    """
+    try:
+      found = await sync_to_async(list)(
+          self._product_queryset(with_compatibility=True).filter(part_number__in=part_numbers)
+      )
+      by_part_number = {p.part_number: p for p in found}
+      products = [
+          self._serialize_product(by_part_number[pn], 0.0, True)
+          for pn in part_numbers if pn in by_part_number
+      ]
+      return await self._context_for(query, products)
     except Exception as e:
-      print(f"Error in get_relevant_context: {str(e)}")
+      logger.exception("Error in get_context_for_products")
       raise Exception(f"Error getting relevant context: {str(e)}")
 
   async def check_compatibility(self, part_number: str, model_number: str) -> Dict:
     """Get compatibility information for a product"""
     try:
-        # First find the product
-      products = await self.search_products(f"PART_NUMBER: {part_number}", limit=1)
+      # The exact part (usually cached), else the closest match by part number
+      product = await self._exact_product(part_number)
+      products = [product] if product else await self.search_products(
+          f"PART_NUMBER: {part_number}",
+          limit=1,
+          with_compatibility=True
+      )
       if not products:
         return {
             'is_compatible': False,
@@ -135,23 +514,17 @@ class ProductService:
             'compatibility_info': None
         }
 
-      # Get all compatibility information for this product
-      product = await sync_to_async(Product.objects.get)(id=products[0]['id'])
-      compatibilities = await sync_to_async(list)(
-          ModelCompatibility.objects.filter(product=product)
-          .values('model_number', 'brand', 'notes')
-      )
+      product = products[0]
+      compatibilities = product['compatibility_info']
 
-      print(f"Compatible models for {part_number}:")
-      for c in compatibilities:
-        print(f"- {c['model_number']} ({c['brand']})")
+      logger.debug("%d compatible models for %s", len(compatibilities), part_number)
 
       return {
           'product_details': {
-              'part_number': product.part_number,
-              'name': product.name,
-              'appliance_type': product.appliance_type,
-              'description': product.description
+              'part_number': product['part_number'],
+              'name': product['name'],
+              'appliance_type': product['appliance_type'],
+              'description': product['description']
           },
           'compatible_models': compatibilities  # Let the LLM analyze this
       }
@@ -163,11 +536,133 @@ class ProductService:
           'compatibility_info': None
       }
 
-  async def get_installation_guide(self, part_number: str) -> Dict:
+  async def find_model_numbers(self, text: str) -> List[str]:
+    """Known model numbers mentioned in text, via the normalized model index"""
+    identifiers = extract_identifiers(text)
+    if not identifiers:
+      return []
+    found = await sync_to_async(list)(
+        ModelCompatibility.objects.filter(model_number_normalized__in=identifiers)
+        .values_list('model_number_normalized', flat=True).distinct()
+    )
+    # Keep the order they appear in the message
+    return [i for i in identifiers if i in set(found)]
+
+  async def is_known_model(self, model_number: str) -> bool:
+    """Whether any part lists the model number as compatible"""
+    return await ModelCompatibility.objects.filter(
+        model_number_normalized=normalize_identifier(model_number)
+    ).aexists()
+
+  async def get_parts_for_model(
+      self,
+      model_number: str,
+      appliance_type: Optional[str] = None,
+      brand: Optional[str] = None,
+      after: Optional[int] = None,
+      limit: int = 20
+  ) -> Dict:
+    """Parts compatible with a model, one keyset page at a time.
+
+    Pages are ordered by product id; pass the returned next_after back as
+    after for the next page. Each page is a single index range scan on
+    (model_number_normalized, product_id), however many rows the table has.
+    """
+    normalized = normalize_identifier(model_number)
+    queryset = ModelCompatibility.objects.filter(
+        model_number_normalized=normalized
+    ).select_related('product').defer('product__search_vector')
+
+    if appliance_type:
+      queryset = queryset.filter(product__appliance_type=appliance_type)
+    if brand:
+      queryset = queryset.filter(brand__iexact=brand)
+    if after is not None:
+      queryset = queryset.filter(product_id__gt=after)
+
+    rows = await sync_to_async(list)(queryset.order_by('product_id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        'model_number': normalized,
+        'results': [
+            {
+                'id': row.product.id,
+                'part_number': row.product.part_number,
+                'name': row.product.name,
+                'description': row.product.description,
+                'price': row.product.price,
+                'appliance_type': row.product.appliance_type,
+                'stock_quantity': row.product.stock_quantity,
+                'brand': row.brand,
+                'notes': row.notes,
+            }
+            for row in rows
+        ],
+        'next_after': rows[-1].product_id if has_more else None,
+    }
+
+  def _listing_queryset(
+      self,
+      fields: Sequence[str],
+      appliance_type: Optional[str],
+      after: Optional[Tuple[str, int]]
+  ):
+    """Products in (appliance_type, id) order from just past the ``after`` key"""
+    queryset = Product.objects.order_by('appliance_type', 'id')
+    if appliance_type:
+      queryset = queryset.filter(appliance_type=appliance_type)
+    if after is not None:
+      # A row comparison, so the (appliance_type, id) index seeks straight to the key
+      queryset = queryset.filter(GreaterThan(
+          Func(F('appliance_type'), F('id'), function='ROW', output_field=TextField()),
+          Func(Value(after[0]), Value(after[1]), function='ROW', output_field=TextField()),
+      ))
+    return queryset.values(*dict.fromkeys(['appliance_type', 'id', *fields]))
+
+  async def list_products(
+      self,
+      fields: Sequence[str] = LIST_FIELDS,
+      appliance_type: Optional[str] = None,
+      after: Optional[Tuple[str, int]] = None,
+      limit: int = 100
+  ) -> Dict:
+    """One keyset page of the catalog; pass next_after back as after for the next"""
+    rows = await sync_to_async(list)(self._listing_queryset(fields, appliance_type, after)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'results': [{field: row[field] for field in fields} for row in rows],
+        'next_after': (rows[-1]['appliance_type'], rows[-1]['id']) if has_more else None,
+    }
+
+  async def export_products(
+      self,
+      fields: Sequence[str] = LIST_FIELDS,
+      appliance_type: Optional[str] = None,
+      after: Optional[Tuple[str, int]] = None,
+      chunk_size: int = 2000
+  ) -> AsyncIterator[Dict]:
+    """Every product past ``after``, read through a server-side cursor ``chunk_size`` rows at a time"""
+    queryset = self._listing_queryset(fields, appliance_type, after)
+    async for row in queryset.aiterator(chunk_size=chunk_size):
+      yield {field: row[field] for field in fields}
+
+  async def get_installation_guide(self, part_number: str) -> Optional[Dict]:
     """Get installation guide for a product"""
+    if self.object_cache is None:
+      return await self._load_installation_guide(part_number)
+    return await self.object_cache.get_or_load(
+        'guide', part_number, partial(self._load_installation_guide, part_number)
+    )
+
+  async def _load_installation_guide(self, part_number: str) -> Optional[Dict]:
     try:
-      # First find the product
-      product = await sync_to_async(Product.objects.filter(part_number=part_number).first)()
+      # First find the product; catalog part numbers are stored normalized
+      product = await sync_to_async(
+          Product.objects.filter(part_number=normalize_identifier(part_number)).first
+      )()
 
       if not product:
         return None
@@ -190,5 +685,36 @@ class ProductService:
       }
 
     except Exception as e:
-      print(f"Error getting installation guide: {str(e)}")
+      logger.exception("Error getting installation guide")
       raise Exception(f"Error getting installation guide: {str(e)}")
+
+
+def distance_to_similarity(distance: float) -> float:
+  """Cosine similarity in [0, 1] from the L2 distance between unit-length embeddings"""
+  return max(0.0, min(1.0, 1.0 - distance * distance / 2.0))
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Tuple[int, float]]], k: int = 60) -> List[Tuple[int, float]]:
+  """Merge ranked (id, score) lists by summing 1 / (k + rank) per list.
+
+  Scores are scaled to [0, 1]: an item ranked first in every list scores 1.0.
+  """
+  fused: Dict[int, float] = {}
+  for ranking in rankings:
+    for rank, (item_id, _) in enumerate(ranking, start=1):
+      fused[item_id] = fused.get(item_id, 0.0) + 1.0 / (k + rank)
+  best = len(rankings) / (k + 1.0) if rankings else 1.0
+  return sorted(((item_id, score / best) for item_id, score in fused.items()), key=lambda item: item[1], reverse=True)
+
+
+@lru_cache(maxsize=None)
+def get_product_service() -> ProductService:
+  """Shared ProductService for this worker process"""
+  embedding_cache = get_embedding_cache() if settings.EMBEDDING_CACHE_ENABLED else None
+  return ProductService(
+      embedding_cache=embedding_cache,
+      search_backend=get_search_backend(),
+      search_mode=settings.PRODUCT_SEARCH_MODE,
+      single_flight=get_single_flight('search') if settings.SINGLE_FLIGHT_ENABLED else None,
+      object_cache=get_object_cache() if settings.OBJECT_CACHE_ENABLED else None
+  )
@@ -0,0 +1,553 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Func, Q, QuerySet, Value
+from pgvector.django import L2Distance
+from ..models import Product, ProductDocument
+from .vector_index import EMBEDDING_DIMENSIONS, quantized_distance_sql, search_params_sql, vector_literal
+
+# Nearest documents for many query vectors in one statement: the LATERAL
+# subquery is an ordinary ``ORDER BY embedding <-> q LIMIT k`` index walk,
+# re-run for each row of q
+NEAREST_MANY_SQL = """
+SELECT q.idx, n.product_id, n.distance
+FROM (
+    SELECT u.idx, u.embedding::vector({dimensions}) AS embedding
+    FROM unnest(%s::int[], %s::text[]) AS u(idx, embedding)
+) q
+CROSS JOIN LATERAL (
+    {nearest}
+) n
+WHERE n.distance <= %s
+ORDER BY q.idx, n.distance
+"""
+
+NEAREST_SQL = """SELECT d.product_id, d.embedding <-> q.embedding AS distance
+    FROM products_productdocument d {join}
+    ORDER BY d.embedding <-> q.embedding
+    LIMIT %s"""
+
+# Quantized index walk for the candidates, exact distance to rank them
+NEAREST_RERANKED_SQL = """SELECT c.product_id, c.embedding <-> q.embedding AS distance
+    FROM (
+        SELECT d.product_id, d.embedding
+        FROM products_productdocument d {join}
+        ORDER BY {quantized_distance}
+        LIMIT %s
+    ) c
+    ORDER BY distance
+    LIMIT %s"""
+
+APPLIANCE_JOIN_SQL = "JOIN products_product p ON p.id = d.product_id AND p.appliance_type = %s"
+
+
+class QuantizedDistance(Func):
+  """Distance of the quantized ``embedding`` column to a query vector.
+
+  An expression rather than raw SQL so the column is qualified with whatever
+  alias the query gives the table (e.g. U0 inside a subquery).
+  """
+  output_field = FloatField()
+
+  def __init__(self, quantization: str, query_embedding: Sequence[float], expression: str = 'embedding'):
+    self.quantization = quantization
+    super().__init__(F(expression), Value(vector_literal(query_embedding)))
+
+  def as_sql(self, compiler, connection, **extra_context):
+    column, query = self.get_source_expressions()
+    column_sql, column_params = compiler.compile(column)
+    query_sql, query_params = compiler.compile(query)
+    return (
+        quantized_distance_sql(self.quantization, column=column_sql, query=query_sql),
+        [*column_params, *query_params]
+    )
+
+
+APPLIANCE_CODES = {value: code for code, (value, _) in enumerate(Product.APPLIANCE_TYPES, start=1)}
+
+# Sync watermarks are whole microseconds since this instant, so rows stamped
+# exactly at the watermark compare equal
+WATERMARK_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _with_search_params(run: Callable[[], List], ef_search: Optional[int], probes: Optional[int]) -> List:
+  """run(), with ef_search / probes overriding the connection defaults when given"""
+  if ef_search is None and probes is None:
+    return run()
+  with transaction.atomic():
+    with connection.cursor() as cursor:
+      cursor.execute(search_params_sql(ef_search=ef_search, probes=probes, local=True))
+    return run()
+
+
+class PgVectorBackend:
+  """Nearest-neighbour search in Postgres through the pgvector ANN index.
+
+  With ``quantization`` set to 'halfvec' or 'binary' the index is walked on
+  the quantized embedding for ``rerank_candidates`` candidates, which are
+  then ordered by exact L2 distance on the full vectors in the same query.
+  """
+  name = 'pgvector'
+
+  def __init__(self, quantization: str = 'none', rerank_candidates: int = 100):
+    self.quantization = quantization
+    self.rerank_candidates = rerank_candidates
+
+  def _nearest(
+      self,
+      queryset: QuerySet,
+      query_embedding: Sequence[float],
+      limit: int,
+      appliance_type: Optional[str],
+      similarity_threshold: float
+  ) -> QuerySet:
+    """Documents within the threshold by exact distance, closest first"""
+    if appliance_type:
+      queryset = queryset.filter(product__appliance_type=appliance_type)
+
+    if self.quantization != 'none':
+      candidates = ProductDocument.objects.annotate(
+          quantized_distance=QuantizedDistance(self.quantization, query_embedding)
+      )
+      if appliance_type:
+        candidates = candidates.filter(product__appliance_type=appliance_type)
+      queryset = queryset.filter(pk__in=candidates.order_by('quantized_distance').values('pk')[
+          :max(limit, self.rerank_candidates)
+      ])
+
+    return queryset.annotate(
+        distance=L2Distance('embedding', query_embedding)
+    ).filter(distance__lte=similarity_threshold).order_by('distance')
+
+  def search(
+      self,
+      query_embedding: Sequence[float],
+      limit: int,
+      appliance_type: Optional[str],
+      similarity_threshold: float,
+      prefetches: Callable[..., List] = lambda prefix='': [],
+      ef_search: Optional[int] = None,
+      probes: Optional[int] = None
+  ) -> List[Tuple[Product, float]]:
+    """Nearest products by L2 distance, closest first.
+
+    The query is driven from ProductDocument and has the shape
+    ``ORDER BY embedding <-> q LIMIT k`` so Postgres walks the ANN index; the
+    appliance type and distance threshold are applied to the index scan.
+    Connections default to HNSW_EF_SEARCH / IVFFLAT_PROBES; passing either
+    overrides it for this query only.
+    """
+    queryset = self._nearest(
+        ProductDocument.objects.select_related('product').defer('embedding', 'product__search_vector'),
+        query_embedding, limit, appliance_type, similarity_threshold
+    ).prefetch_related(*prefetches(prefix='product__'))[:limit]
+
+    documents = _with_search_params(lambda: list(queryset), ef_search, probes)
+    return [(d.product, float(d.distance)) for d in documents]
+
+  def nearest_ids(
+      self,
+      query_embedding: Sequence[float],
+      limit: int,
+      appliance_type: Optional[str],
+      similarity_threshold: float,
+      ef_search: Optional[int] = None,
+      probes: Optional[int] = None
+  ) -> List[Tuple[int, float]]:
+    """Like search, but only (product_id, distance) pairs"""
+    queryset = self._nearest(
+        ProductDocument.objects.all(), query_embedding, limit, appliance_type, similarity_threshold
+    ).values_list('product_id', 'distance')[:limit]
+    return [
+        (product_id, float(distance))
+        for product_id, distance in _with_search_params(lambda: list(queryset), ef_search, probes)
+    ]
+
+
+  def nearest_ids_many(
+      self,
+      query_embeddings: Sequence[Sequence[float]],
+      limit: int,
+      appliance_type: Optional[str],
+      similarity_threshold: float
+  ) -> List[List[Tuple[int, float]]]:
+    """nearest_ids for each of several query vectors, in one statement"""
+    if not query_embeddings:
+      return []
+    join = APPLIANCE_JOIN_SQL if appliance_type else ''
+    join_params = [appliance_type] if appliance_type else []
+    if self.quantization == 'none':
+      nearest = NEAREST_SQL.format(join=join)
+      nearest_params = join_params + [limit]
+    else:
+      # The query vector comes from q.embedding rather than a parameter
+      distance = quantized_distance_sql(self.quantization, column='d.embedding', query='q.embedding')
+      nearest = NEAREST_RERANKED_SQL.format(join=join, quantized_distance=distance)
+      nearest_params = join_params + [max(limit, self.rerank_candidates), limit]
+
+    sql = NEAREST_MANY_SQL.format(dimensions=EMBEDDING_DIMENSIONS, nearest=nearest)
+    params = [
+        list(range(len(query_embeddings))),
+        [vector_literal(embedding) for embedding in query_embeddings],
+        *nearest_params,
+        similarity_threshold,
+    ]
+    results = [[] for _ in query_embeddings]
+    with connection.cursor() as cursor:
+      cursor.execute(sql, params)
+      for idx, product_id, distance in cursor.fetchall():
+        results[idx].append((product_id, float(distance)))
+    return results
+
+
+def exact_nearest_ids(
+    query_embedding: Sequence[float],
+    limit: int,
+    appliance_type: Optional[str] = None
+) -> List[int]:
+  """True top-k product ids from a sequential scan, ignoring every ANN index"""
+  with transaction.atomic():
+    with connection.cursor() as cursor:
+      cursor.execute("SET LOCAL enable_indexscan = off")
+    return [
+        product_id
+        for product_id, _ in PgVectorBackend().nearest_ids(query_embedding, limit, appliance_type, float('inf'))
+    ]
+
+
+def recall_at_k(backend, queries: Sequence[Sequence[float]], k: int = 10) -> Dict:
+  """Mean share of the exact top-k a backend returns, and its mean latency"""
+  recalls, seconds = [], 0.0
+  for query in queries:
+    exact = set(exact_nearest_ids(query, k))
+    if not exact:
+      continue
+    started = time.perf_counter()
+    found = backend.nearest_ids(query, k, None, float('inf'))
+    seconds += time.perf_counter() - started
+    recalls.append(len(exact & {product_id for product_id, _ in found}) / len(exact))
+  return {
+      'k': k,
+      'queries': len(recalls),
+      'recall': sum(recalls) / len(recalls) if recalls else 0.0,
+      'mean_ms': seconds * 1000.0 / len(recalls) if recalls else 0.0,
+  }
+
+
+class VectorMatrix:
+  """All ProductDocument embeddings as one memory-mapped float32 matrix.
+
+  Each sync writes the matrix to a new ``<path>.<generation>`` file and
+  names it in the row metadata (product ids, appliance codes, squared norms,
+  sync watermark) in ``<path>.meta.npz``. Workers map the file read-only, so
+  the OS page cache holds a single copy for all of them. Only ``sync``
+  writes; it copies the current file, updates and appends rows in the copy
+  and publishes the metadata with an atomic rename, which readers pick up on
+  their next search. A published file is never written again, so a reader
+  always sees matrix and metadata from the same sync.
+  """
+
+  def __init__(self, path: Path, dimensions: int = EMBEDDING_DIMENSIONS, reload_interval: float = 5.0):
+    self.path = Path(path)
+    self.meta_path = Path(f"{path}.meta.npz")
+    self.dimensions = dimensions
+    self.reload_interval = reload_interval
+    self._lock = threading.Lock()
+    self._loaded_version = None
+    self._checked_at = 0.0
+    self.matrix = None
+    self.ids = np.empty(0, dtype=np.int64)
+    self.appliance = np.empty(0, dtype=np.uint8)
+    self.norms = np.empty(0, dtype=np.float32)
+
+  # Reader side
+
+  def _meta_version(self):
+    try:
+      stat = self.meta_path.stat()
+    except FileNotFoundError:
+      return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+  def load(self, force: bool = False):
+    """Map the current matrix, re-reading it only when sync published a new one"""
+    now = time.monotonic()
+    if not force and now - self._checked_at < self.reload_interval:
+      return
+    with self._lock:
+      self._checked_at = now
+      version = self._meta_version()
+      if version is None:
+        raise RuntimeError(
+            f"No vector matrix at {self.path}; run `manage.py sync_vector_matrix`"
+        )
+      if version == self._loaded_version and not force:
+        return
+
+      meta = np.load(self.meta_path)
+      rows = int(meta['rows'])
+      capacity = int(meta['capacity'])
+      if rows:
+        matrix = np.memmap(
+            self.path.with_name(str(meta['data'])), dtype=np.float32, mode='r', shape=(capacity, self.dimensions)
+        )
+        self.matrix = matrix[:rows]
+      else:
+        self.matrix = None
+      self.ids = meta['ids'][:rows]
+      self.appliance = meta['appliance'][:rows]
+      self.norms = meta['norms'][:rows]
+      self._loaded_version = version
+
+  def search(
+      self,
+      query_embedding: Sequence[float],
+      limit: int,
+      appliance_type: Optional[str],
+      similarity_threshold: float
+  ) -> List[Tuple[int, float]]:
+    """Top-k (product_id, L2 distance) pairs, closest first"""
+    self.load()
+    matrix, ids, appliance, norms = self.matrix, self.ids, self.appliance, self.norms
+    if matrix is None or not len(ids) or limit <= 0:
+      return []
+
+    query = np.asarray(query_embedding, dtype=np.float32)
+    # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2, one matrix-vector product
+    distances = norms - 2.0 * (matrix @ query) + float(query @ query)
+
+    valid = ids >= 0
+    if appliance_type:
+      valid &= appliance == APPLIANCE_CODES.get(appliance_type, 0)
+    valid &= distances <= similarity_threshold ** 2
+    distances = np.where(valid, distances, np.inf)
+
+    k = min(limit, int(valid.sum()))
+    if k == 0:
+      return []
+    top = np.argpartition(distances, k - 1)[:k]
+    top = top[np.argsort(distances[top])]
+    return [
+        (int(ids[i]), float(np.sqrt(max(distances[i], 0.0))))
+        for i in top
+    ]
+
+  # Writer side
+
+  def _read_meta(self) -> Optional[Dict]:
+    if not self.meta_path.exists():
+      return None
+    meta = np.load(self.meta_path)
+    return {key: meta[key] for key in meta.files}
+
+  def _publish_meta(self, **arrays):
+    tmp = self.meta_path.with_name(self.meta_path.name + '.tmp.npz')
+    np.savez(tmp, **arrays)
+    os.replace(tmp, self.meta_path)
+
+  def _data_path(self, generation: int) -> Path:
+    return self.path.with_name(f"{self.path.name}.{generation}")
+
+  def _open_copy(self, source: Optional[Path], target: Path, capacity: int):
+    """Map target read-write at capacity rows, starting as a copy of source"""
+    if source is not None and not target.exists():
+      shutil.copyfile(source, target)
+    with open(target, 'ab') as f:
+      # Extends with zeros; the rows past the old capacity are unused
+      f.truncate(capacity * self.dimensions * 4)
+    return np.memmap(target, dtype=np.float32, mode='r+', shape=(capacity, self.dimensions))
+
+  def _remove_old_files(self, generation: int):
+    """Delete data files older than the previous generation.
+
+    The previous one is kept for readers that read the old metadata just
+    before it was replaced; readers still mapping a deleted file keep its
+    inode until they reload.
+    """
+    for path in self.path.parent.glob(f"{self.path.name}.*"):
+      suffix = path.name[len(self.path.name) + 1:]
+      if suffix.isdigit() and int(suffix) < generation - 1:
+        path.unlink(missing_ok=True)
+
+  def sync(self, full: bool = False, chunk_size: int = 5000) -> Dict:
+    """Bring the matrix up to date with ProductDocument.
+
+    Incremental by default: only documents (or products) updated at or after
+    the last watermark are read. Rows stamped exactly at the watermark that
+    the last sync already applied are skipped, so a write committed late
+    with the same timestamp is still picked up. Rows of deleted products
+    are tombstoned.
+    """
+    current = self._read_meta()
+    meta = None if full else current
+    if meta is None:
+      ids = np.empty(0, dtype=np.int64)
+      appliance = np.empty(0, dtype=np.uint8)
+      norms = np.empty(0, dtype=np.float32)
+      rows, capacity, watermark = 0, 0, 0
+      seen_at_watermark = set()
+      data, source = '', None
+    else:
+      rows, capacity = int(meta['rows']), int(meta['capacity'])
+      ids = meta['ids'].copy()
+      appliance = meta['appliance'].copy()
+      norms = meta['norms'].copy()
+      watermark = int(meta['watermark'])
+      seen_at_watermark = set(meta['watermark_ids'].tolist())
+      data = str(meta['data'])
+      source = self.path.with_name(data) if data else None
+
+    generation = int(current['generation']) + 1 if current is not None else 1
+    target = self._data_path(generation)
+    # Left over from a sync that died before publishing
+    target.unlink(missing_ok=True)
+
+    queryset = ProductDocument.objects.all()
+    if watermark:
+      since = WATERMARK_EPOCH + timedelta(microseconds=watermark)
+      queryset = queryset.filter(Q(updated_at__gte=since) | Q(product__updated_at__gte=since))
+
+    row_of = {int(pid): i for i, pid in enumerate(ids[:rows]) if pid >= 0}
+    changed = appended = 0
+    matrix = None
+    latest, latest_ids = watermark, set(seen_at_watermark)
+
+    rows_iter = queryset.values_list(
+        'product_id', 'product__appliance_type', 'embedding', 'updated_at', 'product__updated_at'
+    ).order_by('product_id').iterator(chunk_size=chunk_size)
+
+    for product_id, appliance_type, embedding, doc_updated, product_updated in rows_iter:
+      stamp = (max(doc_updated, product_updated) - WATERMARK_EPOCH) // timedelta(microseconds=1)
+      if stamp > latest:
+        latest, latest_ids = stamp, set()
+      if stamp == latest:
+        latest_ids.add(product_id)
+      if stamp == watermark and product_id in seen_at_watermark:
+        continue
+
+      vector = np.asarray(embedding, dtype=np.float32)
+      row = row_of.get(product_id)
+      if row is None:
+        row = rows
+        if row >= capacity:
+          new_capacity = max(1024, capacity * 2)
+          if matrix is not None:
+            matrix.flush()
+            matrix = None
+          ids = np.concatenate([ids, np.full(new_capacity - capacity, -1, dtype=np.int64)])
+          appliance = np.concatenate([appliance, np.zeros(new_capacity - capacity, dtype=np.uint8)])
+          norms = np.concatenate([norms, np.zeros(new_capacity - capacity, dtype=np.float32)])
+          capacity = new_capacity
+        rows += 1
+        row_of[product_id] = row
+        appended += 1
+      else:
+        changed += 1
+
+      if matrix is None:
+        matrix = self._open_copy(source, target, capacity)
+      matrix[row] = vector
+      ids[row] = product_id
+      appliance[row] = APPLIANCE_CODES.get(appliance_type, 0)
+      norms[row] = float(vector @ vector)
+
+    # Tombstone rows whose document no longer exists
+    live = set(ProductDocument.objects.values_list('product_id', flat=True).iterator(chunk_size=chunk_size))
+    removed = 0
+    for product_id, row in row_of.items():
+      if product_id not in live:
+        ids[row] = -1
+        removed += 1
+
+    if matrix is not None:
+      matrix.flush()
+      del matrix
+      data = target.name
+    else:
+      # Nothing to write; keep serving the current file
+      generation -= 1
+
+    self._publish_meta(
+        ids=ids, appliance=appliance, norms=norms, rows=rows, capacity=capacity,
+        watermark=latest, watermark_ids=np.array(sorted(latest_ids), dtype=np.int64),
+        data=data, generation=generation
+    )
+    if data == target.name:
+      self._remove_old_files(generation)
+    return {'appended': appended, 'updated': changed, 'removed': removed, 'rows': rows}
+
+
+class NumpyBackend:
+  """In-process exact search over a memory-mapped embedding matrix.
+
+  Suited to catalogs that fit in RAM: a search is one matrix-vector product
+  plus one query to load the winning products.
+  """
+  name = 'numpy'
+
+  def __init__(self, matrix: VectorMatrix):
+    self.matrix = matrix
+
+  def search(
+      self,
+      query_embedding: Sequence[float],
+      limit: int,
+      appliance_type: Optional[str],
+      similarity_threshold: float,
+      prefetches: Callable[..., List] = lambda prefix='': [],
+      **kwargs
+  ) -> List[Tuple[Product, float]]:
+    hits = self.matrix.search(query_embedding, limit, appliance_type, similarity_threshold)
+    if not hits:
+      return []
+    products = Product.objects.defer('search_vector').prefetch_related(*prefetches()).in_bulk([pid for pid, _ in hits])
+    return [(products[pid], distance) for pid, distance in hits if pid in products]
+
+  def nearest_ids(
+      self,
+      query_embedding: Sequence[float],
+      limit: int,
+      appliance_type: Optional[str],
+      similarity_threshold: float,
+      **kwargs
+  ) -> List[Tuple[int, float]]:
+    return self.matrix.search(query_embedding, limit, appliance_type, similarity_threshold)
+
+  def nearest_ids_many(
+      self,
+      query_embeddings: Sequence[Sequence[float]],
+      limit: int,
+      appliance_type: Optional[str],
+      similarity_threshold: float
+  ) -> List[List[Tuple[int, float]]]:
+    return [
+        self.matrix.search(embedding, limit, appliance_type, similarity_threshold)
+        for embedding in query_embeddings
+    ]
+
+
+@lru_cache(maxsize=None)
+def get_vector_matrix() -> VectorMatrix:
+  return VectorMatrix(settings.VECTOR_MATRIX_PATH, reload_interval=settings.VECTOR_MATRIX_RELOAD_INTERVAL)
+
+
+@lru_cache(maxsize=None)
+def get_search_backend(name: Optional[str] = None):
+  """Search backend named by PRODUCT_SEARCH_BACKEND ('pgvector' or 'numpy')"""
+  name = name or settings.PRODUCT_SEARCH_BACKEND
+  if name == 'pgvector':
+    return PgVectorBackend(
+        quantization=settings.VECTOR_QUANTIZATION,
+        rerank_candidates=settings.VECTOR_RERANK_CANDIDATES,
+    )
+  if name == 'numpy':
+    return NumpyBackend(get_vector_matrix())
+  raise ValueError(f"Unknown search backend: {name}")
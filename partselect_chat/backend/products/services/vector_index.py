@@ -0,0 +1,124 @@
+from typing import List, Optional, Sequence
+from django.conf import settings
+
+
+EMBEDDING_DIMENSIONS = 1536
+
+
+# Index names per method; at most one of them exists at a time
+INDEX_NAMES = {
+    'hnsw': 'products_productdocument_embedding_hnsw',
+    'ivfflat': 'products_productdocument_embedding_ivfflat',
+}
+
+# Guide chunks are far fewer than products and always use HNSW
+GUIDE_INDEX_NAME = 'products_guidedocument_embedding_hnsw'
+
+# search_products orders by L2Distance, so the index must use the L2 operator class
+OPCLASS = 'vector_l2_ops'
+
+# Quantized forms of the embedding that an index can be built over, as index
+# expressions so the table still stores one full-precision vector per row. A
+# halfvec index is half the size of a full one and a binary one 1/32; searches
+# through either re-rank their candidates on the full vectors. Both need
+# pgvector 0.7+.
+QUANTIZATIONS = {
+    'none': {'expression': '{column}', 'opclass': OPCLASS},
+    'halfvec': {'expression': '({column}::halfvec({dimensions}))', 'opclass': 'halfvec_l2_ops'},
+    'binary': {'expression': '(binary_quantize({column})::bit({dimensions}))', 'opclass': 'bit_hamming_ops'},
+}
+
+
+def index_name(method: str, quantization: str = 'none') -> str:
+  if quantization == 'none':
+    return INDEX_NAMES[method]
+  return f"{INDEX_NAMES[method]}_{quantization}"
+
+
+def all_index_names() -> List[str]:
+  """Every ProductDocument vector index name, for dropping whichever exists"""
+  return [index_name(method, quantization) for method in INDEX_NAMES for quantization in QUANTIZATIONS]
+
+
+def vector_literal(embedding: Sequence[float]) -> str:
+  return '[' + ','.join(str(float(value)) for value in embedding) + ']'
+
+
+def quantized_distance_sql(
+    quantization: str,
+    column: str = 'products_productdocument.embedding',
+    query: str = '%s',
+    dimensions: int = EMBEDDING_DIMENSIONS
+) -> str:
+  """Distance between the quantized ``column`` and the ``query`` vector (SQL for each).
+
+  Matches the index expression of create_index_sql, so the planner can walk
+  the quantized index: L2 over halfvec, Hamming over binary codes.
+  """
+  if quantization == 'halfvec':
+    return f"{column}::halfvec({dimensions}) <-> {query}::halfvec({dimensions})"
+  if quantization == 'binary':
+    return f"binary_quantize({column})::bit({dimensions}) <~> binary_quantize({query}::vector)"
+  raise ValueError(f"Unknown vector quantization: {quantization}")
+
+
+def create_index_sql(
+    method: str,
+    table: str = 'products_productdocument',
+    column: str = 'embedding',
+    opclass: str = OPCLASS,
+    name: Optional[str] = None,
+    lists: Optional[int] = None,
+    m: Optional[int] = None,
+    ef_construction: Optional[int] = None,
+    quantization: str = 'none',
+    dimensions: int = EMBEDDING_DIMENSIONS,
+) -> str:
+  """CREATE INDEX CONCURRENTLY statement for an HNSW or IVFFlat vector index"""
+  name = name or index_name(method, quantization)
+  if quantization != 'none':
+    spec = QUANTIZATIONS[quantization]
+    column = spec['expression'].format(column=column, dimensions=dimensions)
+    opclass = spec['opclass']
+  if method == 'hnsw':
+    params = (
+        f"m = {m or settings.HNSW_M}, "
+        f"ef_construction = {ef_construction or settings.HNSW_EF_CONSTRUCTION}"
+    )
+  elif method == 'ivfflat':
+    params = f"lists = {lists or settings.IVFFLAT_LISTS}"
+  else:
+    raise ValueError(f"Unknown vector index method: {method}")
+
+  return (
+      f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+      f"ON {table} USING {method} ({column} {opclass}) WITH ({params})"
+  )
+
+
+def drop_index_sql(method: str, name: Optional[str] = None) -> str:
+  return f"DROP INDEX CONCURRENTLY IF EXISTS {name or INDEX_NAMES[method]}"
+
+
+def default_ef_search() -> int:
+  """HNSW_EF_SEARCH, raised to the re-rank candidate count for quantized search"""
+  if settings.VECTOR_QUANTIZATION == 'none':
+    return settings.HNSW_EF_SEARCH
+  return max(settings.HNSW_EF_SEARCH, settings.VECTOR_RERANK_CANDIDATES)
+
+
+def search_params_sql(
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    local: bool = False
+) -> str:
+  """SET statements for ANN query-time knobs.
+
+  Unknown settings are accepted as placeholders before the extension loads,
+  so both knobs are always set regardless of which index exists.
+  """
+  scope = 'SET LOCAL' if local else 'SET'
+  return (
+      f"{scope} hnsw.ef_search = {int(ef_search or default_ef_search())}; "
+      f"{scope} ivfflat.probes = {int(probes or settings.IVFFLAT_PROBES)}"
+  )
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import Signal, receiver
+from .models import Product, InstallationGuide, ModelCompatibility
+from .services.object_cache import get_object_cache
+from .services.vector_index import search_params_sql
+
+# Sent after bulk writes that bypass Model.save(). ``part_numbers`` are the
+# products whose price or stock changed; ``changed`` are all products whose
+# row, guide or compatibility rows were written.
+products_bulk_updated = Signal()
+
+
+@receiver(connection_created)
+def set_search_params(sender, connection, **kwargs):
+  """Apply ANN and trigram query-time settings once per connection instead of per query"""
+  if connection.vendor != 'postgresql':
+    return
+  with connection.cursor() as cursor:
+    cursor.execute(search_params_sql())
+    # Lets the trigram % operator (and its GIN index) prune at our cutoff
+    cursor.execute(
+        "SET pg_trgm.similarity_threshold = %s",
+        [settings.IDENTIFIER_SIMILARITY_CUTOFF]
+    )
+
+
+def invalidate_objects(part_numbers):
+  """Drop cached product/guide dicts once the current transaction commits"""
+  part_numbers = [part_number for part_number in part_numbers if part_number]
+  if settings.OBJECT_CACHE_ENABLED and part_numbers:
+    transaction.on_commit(lambda: get_object_cache().invalidate(part_numbers))
+
+
+def _part_number(sender, instance):
+  """Part number of a guide's or compatibility row's product, without a query when loaded"""
+  if sender.product.is_cached(instance):
+    return instance.product.part_number
+  return Product.objects.filter(pk=instance.product_id).values_list('part_number', flat=True).first()
+
+
+@receiver(pre_save, sender=Product)
+def remember_stored_part_number(sender, instance, **kwargs):
+  """Part number currently in the database, so a renamed product's old entries are dropped too"""
+  if settings.OBJECT_CACHE_ENABLED and instance.pk is not None:
+    instance._stored_part_number = Product.objects.filter(
+        pk=instance.pk
+    ).values_list('part_number', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_cached_product(sender, instance, **kwargs):
+  invalidate_objects([instance.part_number, getattr(instance, '_stored_part_number', None)])
+
+
+@receiver(post_save, sender=InstallationGuide)
+@receiver(post_delete, sender=InstallationGuide)
+@receiver(post_save, sender=ModelCompatibility)
+@receiver(post_delete, sender=ModelCompatibility)
+def invalidate_cached_related(sender, instance, **kwargs):
+  if settings.OBJECT_CACHE_ENABLED:
+    invalidate_objects([_part_number(sender, instance)])
+
+
+@receiver(products_bulk_updated)
+def invalidate_cached_objects_on_bulk_update(sender, part_numbers, changed=(), **kwargs):
+  invalidate_objects(set(part_numbers).union(changed))
@@ -1,3 +1,990 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import tempfile
+import httpx
+import numpy as np
+from asgiref.sync import async_to_sync
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from openai import RateLimitError
+from .models import (
+    Product, ProductDocument, InstallationGuide, GuideDocument, ModelCompatibility, EmbeddingCheckpoint, QueryEmbedding
+)
+from .chunking import split_guide
+from .services.product_service import ProductService, reciprocal_rank_fusion
+from .services.catalog_import import CatalogImporter
+from .services.embedding_cache import EmbeddingCache
+from .services.embedding_pipeline import EmbeddingPipeline
+from .services.object_cache import get_object_cache
+from .services.search_backends import NumpyBackend, PgVectorBackend, VectorMatrix, WATERMARK_EPOCH, recall_at_k
+from .services.identifier_resolver import extract_identifiers
+from utils.timing import server_timing_header
 
-# Create your tests here.
+
+EMBEDDING_DIMENSIONS = 1536
+
+
+class FakeEmbeddings:
+  """Deterministic stand-in for OpenAIEmbeddings"""
+
+  def __init__(self):
+    self.calls = 0
+
+  async def aembed_query(self, text):
+    self.calls += 1
+    return [0.0] * EMBEDDING_DIMENSIONS
+
+  async def aembed_documents(self, texts):
+    self.calls += 1
+    return [[0.0] * EMBEDDING_DIMENSIONS for _ in texts]
+
+
+def create_product(index, appliance_type='DISHWASHER', models_per_product=3):
+  product = Product.objects.create(
+      part_number=f'W1000{index:04d}',
+      name=f'Spray Arm {index}',
+      description='Upper spray arm assembly',
+      appliance_type=appliance_type,
+      price='45.99',
+      stock_quantity=10
+  )
+  ProductDocument.objects.create(product=product, embedding=[0.0] * EMBEDDING_DIMENSIONS)
+  InstallationGuide.objects.create(product=product, content=f'Install spray arm {index}')
+  for m in range(models_per_product):
+    ModelCompatibility.objects.create(
+        product=product,
+        model_number=f'WDT{index:03d}{m}SAHZ',
+        brand='Whirlpool'
+    )
+  return product
+
+
+class RetrievalQueryCountTests(TestCase):
+  """Retrieval must cost a fixed number of queries regardless of result count"""
+
+  @classmethod
+  def setUpTestData(cls):
+    for i in range(5):
+      create_product(i)
+
+  def setUp(self):
+    self.service = ProductService(embeddings=FakeEmbeddings(), search_mode='vector')
+
+  # assertNumQueries opens the connection synchronously, so these drive the
+  # async service through async_to_sync
+  def test_part_number_lookup_with_compatibility(self):
+    # product, guides, compatibility rows
+    with self.assertNumQueries(3):
+      products = async_to_sync(self.service.search_products)('W10000003', with_compatibility=True)
+
+    self.assertEqual(len(products), 1)
+    self.assertEqual(len(products[0]['compatibility_info']), 3)
+    self.assertEqual(products[0]['installation_guide'], 'Install spray arm 3')
+
+  def test_semantic_search_query_count_does_not_grow_with_limit(self):
+    for limit in (1, 3, 5):
+      with self.assertNumQueries(3):
+        products = async_to_sync(self.service.search_products)(
+            'spray arm', limit=limit, with_compatibility=True
+        )
+      self.assertEqual(len(products), limit)
+      # Identical embeddings: distance 0, similarity 1
+      self.assertEqual(products[0]['similarity_score'], 1.0)
+
+  def test_relevant_context_has_no_per_product_queries(self):
+    # products, guides, compatibility rows, matching guide sections
+    with self.assertNumQueries(4):
+      context = async_to_sync(self.service.get_relevant_context)('spray arm')
+
+    self.assertEqual(len(context['products']), 3)
+    for product in context['products']:
+      self.assertEqual(len(product['compatibility_info']), 3)
+
+  def test_check_compatibility_single_search(self):
+    with self.assertNumQueries(3):
+      result = async_to_sync(self.service.check_compatibility)('W10000001', 'WDT0010SAHZ')
+
+    self.assertEqual(result['product_details']['part_number'], 'W10000001')
+    self.assertIn(
+        'WDT0010SAHZ',
+        [c['model_number'] for c in result['compatible_models']]
+    )
+
+
+class EmbeddingCacheTests(TestCase):
+  async def test_repeated_query_skips_api_call(self):
+    embeddings = FakeEmbeddings()
+    cache = EmbeddingCache(max_entries=10, ttl=60)
+
+    await cache.embed_query(embeddings, 'Water Filter')
+    await cache.embed_query(embeddings, '  water   filter ')
+
+    self.assertEqual(embeddings.calls, 1)
+    self.assertEqual(cache.stats()['memory_hits'], 1)
+    self.assertEqual(cache.stats()['misses'], 1)
+
+  async def test_durable_tier_survives_memory_eviction(self):
+    embeddings = FakeEmbeddings()
+    cache = EmbeddingCache(max_entries=10, ttl=60)
+
+    await cache.embed_query(embeddings, 'ice maker not working')
+    cache.clear()
+    await cache.embed_query(embeddings, 'ice maker not working')
+
+    self.assertEqual(embeddings.calls, 1)
+    self.assertEqual(cache.stats()['db_hits'], 1)
+
+  async def test_entries_expire_after_ttl(self):
+    embeddings = FakeEmbeddings()
+    cache = EmbeddingCache(max_entries=10, ttl=0, persist=False)
+
+    await cache.embed_query(embeddings, 'door latch')
+    await cache.embed_query(embeddings, 'door latch')
+
+    self.assertEqual(embeddings.calls, 2)
+
+  def test_old_stored_embeddings_are_pruned(self):
+    cache = EmbeddingCache(max_entries=10, ttl=60)
+    embed = async_to_sync(cache.embed_query)
+    embed(FakeEmbeddings(), 'old query')
+    embed(FakeEmbeddings(), 'new query')
+    QueryEmbedding.objects.filter(query='old query').update(created_at=timezone.now() - timedelta(days=31))
+
+    call_command('prune_embedding_cache', '--max-age-days', '30', stdout=io.StringIO())
+    self.assertEqual(list(QueryEmbedding.objects.values_list('query', flat=True)), ['new query'])
+
+
+class VectorMatrixTests(TestCase):
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.matrix = VectorMatrix(Path(tmp.name) / 'embeddings.f32', reload_interval=0)
+
+  def set_embedding(self, product, index):
+    vector = [0.0] * EMBEDDING_DIMENSIONS
+    vector[index] = 1.0
+    return self.save_embedding(product, vector)
+
+  def save_embedding(self, product, vector):
+    # save() rather than update() so updated_at moves past the sync watermark
+    document = ProductDocument.objects.get(product=product)
+    document.embedding = vector
+    document.save()
+    return vector
+
+  def test_top_k_with_appliance_filter(self):
+    dishwasher = create_product(1)
+    fridge = create_product(2, appliance_type='REFRIGERATOR')
+    query = self.set_embedding(dishwasher, 0)
+    self.set_embedding(fridge, 0)
+    self.matrix.sync()
+
+    hits = self.matrix.search(query, 5, None, 0.7)
+    self.assertEqual({pid for pid, _ in hits}, {dishwasher.id, fridge.id})
+
+    hits = self.matrix.search(query, 5, 'REFRIGERATOR', 0.7)
+    self.assertEqual([pid for pid, _ in hits], [fridge.id])
+
+  def test_incremental_sync_applies_updates_and_deletes(self):
+    first = create_product(1)
+    second = create_product(2)
+    query = self.set_embedding(first, 0)
+    self.set_embedding(second, 1)
+    self.matrix.sync()
+
+    self.set_embedding(second, 0)
+    first.delete()
+    result = self.matrix.sync()
+
+    self.assertEqual(result['removed'], 1)
+    hits = self.matrix.search(query, 5, None, 0.1)
+    self.assertEqual([pid for pid, _ in hits], [second.id])
+
+  def test_sync_leaves_the_published_file_alone(self):
+    product = create_product(1)
+    old = self.set_embedding(product, 0)
+    self.matrix.sync()
+    reader = VectorMatrix(self.matrix.path, reload_interval=0)
+    reader.load()
+
+    new = self.set_embedding(product, 1)
+    self.matrix.sync()
+    self.assertEqual(reader.matrix[0].tolist(), old)
+    reader.load()
+    self.assertEqual(reader.matrix[0].tolist(), new)
+
+  def test_write_committed_late_at_the_watermark_is_synced(self):
+    first = create_product(1)
+    second = create_product(2)
+    self.set_embedding(first, 0)
+    self.set_embedding(second, 1)
+    self.matrix.sync()
+    self.assertEqual(self.matrix.sync()['updated'], 0)
+
+    meta = np.load(self.matrix.meta_path)
+    stamp = WATERMARK_EPOCH + timedelta(microseconds=int(meta['watermark']))
+    vector = [0.0] * EMBEDDING_DIMENSIONS
+    vector[2] = 1.0
+    # Written before the sync but committed after it, stamped like second
+    ProductDocument.objects.filter(product=first).update(embedding=vector, updated_at=stamp)
+
+    self.assertEqual(self.matrix.sync()['updated'], 1)
+    self.assertEqual([pid for pid, _ in self.matrix.search(vector, 5, None, 0.1)], [first.id])
+
+  def test_backend_returns_products_in_distance_order(self):
+    near = create_product(1)
+    far = create_product(2)
+    query = self.set_embedding(near, 0)
+    far_vector = list(query)
+    far_vector[1] = 0.5
+    self.save_embedding(far, far_vector)
+    self.matrix.sync()
+
+    matches = NumpyBackend(self.matrix).search(query, 2, None, 0.7)
+    self.assertEqual([p.id for p, _ in matches], [near.id, far.id])
+
+
+class HybridSearchTests(TestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.filter_product = Product.objects.create(
+        part_number='W10295370A',
+        name='Refrigerator Water Filter',
+        description='Reduces lead, mercury and pesticides in drinking water',
+        appliance_type='REFRIGERATOR',
+        price='49.99'
+    )
+    cls.pump_product = Product.objects.create(
+        part_number='W10195417',
+        name='Circulation Pump Motor',
+        description='Main circulation pump with thermal protection',
+        appliance_type='DISHWASHER',
+        price='145.99'
+    )
+
+  async def test_lexical_mode_searches_descriptions_without_embedding(self):
+    embeddings = FakeEmbeddings()
+    service = ProductService(embeddings=embeddings, search_mode='lexical')
+
+    products = await service.search_products('removes mercury from water')
+
+    self.assertEqual([p['part_number'] for p in products], ['W10295370A'])
+    self.assertEqual(embeddings.calls, 0)
+
+  async def test_hybrid_mode_falls_back_to_vector_when_lexical_misses(self):
+    embeddings = FakeEmbeddings()
+    service = ProductService(embeddings=embeddings, search_mode='hybrid')
+
+    await service.search_products('something unrelated entirely')
+
+    self.assertEqual(embeddings.calls, 1)
+
+  async def test_confident_name_match_skips_embedding(self):
+    embeddings = FakeEmbeddings()
+    service = ProductService(embeddings=embeddings, search_mode='hybrid')
+
+    products = await service.search_products('circulation pump motor')
+
+    self.assertEqual(products[0]['part_number'], 'W10195417')
+    self.assertGreaterEqual(products[0]['similarity_score'], settings.SEARCH_LEXICAL_CONFIDENCE)
+    self.assertEqual(embeddings.calls, 0)
+
+  def test_service_defaults_to_configured_mode(self):
+    self.assertEqual(ProductService().search_mode, settings.PRODUCT_SEARCH_MODE)
+
+
+class ReciprocalRankFusionTests(SimpleTestCase):
+  def test_items_ranked_well_in_both_lists_win(self):
+    lexical = [(1, 0.9), (2, 0.5), (3, 0.1)]
+    vector = [(2, 0.1), (4, 0.2), (1, 0.3)]
+
+    fused = [item for item, _ in reciprocal_rank_fusion([lexical, vector], k=60)]
+
+    self.assertEqual(fused[:2], [2, 1])
+    self.assertEqual(set(fused), {1, 2, 3, 4})
+
+  def test_scores_are_normalized(self):
+    fused = reciprocal_rank_fusion([[(1, 0.9)], [(1, 0.1)]], k=60)
+    self.assertEqual(fused, [(1, 1.0)])
+
+
+class IdentifierResolverTests(TestCase):
+  @classmethod
+  def setUpTestData(cls):
+    Product.objects.create(
+        part_number='W10295370A',
+        name='Refrigerator Water Filter',
+        description='EveryDrop Filter 1',
+        appliance_type='REFRIGERATOR',
+        price='49.99'
+    )
+
+  def setUp(self):
+    self.embeddings = FakeEmbeddings()
+    self.service = ProductService(embeddings=self.embeddings)
+
+  async def test_lowercase_dashed_part_number_is_exact(self):
+    products = await self.service.search_products('do you have w10295370-a?')
+
+    self.assertEqual(products[0]['part_number'], 'W10295370A')
+    self.assertEqual(products[0]['similarity_score'], 1.0)
+    self.assertEqual(self.embeddings.calls, 0)
+
+  async def test_typo_resolves_without_embedding(self):
+    products = await self.service.search_products('W1029537OA')
+
+    self.assertEqual(products[0]['part_number'], 'W10295370A')
+    self.assertLess(products[0]['similarity_score'], 1.0)
+    self.assertEqual(self.embeddings.calls, 0)
+
+
+class ExtractIdentifiersTests(SimpleTestCase):
+  def test_extracts_part_and_model_numbers(self):
+    self.assertEqual(
+        extract_identifiers('Does wp-2198597 fit my WRF535SMHZ fridge?'),
+        ['WP2198597', 'WRF535SMHZ']
+    )
+
+  def test_ignores_words_and_short_tokens(self):
+    self.assertEqual(extract_identifiers('PART_NUMBER: 120V ice maker'), [])
+
+  def test_accepts_digit_leading_numbers(self):
+    self.assertEqual(extract_identifiers('part 2198597'), ['2198597'])
+
+
+class PartsForModelTests(TestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.products = [create_product(i, models_per_product=0) for i in range(5)]
+    for product in cls.products:
+      ModelCompatibility.objects.create(product=product, model_number='wrf-535smhz', brand='Whirlpool')
+    ModelCompatibility.objects.create(
+        product=create_product(9, appliance_type='REFRIGERATOR', models_per_product=0),
+        model_number='WRF535SMHZ',
+        brand='Maytag'
+    )
+
+  def setUp(self):
+    self.service = ProductService(embeddings=FakeEmbeddings())
+
+  def test_keyset_pages_cover_all_parts_once(self):
+    seen = []
+    after = None
+    while True:
+      with self.assertNumQueries(1):
+        page = async_to_sync(self.service.get_parts_for_model)('WRF535SMHZ', after=after, limit=2)
+      seen.extend(part['id'] for part in page['results'])
+      after = page['next_after']
+      if after is None:
+        break
+
+    self.assertEqual(len(seen), 6)
+    self.assertEqual(seen, sorted(seen))
+
+  async def test_filters_by_appliance_and_brand(self):
+    page = await self.service.get_parts_for_model('wrf535smhz', appliance_type='REFRIGERATOR')
+    self.assertEqual([p['brand'] for p in page['results']], ['Maytag'])
+
+    page = await self.service.get_parts_for_model('WRF535SMHZ', brand='whirlpool')
+    self.assertEqual(len(page['results']), 5)
+
+  def test_filtered_out_parts_are_an_empty_page(self):
+    response = self.client.get('/api/products/by-model/WRF535SMHZ/?brand=GE')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.json()['results'], [])
+
+  def test_unknown_model_is_not_found(self):
+    response = self.client.get('/api/products/by-model/WRF535SMHX/')
+    self.assertEqual(response.status_code, 404)
+    self.assertIn('WRF535SMHZ', response.json()['suggestions'])
+
+  async def test_finds_model_numbers_in_message(self):
+    models = await self.service.find_model_numbers('What parts fit my wrf535smhz and W10000001?')
+    self.assertEqual(models, ['WRF535SMHZ'])
+
+
+class FlakyEmbeddings(FakeEmbeddings):
+  """Rate-limits the first request, then behaves like FakeEmbeddings"""
+
+  async def aembed_documents(self, texts):
+    self.calls += 1
+    if self.calls == 1:
+      request = httpx.Request('POST', 'https://api.openai.com/v1/embeddings')
+      raise RateLimitError('Rate limit reached', response=httpx.Response(429, request=request), body=None)
+    return [[0.0] * EMBEDDING_DIMENSIONS for _ in texts]
+
+
+class EmbeddingPipelineTests(TestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.products = [create_product(i, models_per_product=0) for i in range(5)]
+
+  def pipeline(self, embeddings):
+    return EmbeddingPipeline(embeddings, batch_size=2, concurrency=2, base_backoff=0, log=lambda message: None)
+
+  async def test_unchanged_rows_are_skipped(self):
+    embeddings = FakeEmbeddings()
+    stats = await self.pipeline(embeddings).run('products')
+    self.assertEqual(stats, {'seen': 5, 'embedded': 5, 'skipped': 0})
+    self.assertEqual(embeddings.calls, 3)
+
+    product = self.products[2]
+    product.name = 'Lower Spray Arm'
+    await product.asave(update_fields=['name'])
+
+    embeddings = FakeEmbeddings()
+    stats = await self.pipeline(embeddings).run('products')
+    self.assertEqual(stats, {'seen': 5, 'embedded': 1, 'skipped': 4})
+    self.assertEqual(embeddings.calls, 1)
+
+  async def test_resumes_from_checkpoint(self):
+    await EmbeddingCheckpoint.objects.acreate(name='products', last_id=self.products[2].id)
+
+    stats = await self.pipeline(FakeEmbeddings()).run('products')
+    self.assertEqual(stats['seen'], 2)
+    self.assertFalse(await EmbeddingCheckpoint.objects.filter(name='products').aexists())
+
+  async def test_rate_limited_batch_is_retried(self):
+    embeddings = FlakyEmbeddings()
+    stats = await self.pipeline(embeddings).run('guides')
+    self.assertEqual(stats['embedded'], 5)
+    self.assertEqual(await GuideDocument.objects.acount(), 5)
+
+
+class CatalogImportTests(TestCase):
+  def feed(self, **overrides):
+    row = {
+        'part_number': 'W10712395',
+        'name': 'Dishwasher Upper Rack Adjuster',
+        'description': 'Adjuster kit for the upper rack',
+        'appliance_type': 'dishwasher',
+        'price': '24.99',
+        'stock_quantity': '12',
+        'installation_guide': 'Remove the rack and clip on the adjuster.',
+        'brand': 'Whirlpool',
+        'compatible_models': 'WDT780SAEM1|WDF520PADM7',
+    }
+    row.update(overrides)
+    return row
+
+  def test_import_creates_then_updates_in_place(self):
+    importer = CatalogImporter(chunk_size=2, log=lambda message: None)
+    stats = importer.run([self.feed(), self.feed(part_number='W10195839'), {'part_number': ''}])
+    self.assertEqual((stats['created'], stats['invalid']), (2, 1))
+
+    product = Product.objects.get(part_number='W10712395')
+    self.assertEqual(product.installation_guides.get().content, 'Remove the rack and clip on the adjuster.')
+    self.assertEqual(
+        sorted(product.compatible_models.values_list('model_number_normalized', flat=True)),
+        ['WDF520PADM7', 'WDT780SAEM1']
+    )
+
+    stats = importer.run([
+        self.feed(price='19.99', compatible_models='WDT780SAEM1|WDT750SAHZ0'),
+        self.feed(part_number='W10195839'),
+    ])
+    self.assertEqual((stats['created'], stats['updated']), (0, 1))
+    product.refresh_from_db()
+    self.assertEqual(str(product.price), '19.99')
+    self.assertEqual(product.installation_guides.count(), 1)
+    self.assertEqual(product.compatible_models.count(), 3)
+
+  def test_part_numbers_are_stored_normalized(self):
+    importer = CatalogImporter(log=lambda message: None)
+    importer.run([self.feed(part_number='wp-2198597'), self.feed(part_number='W 10195839')])
+    self.assertEqual(
+        sorted(Product.objects.values_list('part_number', flat=True)), ['W10195839', 'WP2198597']
+    )
+
+    service = ProductService(embeddings=FakeEmbeddings())
+    result = async_to_sync(service.check_compatibility)('WP 2198597', 'WDT780SAEM1')
+    self.assertEqual(result['product_details']['part_number'], 'WP2198597')
+    guide = async_to_sync(service.get_installation_guide)('wp-2198597')
+    self.assertEqual(guide['content'], 'Remove the rack and clip on the adjuster.')
+
+
+GUIDE = """Installation Guide for W10300024 Spray Arm Assembly
+
+Safety Instructions:
+- Disconnect power
+
+Tools Required:
+- Phillips screwdriver
+
+Installation Steps:
+1. Removal:
+   - Unscrew the old spray arm
+
+4. Testing:
+   - Run a rinse cycle"""
+
+
+class SplitGuideTests(SimpleTestCase):
+  def test_sections(self):
+    chunks = split_guide(GUIDE)
+    self.assertEqual([section for section, _ in chunks], ['overview', 'safety', 'tools', 'steps', 'testing'])
+    self.assertIn('Unscrew the old spray arm', chunks[3][1])
+
+  def test_long_sections_are_split_at_paragraphs(self):
+    steps = 'Installation Steps:\n' + '\n\n'.join(f'{i}. Step text ' * 10 for i in range(20))
+    chunks = split_guide(steps, max_chars=300)
+    self.assertGreater(len(chunks), 1)
+    self.assertTrue(all(section == 'steps' and len(text) <= 300 for section, text in chunks))
+
+
+class AxisEmbeddings(FakeEmbeddings):
+  """Embeds every query as the unit vector along one axis"""
+
+  def __init__(self, axis):
+    super().__init__()
+    self.axis = axis
+
+  async def aembed_query(self, text):
+    self.calls += 1
+    vector = [0.0] * EMBEDDING_DIMENSIONS
+    vector[self.axis] = 1.0
+    return vector
+
+
+class GuideSearchTests(TestCase):
+  @classmethod
+  def setUpTestData(cls):
+    product = create_product(0, models_per_product=0)
+    guide = InstallationGuide.objects.create(product=product, content=GUIDE)
+    chunks = guide.get_chunks()
+    for chunk in chunks:
+      chunk.embedding = [0.0] * EMBEDDING_DIMENSIONS
+      chunk.embedding[chunk.position] = 1.0
+    GuideDocument.objects.bulk_create(chunks)
+
+  def test_returns_only_matching_sections(self):
+    # Axis 3 is the steps chunk
+    service = ProductService(embeddings=AxisEmbeddings(3))
+    with self.assertNumQueries(1):
+      chunks = async_to_sync(service.search_guides)('how do I install the spray arm', max_distance=0.5)
+
+    self.assertEqual([c['section'] for c in chunks], ['steps'])
+    self.assertEqual(chunks[0]['part_number'], 'W10000000')
+    self.assertNotIn('Disconnect power', chunks[0]['content'])
+
+  async def test_limited_to_given_parts(self):
+    service = ProductService(embeddings=AxisEmbeddings(3))
+    self.assertEqual(await service.search_guides('install', part_numbers=['W10999999']), [])
+
+
+class QuantizedSearchTests(TestCase):
+  """Quantized candidate passes re-ranked on full vectors match exact search"""
+
+  @classmethod
+  def setUpTestData(cls):
+    for i in range(6):
+      product = create_product(i, models_per_product=0)
+      # Mostly along axis i, with a shared component so distances differ
+      embedding = [0.0] * EMBEDDING_DIMENSIONS
+      embedding[i] = 1.0
+      embedding[10] = 0.1 * i
+      ProductDocument.objects.filter(product=product).update(embedding=embedding)
+
+  def query(self):
+    embedding = [0.0] * EMBEDDING_DIMENSIONS
+    embedding[2] = 1.0
+    embedding[10] = 0.25
+    return embedding
+
+  def test_quantized_modes_rank_like_exact(self):
+    exact = PgVectorBackend().nearest_ids(self.query(), 3, None, 10.0)
+    for quantization in ('halfvec', 'binary'):
+      backend = PgVectorBackend(quantization=quantization, rerank_candidates=6)
+      found = backend.nearest_ids(self.query(), 3, None, 10.0)
+      self.assertEqual([pid for pid, _ in found], [pid for pid, _ in exact])
+      # Distances come from the full vectors, not the quantized ones
+      self.assertAlmostEqual(found[0][1], exact[0][1], places=5)
+
+  def test_recall_against_exact_scan(self):
+    backend = PgVectorBackend(quantization='binary', rerank_candidates=6)
+    result = recall_at_k(backend, [self.query()], k=3)
+    self.assertEqual(result['queries'], 1)
+    self.assertEqual(result['recall'], 1.0)
+
+
+class QuantizedCandidateTests(TestCase):
+  """With more rows than re-rank candidates, the candidates must come from the quantized index order"""
+
+  @classmethod
+  def setUpTestData(cls):
+    for i in range(30):
+      product = create_product(i, models_per_product=0)
+      embedding = [0.0] * EMBEDDING_DIMENSIONS
+      embedding[0] = float(i)
+      ProductDocument.objects.filter(product=product).update(embedding=embedding)
+
+  def test_candidates_are_the_nearest_quantized_rows(self):
+    query = [0.0] * EMBEDDING_DIMENSIONS
+    query[0] = 20.0
+    backend = PgVectorBackend(quantization='halfvec', rerank_candidates=5)
+    found = backend.nearest_ids(query, 3, None, 10.0)
+    exact = PgVectorBackend().nearest_ids(query, 3, None, 10.0)
+    # 19 and 21 tie, so compare as sets
+    self.assertEqual({pid for pid, _ in found}, {pid for pid, _ in exact})
+    self.assertEqual(Product.objects.get(pk=found[0][0]).part_number, 'W10000020')
+
+
+@override_settings(SERVER_TIMING_ENABLED=True)
+class ServerTimingTests(TestCase):
+  @classmethod
+  def setUpTestData(cls):
+    create_product(0)
+
+  def test_header_reports_query_time(self):
+    response = self.client.get('/api/products/W10000000/')
+    self.assertEqual(response.status_code, 200)
+    header = response['Server-Timing']
+    self.assertIn('db;dur=', header)
+    self.assertRegex(header, r'total;dur=\d+\.\d$')
+
+  def test_header_sums_repeated_stages(self):
+    header = server_timing_header([('db', 1.0), ('db', 2.5), ('llm', 10.0)], 20.0)
+    self.assertEqual(header, 'db;dur=3.5;desc="2 calls", llm;dur=10.0, total;dur=20.0')
+
+  def test_metrics_endpoint(self):
+    self.client.get('/api/products/W10000000/')
+    body = self.client.get('/metrics').content.decode()
+    self.assertIn('partselect_stage_duration_seconds_bucket{stage="db",le="+Inf"}', body)
+    self.assertIn('route="api/products/<str:part_number>/"', body)
+
+  @override_settings(METRICS_ENABLED=False)
+  def test_metrics_can_be_disabled(self):
+    self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+  @override_settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN='scrape-secret')
+  def test_metrics_require_allowed_ip_or_token(self):
+    self.assertEqual(self.client.get('/metrics').status_code, 403)
+    self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+    self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret').status_code, 200)
+
+  @override_settings(SERVER_TIMING_ENABLED=False)
+  def test_header_can_be_disabled(self):
+    self.assertNotIn('Server-Timing', self.client.get('/api/products/W10000000/'))
+
+
+class ObjectCacheTests(TestCase):
+  """Product/guide object cache over the locmem 'default' cache as L2"""
+
+  @classmethod
+  def setUpTestData(cls):
+    for i in range(2):
+      create_product(i)
+
+  def setUp(self):
+    self.cache = get_object_cache()
+    self.cache.clear()
+    caches['default'].clear()
+    self.service = ProductService(embeddings=FakeEmbeddings(), object_cache=self.cache)
+
+  # assertNumQueries opens the connection synchronously, so these drive the
+  # async service through async_to_sync
+  def test_repeated_lookups_skip_the_database(self):
+    get_guide = async_to_sync(self.service.get_installation_guide)
+    check = async_to_sync(self.service.check_compatibility)
+    get_guide('W10000001')
+    check('W10000001', 'WDT0010SAHZ')
+    with self.assertNumQueries(0):
+      guide = get_guide('W10000001')
+      result = check('W10000001', 'WDT0010SAHZ')
+      products = async_to_sync(self.service.search_products)('W10000001')
+
+    self.assertEqual(guide['content'], 'Install spray arm 1')
+    self.assertIn('WDT0010SAHZ', [c['model_number'] for c in result['compatible_models']])
+    self.assertNotIn('compatibility_info', products[0])
+
+  def test_spellings_of_a_part_number_share_an_entry(self):
+    async_to_sync(self.service.search_products)('W10000001', with_compatibility=True)
+    with self.assertNumQueries(0):
+      result = async_to_sync(self.service.check_compatibility)('w-10000001', 'WDT0010SAHZ')
+    self.assertEqual(result['product_details']['part_number'], 'W10000001')
+
+  def test_l2_is_shared_between_processes(self):
+    get_guide = async_to_sync(self.service.get_installation_guide)
+    get_guide('W10000001')
+    # A new worker starts with an empty L1
+    self.cache.clear()
+    with self.assertNumQueries(0):
+      guide = get_guide('W10000001')
+    self.assertEqual(guide['content'], 'Install spray arm 1')
+    self.assertEqual(self.cache.stats()['l2_hits'], 1)
+
+  def test_missing_parts_are_cached(self):
+    get_guide = async_to_sync(self.service.get_installation_guide)
+    self.assertIsNone(get_guide('W19999999'))
+    with self.assertNumQueries(0):
+      self.assertIsNone(get_guide('W19999999'))
+
+  def test_concurrent_misses_load_once(self):
+    async def load_concurrently():
+      return await asyncio.gather(*(self.service.get_installation_guide('W10000000') for _ in range(5)))
+
+    # product, guide
+    with self.assertNumQueries(2):
+      guides = async_to_sync(load_concurrently)()
+    self.assertEqual({guide['content'] for guide in guides}, {'Install spray arm 0'})
+
+  def test_load_racing_an_invalidation_is_not_cached(self):
+    loads = []
+
+    async def stale_load():
+      loads.append(1)
+      # The row changes and its commit invalidates while this load is in flight
+      self.cache.invalidate(['W10000000'])
+      return {'part_number': 'W10000000', 'stock_quantity': 1}
+
+    get = async_to_sync(self.cache.get_or_load)
+    get('product', 'W10000000', stale_load)
+    get('product', 'W10000000', stale_load)
+    self.assertEqual(len(loads), 2)
+
+  def test_callers_get_copies(self):
+    get_guide = async_to_sync(self.service.get_installation_guide)
+    get_guide('W10000001')['content'] = 'Changed by a caller'
+    self.assertEqual(get_guide('W10000001')['content'], 'Install spray arm 1')
+
+  def test_cached_part_respects_appliance_filter(self):
+    search = async_to_sync(self.service.search_products)
+    search('W10000001', with_compatibility=True)
+    self.assertEqual(search('W10000001', appliance_type='REFRIGERATOR'), [])
+    self.assertEqual(len(search('W10000001', appliance_type='DISHWASHER')), 1)
+
+  def test_saving_a_guide_invalidates_it(self):
+    get_guide = async_to_sync(self.service.get_installation_guide)
+    get_guide('W10000000')
+    guide = InstallationGuide.objects.get(product__part_number='W10000000')
+    guide.content = 'Updated steps'
+    with self.captureOnCommitCallbacks(execute=True):
+      guide.save()
+    self.assertEqual(get_guide('W10000000')['content'], 'Updated steps')
+
+  def test_saving_a_product_invalidates_it(self):
+    search = async_to_sync(self.service.search_products)
+    search('W10000000', with_compatibility=True)
+    product = Product.objects.get(part_number='W10000000')
+    product.stock_quantity = 0
+    with self.captureOnCommitCallbacks(execute=True):
+      product.save()
+    self.assertEqual(search('W10000000')[0]['stock_quantity'], 0)
+
+  def test_renaming_a_product_drops_the_old_part_number(self):
+    get_guide = async_to_sync(self.service.get_installation_guide)
+    get_guide('W10000000')
+    product = Product.objects.get(part_number='W10000000')
+    product.part_number = 'W10000009'
+    with self.captureOnCommitCallbacks(execute=True):
+      product.save()
+    self.assertIsNone(get_guide('W10000000'))
+
+  def test_adding_a_compatible_model_invalidates_the_product(self):
+    models = lambda: [
+        c['model_number']
+        for c in async_to_sync(self.service.check_compatibility)('W10000000', 'NEWMODEL1')['compatible_models']
+    ]
+    self.assertNotIn('NEWMODEL1', models())
+    product = Product.objects.get(part_number='W10000000')
+    with self.captureOnCommitCallbacks(execute=True):
+      ModelCompatibility.objects.create(product=product, model_number='NEWMODEL1', brand='Whirlpool')
+    self.assertIn('NEWMODEL1', models())
+
+
+class ConditionalGetTests(TestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.product = create_product(0)
+
+  def test_matching_etag_is_not_modified(self):
+    response = self.client.get('/api/products/W10000000/')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response['Cache-Control'], 'public, no-cache')
+    self.assertIn('Last-Modified', response)
+
+    with self.assertNumQueries(1):
+      response = self.client.get('/api/products/W10000000/', HTTP_IF_NONE_MATCH=response['ETag'])
+    self.assertEqual(response.status_code, 304)
+    self.assertEqual(response.content, b'')
+    self.assertIn('ETag', response)
+
+  def test_part_number_spellings_resolve(self):
+    self.assertEqual(self.client.get('/api/products/w-10000000/').json()['part_number'], 'W10000000')
+    self.assertEqual(self.client.get('/api/products/w10000000/installation-guide/').status_code, 200)
+
+  def test_if_modified_since(self):
+    response = self.client.get('/api/products/W10000000/installation-guide/')
+    response = self.client.get(
+        '/api/products/W10000000/installation-guide/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+    )
+    self.assertEqual(response.status_code, 304)
+
+  def test_updates_change_the_etag(self):
+    url = '/api/products/W10000000/installation-guide/'
+    etag = self.client.get(url)['ETag']
+    # The guide embeds its product, so a product change is a new guide response
+    self.product.price = '39.99'
+    self.product.save()
+    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, 200)
+    self.assertNotEqual(response['ETag'], etag)
+    self.assertEqual(response.json()['product']['price'], '39.99')
+
+  @override_settings(DETAIL_CACHE_CONTROL='')
+  def test_cache_control_can_be_omitted(self):
+    self.assertNotIn('Cache-Control', self.client.get('/api/products/W10000000/'))
+
+
+class ProductListTests(TestCase):
+  @classmethod
+  def setUpTestData(cls):
+    for i in range(5):
+      create_product(i, appliance_type='REFRIGERATOR' if i % 2 else 'DISHWASHER', models_per_product=0)
+
+  def test_keyset_pages_cover_the_catalog_in_order(self):
+    part_numbers, cursor = [], None
+    for _ in range(3):
+      params = {'limit': 2, 'fields': 'part_number,appliance_type'}
+      if cursor:
+        params['cursor'] = cursor
+      with self.assertNumQueries(1):
+        page = self.client.get('/api/products/', params).json()
+      part_numbers += [row['part_number'] for row in page['results']]
+      self.assertEqual(set(page['results'][0]), {'part_number', 'appliance_type'})
+      cursor = page['next_cursor']
+
+    self.assertIsNone(cursor)
+    self.assertEqual(part_numbers, ['W10000000', 'W10000002', 'W10000004', 'W10000001', 'W10000003'])
+
+  def test_filters_and_rejects_unknown_fields(self):
+    page = self.client.get('/api/products/', {'appliance_type': 'REFRIGERATOR'}).json()
+    self.assertEqual([row['part_number'] for row in page['results']], ['W10000001', 'W10000003'])
+    self.assertEqual(self.client.get('/api/products/', {'fields': 'name,search_vector'}).status_code, 400)
+    self.assertEqual(self.client.get('/api/products/', {'cursor': 'bad'}).status_code, 400)
+
+  async def test_ndjson_export_streams_every_row(self):
+    first = (await self.async_client.get('/api/products/', {'limit': 1})).json()
+    response = await self.async_client.get(
+        '/api/products/', {'format': 'ndjson', 'fields': 'part_number', 'cursor': first['next_cursor']}
+    )
+    self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+    body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+    rows = [json.loads(line) for line in body.splitlines()]
+    self.assertEqual(rows[0], {'part_number': 'W10000002'})
+    self.assertEqual(len(rows), 4)
+
+
+class NamedAxisEmbeddings(FakeEmbeddings):
+  """Embeds 'axis N' as the unit vector along axis N"""
+
+  async def aembed_documents(self, texts):
+    self.calls += 1
+    vectors = []
+    for text in texts:
+      vector = [0.0] * EMBEDDING_DIMENSIONS
+      vector[int(text.split()[-1])] = 1.0
+      vectors.append(vector)
+    return vectors
+
+
+class BatchSearchTests(TestCase):
+  @classmethod
+  def setUpTestData(cls):
+    for i in range(6):
+      product = create_product(i, models_per_product=0)
+      embedding = [0.0] * EMBEDDING_DIMENSIONS
+      embedding[i] = 1.0
+      embedding[10] = 0.1 * i
+      ProductDocument.objects.filter(product=product).update(embedding=embedding)
+
+  def axis(self, i):
+    embedding = [0.0] * EMBEDDING_DIMENSIONS
+    embedding[i] = 1.0
+    return embedding
+
+  def test_lateral_search_matches_one_query_per_vector(self):
+    queries = [self.axis(2), self.axis(4)]
+    for quantization in ('none', 'halfvec', 'binary'):
+      backend = PgVectorBackend(quantization=quantization, rerank_candidates=6)
+      with self.assertNumQueries(1):
+        batch = backend.nearest_ids_many(queries, 3, None, 10.0)
+      single = [backend.nearest_ids(query, 3, None, 10.0) for query in queries]
+      self.assertEqual([[pid for pid, _ in hits] for hits in batch], [[pid for pid, _ in hits] for hits in single])
+
+    self.assertEqual(PgVectorBackend().nearest_ids_many(queries, 3, 'REFRIGERATOR', 10.0), [[], []])
+
+  def test_one_embedding_call_and_fixed_queries(self):
+    embeddings = NamedAxisEmbeddings()
+    service = ProductService(embeddings=embeddings, search_mode='vector')
+    # part numbers, vector search, products, guides
+    with self.assertNumQueries(4):
+      results = async_to_sync(service.search_products_batch)(
+          ['W10000001', 'axis 2', 'axis 4', 'axis 2'], limit=2
+      )
+
+    self.assertEqual(embeddings.calls, 1)
+    self.assertEqual([p['part_number'] for p in results[0]], ['W10000001'])
+    self.assertEqual(results[0][0]['similarity_score'], 1.0)
+    self.assertEqual(results[1][0]['part_number'], 'W10000002')
+    self.assertEqual(results[2][0]['part_number'], 'W10000004')
+    self.assertEqual(results[1], results[3])
+
+  def test_lexical_batches_never_embed(self):
+    embeddings = NamedAxisEmbeddings()
+    service = ProductService(embeddings=embeddings, search_mode='lexical')
+    results = async_to_sync(service.search_products_batch)(['W10000001', 'spray arm 3', 'water filter'], limit=2)
+
+    self.assertEqual(embeddings.calls, 0)
+    self.assertEqual([p['part_number'] for p in results[0]], ['W10000001'])
+    self.assertEqual(results[1][0]['part_number'], 'W10000003')
+    self.assertEqual(results[2], [])
+
+  def test_hybrid_batches_embed_only_unconfident_queries(self):
+    embeddings = NamedAxisEmbeddings()
+    service = ProductService(embeddings=embeddings, search_mode='hybrid')
+    results = async_to_sync(service.search_products_batch)(['spray arm three', 'axis 2', 'axis 4'], limit=2)
+
+    # 'spray arm three' is answered by full text, or embedding it would fail
+    self.assertEqual(embeddings.calls, 1)
+    self.assertGreaterEqual(results[0][0]['similarity_score'], settings.SEARCH_LEXICAL_CONFIDENCE)
+    self.assertEqual(results[1][0]['part_number'], 'W10000002')
+    self.assertEqual(results[2][0]['part_number'], 'W10000004')
+
+  @override_settings(SEARCH_BATCH_MAX_QUERIES=2)
+  def test_rejects_oversized_batches(self):
+    response = self.client.post(
+        '/api/products/search/batch/', {'queries': ['a', 'b', 'c']}, content_type='application/json'
+    )
+    self.assertEqual(response.status_code, 400)
+    response = self.client.post('/api/products/search/batch/', {'queries': []}, content_type='application/json')
+    self.assertEqual(response.status_code, 400)
+
+  def test_single_search_validates_limit(self):
+    response = self.client.post(
+        '/api/products/search/', {'query': 'W10000001', 'limit': 10000}, content_type='application/json'
+    )
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.json()[0]['part_number'], 'W10000001')
+    response = self.client.post(
+        '/api/products/search/', {'query': 'W10000001', 'limit': 'all'}, content_type='application/json'
+    )
+    self.assertEqual(response.status_code, 400)
+
+  @override_settings(SEARCH_BATCH_MAX_LIMIT=2)
+  def test_limit_is_clamped(self):
+    response = self.client.post(
+        '/api/products/search/batch/', {'queries': ['W10000001'], 'limit': 10000}, content_type='application/json'
+    )
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.json()['results'][0]['products'][0]['part_number'], 'W10000001')
+    response = self.client.post(
+        '/api/products/search/batch/', {'queries': ['W10000001'], 'limit': 'many'}, content_type='application/json'
+    )
+    self.assertEqual(response.status_code, 400)
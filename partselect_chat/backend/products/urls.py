@@ -1,14 +1,18 @@
 from django.urls import path
 from .views import (
     ProductSearchView, CompatibilityCheckView,
-    ProductDetailView, InstallationGuideView
+    ProductDetailView, InstallationGuideView,
+    PartsForModelView, ProductListView, ProductSearchBatchView
 )
 
 app_name = 'products'
 
 urlpatterns = [
+    path('', ProductListView.as_view(), name='product-list'),
     path('search/', ProductSearchView.as_view(), name='product-search'),
+    path('search/batch/', ProductSearchBatchView.as_view(), name='product-search-batch'),
     path('compatibility/', CompatibilityCheckView.as_view(), name='compatibility-check'),
+    path('by-model/<str:model_number>/', PartsForModelView.as_view(), name='parts-for-model'),
     path('<str:part_number>/', ProductDetailView.as_view(), name='product-detail'),
     path('<str:part_number>/installation-guide/', InstallationGuideView.as_view(), name='installation-guide'),
 ]
@@ -1,140 +1,253 @@
-from rest_framework import views, generics, status
-from rest_framework.response import Response
-from django.shortcuts import get_object_or_404
-from asgiref.sync import sync_to_async, async_to_sync
+import json
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.views import View
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
+from utils.http import (
+    APIJSONEncoder, parse_json_body, json_response, error_response, conditional_json_response
+)
+from utils.pagination import encode_cursor, decode_cursor, parse_limit
 from .models import Product, InstallationGuide
+from .normalization import normalize_identifier
 from .serializers import (
     ProductSerializer, InstallationGuideSerializer,
     ProductSearchResultSerializer
 )
-from .services.product_service import ProductService
+from .services.product_service import LIST_FIELDS, get_product_service
+
+logger = logging.getLogger(__name__)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class ProductSearchView(views.APIView):
-  product_service = None
+class ProductSearchView(View):
+  @property
+  def product_service(self):
+    return get_product_service()
 
-  def __init__(self, *args, **kwargs):
-    super().__init__(*args, **kwargs)
-    self.product_service = ProductService()
+  async def post(self, request, *args, **kwargs):
+    try:
+      data = parse_json_body(request)
+    except ValueError as e:
+      return error_response(str(e), 400)
 
-  def post(self, request, *args, **kwargs):
-    query = request.data.get('query')
-    limit = request.data.get('limit', 5)
-    appliance_type = request.data.get('appliance_type')
+    query = data.get('query')
+    appliance_type = data.get('appliance_type')
 
     if not query:
-      return Response(
-          {'error': 'Query is required'},
-          status=status.HTTP_400_BAD_REQUEST
-      )
+      return error_response('Query is required', 400)
+    try:
+      limit = parse_limit(data.get('limit'), default=5, maximum=settings.SEARCH_MAX_LIMIT)
+    except ValueError as e:
+      return error_response(str(e), 400)
 
     try:
-      # Convert async to sync
-      search_products_sync = async_to_sync(self.product_service.search_products)
-      products = search_products_sync(
+      products = await self.product_service.search_products(
           query,
           limit=limit,
           appliance_type=appliance_type
       )
 
       serializer = ProductSearchResultSerializer(products, many=True)
-      return Response(serializer.data)
+      return json_response(serializer.data)
     except Exception as e:
-      return Response(
-          {'error': str(e)},
-          status=status.HTTP_500_INTERNAL_SERVER_ERROR
+      return error_response(str(e), 500)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ProductSearchBatchView(View):
+  """Many searches in one request: {"queries": [...]} to one result list per query"""
+
+  @property
+  def product_service(self):
+    return get_product_service()
+
+  async def post(self, request, *args, **kwargs):
+    try:
+      data = parse_json_body(request)
+    except ValueError as e:
+      return error_response(str(e), 400)
+
+    queries = data.get('queries')
+    appliance_type = data.get('appliance_type')
+
+    if not isinstance(queries, list) or not queries:
+      return error_response('queries must be a non-empty list', 400)
+    if len(queries) > settings.SEARCH_BATCH_MAX_QUERIES:
+      return error_response(f"At most {settings.SEARCH_BATCH_MAX_QUERIES} queries per batch", 400)
+    if not all(isinstance(query, str) and query.strip() for query in queries):
+      return error_response('Every query must be a non-empty string', 400)
+    try:
+      limit = parse_limit(data.get('limit'), default=5, maximum=settings.SEARCH_BATCH_MAX_LIMIT)
+    except ValueError as e:
+      return error_response(str(e), 400)
+
+    try:
+      results = await self.product_service.search_products_batch(
+          queries,
+          limit=limit,
+          appliance_type=appliance_type
       )
+      return json_response({
+          'results': [
+              {'query': query, 'products': ProductSearchResultSerializer(products, many=True).data}
+              for query, products in zip(queries, results)
+          ]
+      })
+    except Exception as e:
+      return error_response(str(e), 500)
+
 
+class ProductDetailView(View):
+  async def get(self, request, part_number, *args, **kwargs):
+    product = await Product.objects.filter(part_number=normalize_identifier(part_number)).afirst()
+    if not product:
+      return json_response({'detail': 'Not found.'}, status=404)
 
-class ProductDetailView(generics.RetrieveAPIView):
-  queryset = Product.objects.all()
-  serializer_class = ProductSerializer
-  lookup_field = 'part_number'
+    return conditional_json_response(request, [product], lambda: ProductSerializer(product).data)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class CompatibilityCheckView(views.APIView):
-  product_service = None
+class CompatibilityCheckView(View):
+  @property
+  def product_service(self):
+    return get_product_service()
 
-  def __init__(self, *args, **kwargs):
-    super().__init__(*args, **kwargs)
-    self.product_service = ProductService()
+  async def post(self, request, *args, **kwargs):
+    try:
+      data = parse_json_body(request)
+    except ValueError as e:
+      return error_response(str(e), 400)
 
-  def post(self, request, *args, **kwargs):
-    part_number = request.data.get('part_number')
-    model_number = request.data.get('model_number')
+    part_number = data.get('part_number')
+    model_number = data.get('model_number')
 
     if not part_number or not model_number:
-      return Response(
-          {'error': 'Both part_number and model_number are required'},
-          status=status.HTTP_400_BAD_REQUEST
-      )
+      return error_response('Both part_number and model_number are required', 400)
 
     try:
-      check_compatibility_sync = async_to_sync(self.product_service.check_compatibility)
-      result = check_compatibility_sync(part_number, model_number)
-      return Response(result)
+      result = await self.product_service.check_compatibility(part_number, model_number)
+      return json_response(result)
     except Exception as e:
-      return Response(
-          {'error': str(e)},
-          status=status.HTTP_500_INTERNAL_SERVER_ERROR
+      return error_response(str(e), 500)
+
+
+class InstallationGuideView(View):
+  async def get(self, request, part_number, *args, **kwargs):
+    try:
+      # One query for the guide and its product, which the serializer nests
+      guide = await InstallationGuide.objects.select_related('product').filter(
+          product__part_number=normalize_identifier(part_number)
+      ).afirst()
+
+      if not guide:
+        return error_response('No installation guide found for this part', 404)
+
+      # The nested product is part of the body, so its updates change the ETag too
+      return conditional_json_response(
+          request, [guide, guide.product], lambda: InstallationGuideSerializer(guide).data
       )
 
+    except Exception as e:
+      logger.exception("Error in InstallationGuideView")
+      return error_response(str(e), 500)
+
 
-class InstallationGuideView(views.APIView):
-  product_service = None
+class PartsForModelView(View):
+  """Parts that fit a model number, keyset-paginated by product id"""
 
-  def __init__(self, *args, **kwargs):
-    super().__init__(*args, **kwargs)
-    self.product_service = ProductService()
+  @property
+  def product_service(self):
+    return get_product_service()
 
-  def get(self, request, part_number, *args, **kwargs):
+  async def get(self, request, model_number, *args, **kwargs):
     try:
-      print(f"Fetching installation guide for part number: {part_number}")
-      guide_data = async_to_sync(self.product_service.get_installation_guide)(part_number)
-
-      if not guide_data:
-        return Response(
-            {'error': 'No installation guide found for this part'},
-            status=status.HTTP_404_NOT_FOUND
-        )
-
-      # Get the actual InstallationGuide object
-      product = Product.objects.get(part_number=part_number)
-      guide = InstallationGuide.objects.get(product=product)
-
-      serializer = InstallationGuideSerializer(guide)
-      return Response(serializer.data)
-
-    except Product.DoesNotExist:
-      return Response(
-          {'error': 'Product not found'},
-          status=status.HTTP_404_NOT_FOUND
+      cursor = decode_cursor(request.GET.get('cursor'))
+      after = int(cursor[0]) if cursor else None
+      limit = parse_limit(request.GET.get('limit'), default=20, maximum=100)
+    except (ValueError, TypeError, IndexError) as e:
+      return error_response(f"Invalid pagination parameters: {str(e)}", 400)
+
+    try:
+      page = await self.product_service.get_parts_for_model(
+          model_number,
+          appliance_type=request.GET.get('appliance_type'),
+          brand=request.GET.get('brand'),
+          after=after,
+          limit=limit
       )
-    except InstallationGuide.DoesNotExist:
-      return Response(
-          {'error': 'Installation guide not found'},
-          status=status.HTTP_404_NOT_FOUND
+      # An empty page is a 404 only when the model itself is unknown, not
+      # when the filters exclude all of its parts
+      unknown = (
+          not page['results'] and cursor is None
+          and not await self.product_service.is_known_model(model_number)
       )
     except Exception as e:
-      print(f"Error in InstallationGuideView: {str(e)}")
-      return Response(
-          {'error': str(e)},
-          status=status.HTTP_500_INTERNAL_SERVER_ERROR
+      return error_response(str(e), 500)
+
+    if unknown:
+      suggestions = await sync_to_async(self.product_service.identifier_resolver.resolve_models)(
+          [page['model_number']]
       )
+      return json_response({
+          'error': 'No parts found for this model',
+          'suggestions': [model for model, _ in suggestions],
+      }, status=404)
 
+    next_after = page.pop('next_after')
+    page['next_cursor'] = encode_cursor(next_after) if next_after is not None else None
+    return json_response(page)
 
-class ProductListView(generics.ListAPIView):
-  serializer_class = ProductSerializer
 
-  def get_queryset(self):
-    queryset = Product.objects.all()
-    appliance_type = self.request.query_params.get('appliance_type', None)
+async def _ndjson_lines(rows):
+  async for row in rows:
+    yield json.dumps(row, cls=APIJSONEncoder) + '\n'
 
-    if appliance_type:
-      queryset = queryset.filter(appliance_type=appliance_type)
 
-    return queryset
+class ProductListView(View):
+  """The catalog in (appliance_type, id) keyset pages, or as one NDJSON stream.
+
+  ``fields`` picks a comma-separated subset of LIST_FIELDS. With
+  ``format=ndjson`` every product after ``cursor`` is streamed one JSON
+  object per line, read from the database in fixed-size chunks.
+  """
+
+  @property
+  def product_service(self):
+    return get_product_service()
+
+  async def get(self, request, *args, **kwargs):
+    try:
+      cursor = decode_cursor(request.GET.get('cursor'))
+      after = (str(cursor[0]), int(cursor[1])) if cursor else None
+      limit = parse_limit(request.GET.get('limit'), default=100, maximum=1000)
+    except (ValueError, TypeError, IndexError) as e:
+      return error_response(f"Invalid pagination parameters: {str(e)}", 400)
+
+    fields = [f for f in request.GET.get('fields', '').split(',') if f] or list(LIST_FIELDS)
+    unknown = [f for f in fields if f not in LIST_FIELDS]
+    if unknown:
+      return error_response(f"Unknown fields: {', '.join(unknown)}", 400)
+
+    appliance_type = request.GET.get('appliance_type')
+    if request.GET.get('format') == 'ndjson':
+      rows = self.product_service.export_products(
+          fields,
+          appliance_type=appliance_type,
+          after=after,
+          chunk_size=settings.PRODUCT_EXPORT_CHUNK_SIZE
+      )
+      return StreamingHttpResponse(_ndjson_lines(rows), content_type='application/x-ndjson')
+
+    try:
+      page = await self.product_service.list_products(
+          fields, appliance_type=appliance_type, after=after, limit=limit
+      )
+    except Exception as e:
+      return error_response(str(e), 500)
+
+    next_after = page.pop('next_after')
+    page['next_cursor'] = encode_cursor(*next_after) if next_after is not None else None
+    return json_response(page)
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import weakref
+from typing import Dict, Optional
+
+import httpx
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+
+# Sync HTTP clients are thread-safe and shared by the whole process. Async
+# clients own sockets bound to the event loop that opened them, so each loop
+# gets its own pool; under ASGI that is one pool per worker.
+_lock = threading.Lock()
+_sync_http_client: Optional[httpx.Client] = None
+_loop_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]' = weakref.WeakKeyDictionary()
+_no_loop_clients: Dict = {}
+
+
+def _limits() -> httpx.Limits:
+  return httpx.Limits(
+      max_connections=settings.OPENAI_MAX_CONNECTIONS,
+      max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+      keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+  )
+
+
+def _timeout() -> httpx.Timeout:
+  return httpx.Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT)
+
+
+def get_http_client() -> httpx.Client:
+  """Process-wide pooled sync HTTP client for OpenAI calls"""
+  global _sync_http_client
+  if _sync_http_client is None:
+    with _lock:
+      if _sync_http_client is None:
+        _sync_http_client = httpx.Client(limits=_limits(), timeout=_timeout())
+  return _sync_http_client
+
+
+def _clients_for_current_loop() -> Dict:
+  try:
+    loop = asyncio.get_running_loop()
+  except RuntimeError:
+    return _no_loop_clients
+
+  with _lock:
+    clients = _loop_clients.get(loop)
+    if clients is None:
+      clients = {}
+      _loop_clients[loop] = clients
+  return clients
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+  """Pooled async HTTP client for the running event loop"""
+  clients = _clients_for_current_loop()
+  if 'http' not in clients:
+    clients['http'] = httpx.AsyncClient(limits=_limits(), timeout=_timeout())
+  return clients['http']
+
+
+def _api_key() -> str:
+  if settings.OPENAI_API_KEY:
+    return settings.OPENAI_API_KEY
+  if settings.OPENAI_BASE_URL:
+    # Local OpenAI-compatible servers ignore the key, but the client wants one
+    return 'unused'
+  raise ImproperlyConfigured("Set OPENAI_API_KEY, or OPENAI_BASE_URL for a local OpenAI-compatible server")
+
+
+def get_chat_model(model_name: Optional[str] = None, temperature: float = 0.7) -> ChatOpenAI:
+  """Long-lived chat model sharing the pooled HTTP clients"""
+  model_name = model_name or settings.OPENAI_CHAT_MODEL
+  clients = _clients_for_current_loop()
+  key = ('chat', model_name, temperature)
+  if key not in clients:
+    clients[key] = ChatOpenAI(
+        model_name=model_name,
+        temperature=temperature,
+        openai_api_key=_api_key(),
+        openai_api_base=settings.OPENAI_BASE_URL,
+        max_retries=settings.OPENAI_MAX_RETRIES,
+        # Token usage on the final streamed chunk, for prompt token reporting
+        stream_usage=True,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+    )
+  return clients[key]
+
+
+def get_embeddings() -> OpenAIEmbeddings:
+  """Long-lived embeddings client sharing the pooled HTTP clients"""
+  clients = _clients_for_current_loop()
+  if 'embeddings' not in clients:
+    clients['embeddings'] = OpenAIEmbeddings(
+        model=settings.OPENAI_EMBEDDING_MODEL,
+        openai_api_key=_api_key(),
+        openai_api_base=settings.OPENAI_BASE_URL,
+        max_retries=settings.OPENAI_MAX_RETRIES,
+        # Inputs are queries and guide chunks well under the model's context,
+        # so send text instead of tokenizing (and loading tiktoken) client-side
+        check_embedding_ctx_length=False,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+    )
+  return clients['embeddings']
@@ -0,0 +1,69 @@
+import hashlib
+import json
+from decimal import Decimal
+from typing import Any, Callable, Dict, Tuple
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .timing import span
+
+
+class APIJSONEncoder(DjangoJSONEncoder):
+  """Match DRF's rendering so async views return the same payloads"""
+
+  def default(self, o):
+    if isinstance(o, Decimal):
+      return float(o)
+    return super().default(o)
+
+
+def parse_json_body(request) -> Dict:
+  """Decode a JSON object request body, raising ValueError on bad input"""
+  if not request.body:
+    return {}
+  try:
+    data = json.loads(request.body)
+  except json.JSONDecodeError as e:
+    raise ValueError(f"Invalid JSON body: {str(e)}")
+  if not isinstance(data, dict):
+    raise ValueError("Request body must be a JSON object")
+  return data
+
+
+def json_response(data, status: int = 200) -> JsonResponse:
+  with span('serialize'):
+    return JsonResponse(data, status=status, safe=False, encoder=APIJSONEncoder)
+
+
+def error_response(message: str, status: int) -> JsonResponse:
+  return json_response({'error': message}, status=status)
+
+
+def row_validators(*rows: models.Model) -> Tuple[str, int]:
+  """Strong ETag and Last-Modified timestamp for a response built from these rows.
+
+  Every row needs an auto_now ``updated_at``, so any save changes the ETag.
+  """
+  digest = hashlib.blake2b(digest_size=16)
+  for row in rows:
+    digest.update(f"{row._meta.label}:{row.pk}:{row.updated_at.isoformat()};".encode())
+  return f'"{digest.hexdigest()}"', int(max(row.updated_at for row in rows).timestamp())
+
+
+def conditional_json_response(request, rows, build: Callable[[], Any]) -> HttpResponse:
+  """JSON of ``build()``, or a bodiless 304 when the client's copy of ``rows`` is current.
+
+  ``build`` (the serialization) only runs when the body is actually sent.
+  """
+  etag, last_modified = row_validators(*rows)
+  response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+  if response is None:
+    response = json_response(build())
+  response['ETag'] = etag
+  response['Last-Modified'] = http_date(last_modified)
+  if settings.DETAIL_CACHE_CONTROL:
+    response['Cache-Control'] = settings.DETAIL_CACHE_CONTROL
+  return response
@@ -0,0 +1,128 @@
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+import bisect
+import hmac
+import threading
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, Http404
+
+
+# Seconds; spans range from sub-millisecond regex checks to multi-second LLM calls
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+  pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+  if extra:
+    pairs.append(extra)
+  return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+  """Cumulative-bucket histogram in the Prometheus text format.
+
+  Per process: under several workers each one reports its own series, so
+  scrape them individually or aggregate with sum().
+  """
+
+  def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self.buckets = tuple(buckets)
+    self._series: Dict[Tuple[str, ...], List] = {}
+    self._lock = threading.Lock()
+
+  def observe(self, value: float, *labelvalues: str):
+    with self._lock:
+      series = self._series.get(labelvalues)
+      if series is None:
+        # Per-bucket counts, then sum and count
+        series = self._series[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+      index = bisect.bisect_left(self.buckets, value)
+      if index < len(self.buckets):
+        series[0][index] += 1
+      series[1] += value
+      series[2] += 1
+
+  def collect(self) -> Iterable[str]:
+    yield f"# HELP {self.name} {self.documentation}"
+    yield f"# TYPE {self.name} histogram"
+    with self._lock:
+      snapshot = [(labels, list(s[0]), s[1], s[2]) for labels, s in self._series.items()]
+    for labelvalues, counts, total, count in sorted(snapshot):
+      cumulative = 0
+      for bound, bucket_count in zip(self.buckets, counts):
+        cumulative += bucket_count
+        labels = _labels(self.labelnames, labelvalues, 'le="%s"' % bound)
+        yield f"{self.name}_bucket{labels} {cumulative}"
+      labels = _labels(self.labelnames, labelvalues, 'le="+Inf"')
+      yield f"{self.name}_bucket{labels} {count}"
+      labels = _labels(self.labelnames, labelvalues)
+      yield f"{self.name}_sum{labels} {total}"
+      yield f"{self.name}_count{labels} {count}"
+
+
+STAGE_SECONDS = Histogram(
+    'partselect_stage_duration_seconds',
+    'Time spent per request stage (db, embedding, llm, ...)',
+    ['stage'],
+)
+REQUEST_SECONDS = Histogram(
+    'partselect_http_request_duration_seconds',
+    'HTTP request latency by route',
+    ['route', 'method', 'status'],
+)
+
+# Callables returning {metric name: (type, help, [(labels dict, value)])},
+# evaluated at scrape time for values owned by other components
+_collectors: List[Callable[[], Dict]] = []
+
+
+def register_collector(collector: Callable[[], Dict]) -> Callable[[], Dict]:
+  _collectors.append(collector)
+  return collector
+
+
+def register_stats(component: str, stats: Callable[[], Dict]):
+  """Export a component's stats() dict as gauges, e.g. partselect_response_cache_hits"""
+  def collect() -> Dict:
+    return {
+        f'partselect_{component}_{key}': ('gauge', f'{component} {key}', [({}, value)])
+        for key, value in stats().items()
+    }
+  register_collector(collect)
+
+
+def render() -> str:
+  lines = [*STAGE_SECONDS.collect(), *REQUEST_SECONDS.collect()]
+  for collector in _collectors:
+    try:
+      families = collector()
+    except Exception:
+      continue
+    for name, (kind, documentation, samples) in families.items():
+      lines.append(f"# HELP {name} {documentation}")
+      lines.append(f"# TYPE {name} {kind}")
+      for labels, value in samples:
+        lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {value}")
+  return '\n'.join(lines) + '\n'
+
+
+def _may_scrape(request) -> bool:
+  """Caller is on the IP allow-list or presents METRICS_TOKEN"""
+  if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+    return True
+  token = settings.METRICS_TOKEN
+  header = request.headers.get('Authorization', '')
+  return bool(token) and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode())
+
+
+def metrics_view(request):
+  """Prometheus scrape endpoint, for allowed IPs or METRICS_TOKEN holders"""
+  if not settings.METRICS_ENABLED:
+    raise Http404
+  if not _may_scrape(request):
+    return HttpResponseForbidden()
+  return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
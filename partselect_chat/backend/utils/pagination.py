@@ -0,0 +1,32 @@
+import base64
+import json
+from typing import List, Optional
+
+
+def encode_cursor(*values) -> str:
+  """Opaque keyset cursor for the last row of a page"""
+  return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: Optional[str]) -> Optional[List]:
+  """Values encoded by encode_cursor, or None for the first page"""
+  if not token:
+    return None
+  try:
+    padded = token + '=' * (-len(token) % 4)
+    values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+  except (ValueError, TypeError) as e:
+    raise ValueError(f"Invalid cursor: {str(e)}")
+  if not isinstance(values, list):
+    raise ValueError("Invalid cursor")
+  return values
+
+
+def parse_limit(value: Optional[str], default: int, maximum: int) -> int:
+  """Page size from a query parameter, clamped to [1, maximum]"""
+  if value in (None, ''):
+    return default
+  try:
+    return max(1, min(int(value), maximum))
+  except (TypeError, ValueError):
+    raise ValueError("limit must be an integer")
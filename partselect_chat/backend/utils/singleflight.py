@@ -0,0 +1,91 @@
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+from functools import lru_cache
+import asyncio
+import threading
+import weakref
+from .metrics import register_stats
+
+T = TypeVar('T')
+
+
+class _Call:
+  __slots__ = ('task', 'waiters')
+
+  def __init__(self, task: asyncio.Task):
+    self.task = task
+    self.waiters = 0
+
+
+class SingleFlight:
+  """Coalesces concurrent identical async calls into one.
+
+  The first caller for a key starts the work as a task; callers arriving
+  while it runs await the same task and get the same result or exception.
+  Nothing is kept once it finishes, so errors are not cached. A caller
+  that is cancelled (e.g. its client went away) stops waiting without
+  cancelling the others; the work itself is cancelled only when nobody is
+  left waiting for it.
+
+  Calls are shared within one event loop, i.e. per ASGI worker.
+  """
+
+  def __init__(self):
+    self._loops: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]' = weakref.WeakKeyDictionary()
+    self._lock = threading.Lock()
+    self.calls = 0
+    self.coalesced = 0
+
+  def _calls_for_loop(self) -> Dict[Hashable, _Call]:
+    loop = asyncio.get_running_loop()
+    with self._lock:
+      calls = self._loops.get(loop)
+      if calls is None:
+        calls = self._loops[loop] = {}
+      return calls
+
+  async def do(self, key: Hashable, work: Callable[[], Awaitable[T]]) -> T:
+    """Result of ``work()``, shared with concurrent callers using the same key"""
+    calls = self._calls_for_loop()
+    call = calls.get(key)
+    if call is None:
+      call = calls[key] = _Call(asyncio.ensure_future(work()))
+      call.task.add_done_callback(lambda task: self._forget(calls, key, call))
+      self.calls += 1
+    else:
+      self.coalesced += 1
+
+    call.waiters += 1
+    try:
+      # shield: cancelling one waiter must not cancel the shared task
+      return await asyncio.shield(call.task)
+    finally:
+      call.waiters -= 1
+      if not call.waiters and not call.task.done():
+        self._forget(calls, key, call)
+        call.task.cancel()
+
+  @staticmethod
+  def _forget(calls: Dict, key: Hashable, call: _Call):
+    if calls.get(key) is call:
+      del calls[key]
+
+  def in_flight(self) -> int:
+    with self._lock:
+      return sum(len(calls) for calls in self._loops.values())
+
+  def stats(self) -> Dict:
+    requests = self.calls + self.coalesced
+    return {
+        'calls': self.calls,
+        'coalesced': self.coalesced,
+        'coalescing_ratio': self.coalesced / requests if requests else 0.0,
+        'in_flight': self.in_flight(),
+    }
+
+
+@lru_cache(maxsize=None)
+def get_single_flight(name: str) -> SingleFlight:
+  """Shared SingleFlight per name for this worker, exported to /metrics"""
+  flight = SingleFlight()
+  register_stats(f'{name}_single_flight', flight.stats)
+  return flight
@@ -0,0 +1,126 @@
+from typing import Dict, List, Optional, Tuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from .metrics import REQUEST_SECONDS, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# (stage, milliseconds) spans of the current request. Context variables are
+# copied into asyncio tasks and sync_to_async threads, so concurrent stages
+# of one request all append to the same list.
+_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar('timing_spans', default=None)
+
+
+def record(stage: str, seconds: float):
+  """Record a finished stage for metrics, logs and the current request"""
+  STAGE_SECONDS.observe(seconds, stage)
+  spans = _spans.get()
+  if spans is not None:
+    spans.append((stage, seconds * 1000.0))
+  if logger.isEnabledFor(logging.DEBUG):
+    logger.debug("%s took %.1fms", stage, seconds * 1000.0)
+
+
+@contextmanager
+def span(stage: str):
+  """Time a block, which may contain awaits: ``with span('embedding'): ...``"""
+  started = time.perf_counter()
+  try:
+    yield
+  finally:
+    record(stage, time.perf_counter() - started)
+
+
+def _time_query(execute, sql, params, many, context):
+  started = time.perf_counter()
+  try:
+    return execute(sql, params, many, context)
+  finally:
+    record('db', time.perf_counter() - started)
+
+
+def _install_query_timer(connection, **kwargs):
+  if _time_query not in connection.execute_wrappers:
+    connection.execute_wrappers.append(_time_query)
+
+
+def install_query_timer():
+  """Time every query on every database connection, present and future"""
+  connection_created.connect(_install_query_timer, dispatch_uid='utils.timing.query_timer')
+  for connection in connections.all(initialized_only=True):
+    _install_query_timer(connection)
+
+
+def server_timing_header(spans: List[Tuple[str, float]], total_ms: float) -> str:
+  """Spans summed per stage, e.g. ``db;dur=3.2;desc="4 calls", total;dur=812.0``"""
+  totals: Dict[str, List] = {}
+  for stage, ms in spans:
+    entry = totals.setdefault(stage, [0.0, 0])
+    entry[0] += ms
+    entry[1] += 1
+  parts = [
+      f'{stage};dur={ms:.1f}' + (f';desc="{count} calls"' if count > 1 else '')
+      for stage, (ms, count) in totals.items()
+  ]
+  parts.append(f'total;dur={total_ms:.1f}')
+  return ', '.join(parts)
+
+
+class ServerTimingMiddleware:
+  """Collects timing spans per request.
+
+  Adds a Server-Timing header (SERVER_TIMING_ENABLED) and records request
+  latency by route for /metrics. Streaming responses carry the spans
+  recorded before their first byte, i.e. retrieval but not generation.
+  """
+
+  sync_capable = True
+  async_capable = True
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+    if iscoroutinefunction(self.get_response):
+      markcoroutinefunction(self)
+    install_query_timer()
+
+  def __call__(self, request):
+    if iscoroutinefunction(self):
+      return self.__acall__(request)
+    token = _spans.set([])
+    started = time.perf_counter()
+    try:
+      response = self.get_response(request)
+      return self._finish(request, response, started)
+    finally:
+      _spans.reset(token)
+
+  async def __acall__(self, request):
+    token = _spans.set([])
+    started = time.perf_counter()
+    try:
+      response = await self.get_response(request)
+      return self._finish(request, response, started)
+    finally:
+      _spans.reset(token)
+
+  def _finish(self, request, response, started: float):
+    elapsed = time.perf_counter() - started
+    match = getattr(request, 'resolver_match', None)
+    route = match.route if match else 'unmatched'
+    REQUEST_SECONDS.observe(elapsed, route, request.method, str(response.status_code))
+    spans = _spans.get() or []
+    if settings.SERVER_TIMING_ENABLED:
+      response['Server-Timing'] = server_timing_header(spans, elapsed * 1000.0)
+    if logger.isEnabledFor(logging.INFO):
+      logger.info(
+          "%s %s %s %.1fms (%s)",
+          request.method, request.path, response.status_code, elapsed * 1000.0,
+          server_timing_header(spans, elapsed * 1000.0)
+      )
+    return response